@@ -10,7 +10,13 @@ from datetime import datetime
 from urllib.parse import urlparse, parse_qs
 from collections import defaultdict
 
-from room import get_all_rooms, get_room_detail, admin_force_destroy_room, admin_force_kick_player, admin_force_ready
+from room import get_all_rooms, get_room_detail, admin_force_destroy_room, admin_force_kick_player, admin_force_ready, call_in_room_loop
+from connection import get_send_stats
+from relay import room_relay
+from phiraapi import async_fetcher, chart_info_cache
+from external_api_client import get_external_api_client
+from player_index import find_players, player_index
+from room_state import room_state_machine
 
 # 获取当前文件的绝对路径
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -189,6 +195,43 @@ def handle_get_room_detail(room_id, client_socket, client_ip):
         result = get_room_detail(room_id)
     send_json_response(client_socket, result)
 
+def handle_get_stats(client_socket, client_ip):
+    """处理获取服务器运行统计请求"""
+    if not check_rate_limit(client_ip):
+        send_error_response(client_socket, "操作过于频繁，请稍后再试", 429)
+        return
+    
+    # 【修改】这些统计属于事件循环中的对象（TTLCache 的 len() 会清理过期条目），在事件循环中收集
+    result = call_in_room_loop(collect_stats)
+    send_json_response(client_socket, result)
+
+def collect_stats():
+    """收集服务器运行统计，在事件循环中调用"""
+    return {
+        "status": "0",
+        "send": get_send_stats(),
+        "relay": room_relay.get_stats(),
+        "phiraApi": async_fetcher.get_stats(),
+        "chartCache": chart_info_cache.get_stats(),
+        "persistentCache": async_fetcher.store.get_stats() if async_fetcher.store is not None else None,
+        "externalApi": get_external_api_client().get_stats(),
+        "players": player_index.get_stats(),
+        "roomStates": room_state_machine.get_stats()
+    }
+
+def handle_find_player(query, client_socket, client_ip):
+    """处理按名字查找在线玩家请求"""
+    if not check_rate_limit(client_ip):
+        send_error_response(client_socket, "操作过于频繁，请稍后再试", 429)
+        return
+    
+    try:
+        result = find_players(query)
+    except ValueError:
+        send_error_response(client_socket, "请求参数错误", 400)
+        return
+    send_json_response(client_socket, result)
+
 def handle_destroy_room(request_data, client_socket, client_ip, token):
     """处理解散房间请求"""
     if not check_rate_limit(client_ip):
@@ -351,6 +394,10 @@ def handle_request(client_socket):
                     send_error_response(client_socket, "页面不存在", 404)
             elif path == '/api/admin/rooms':
                 handle_get_rooms(client_socket, client_ip)
+            elif path == '/api/admin/stats':
+                handle_get_stats(client_socket, client_ip)
+            elif path == '/api/admin/players':
+                handle_find_player(parsed_url.query, client_socket, client_ip)
             elif path.startswith('/api/admin/room/'):
                 room_id = path.split('/')[-1]
                 handle_get_room_detail(room_id, client_socket, client_ip)
@@ -1,5 +1,8 @@
 import asyncio
 
+# 【新增】单帧最大字节数，stream 和 buffered 两种传输模式共用
+MAX_FRAME_SIZE = 1 << 20
+
 
 async def read_varint(reader: asyncio.StreamReader) -> int:
     result = 0
@@ -16,7 +19,7 @@ async def read_varint(reader: asyncio.StreamReader) -> int:
     return result
 
 
-def write_varint(writer: asyncio.StreamWriter, value: int):
+def encode_varint(value: int) -> bytes:
     result = bytearray()
     while True:
         temp = value & 0x7F
@@ -26,7 +29,11 @@ def write_varint(writer: asyncio.StreamWriter, value: int):
         result.append(temp)
         if value == 0:
             break
-    writer.write(bytes(result))
+    return bytes(result)
+
+
+def write_varint(writer: asyncio.StreamWriter, value: int):
+    writer.write(encode_varint(value))
 
 
 async def write_message(writer: asyncio.StreamWriter, data: bytes):
@@ -35,7 +42,60 @@ async def write_message(writer: asyncio.StreamWriter, data: bytes):
     await writer.drain()
 
 
+async def write_frames(writer: asyncio.StreamWriter, frames: list):
+    """把多个已带长度前缀的帧拼成一个连续缓冲区，只写一次、drain 一次。"""
+    writer.write(frames[0] if len(frames) == 1 else b''.join(frames))
+    await writer.drain()
+
+
 async def receive_message(reader: asyncio.StreamReader) -> bytes:
     length = await read_varint(reader)
     data = await reader.readexactly(length)
-    return data
\ No newline at end of file
+    return data
+
+
+class FrameDecoder:
+    """流式帧解码器：一次 socket 读取可解析出多个完整帧，不完整的剩余字节留到下次。"""
+
+    def __init__(self, max_frame_size: int = MAX_FRAME_SIZE):
+        self.buffer = bytearray()
+        self.max_frame_size = max_frame_size
+
+    def feed(self, data) -> list:
+        """追加新读到的字节，返回本次可解析出的全部完整帧（不含长度前缀）。"""
+        buf = self.buffer
+        buf += data
+        frames = []
+        pos = 0
+        end = len(buf)
+        while pos < end:
+            # 解析 varint 长度前缀，前缀本身不完整时等待更多数据
+            length = 0
+            shift = 0
+            cursor = pos
+            complete = False
+            while cursor < end:
+                value = buf[cursor]
+                cursor += 1
+                length |= (value & 0x7F) << shift
+                if (value & 0x80) == 0:
+                    complete = True
+                    break
+                shift += 7
+                if shift >= 35:
+                    raise ValueError("VarInt too big")
+            if not complete:
+                break
+            if length > self.max_frame_size:
+                raise ValueError(f"Frame too large: {length}")
+            if end - cursor < length:
+                break
+            frames.append(bytes(buf[cursor:cursor + length]))
+            pos = cursor + length
+        if pos:
+            del buf[:pos]
+        return frames
+
+    def pending(self) -> int:
+        """返回缓冲区中尚未组成完整帧的字节数。"""
+        return len(self.buffer)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""对比 PacketHandler 的 isinstance 链式分发与类型表分发的单包开销。
+
+用法: python benchmarks/bench_dispatch.py [次数]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rymc.phira.protocol.handler import PacketHandler  # noqa: E402
+from rymc.phira.protocol.packet.serverbound import *  # noqa: E402,F401,F403
+
+PACKET_TYPES = list(PacketHandler._packet_handler_names.items())
+
+
+class NullHandler(PacketHandler):
+    """所有处理方法都是空操作，只测量分发本身。"""
+
+
+for _packet_cls, _name in PACKET_TYPES:
+    setattr(NullHandler, _name, lambda self, packet: None)
+
+
+def legacy_handle(handler, packet):
+    # 旧版 PacketHandler.handle 的 isinstance 链
+    if isinstance(packet, ServerBoundPingPacket):
+        return handler.handlePing(packet)
+    if isinstance(packet, ServerBoundAuthenticatePacket):
+        return handler.handleAuthenticate(packet)
+    if isinstance(packet, ServerBoundChatPacket):
+        return handler.handleChat(packet)
+    if isinstance(packet, ServerBoundTouchesPacket):
+        return handler.handleTouches(packet)
+    if isinstance(packet, ServerBoundJudgesPacket):
+        return handler.handleJudges(packet)
+    if isinstance(packet, ServerBoundCreateRoomPacket):
+        return handler.handleCreateRoom(packet)
+    if isinstance(packet, ServerBoundJoinRoomPacket):
+        return handler.handleJoinRoom(packet)
+    if isinstance(packet, ServerBoundLeaveRoomPacket):
+        return handler.handleLeaveRoom(packet)
+    if isinstance(packet, ServerBoundLockRoomPacket):
+        return handler.handleLockRoom(packet)
+    if isinstance(packet, ServerBoundCycleRoomPacket):
+        return handler.handleCycleRoom(packet)
+    if isinstance(packet, ServerBoundSelectChartPacket):
+        return handler.handleSelectChart(packet)
+    if isinstance(packet, ServerBoundRequestStartPacket):
+        return handler.handleRequestStart(packet)
+    if isinstance(packet, ServerBoundReadyPacket):
+        return handler.handleReady(packet)
+    if isinstance(packet, ServerBoundCancelReadyPacket):
+        return handler.handleCancelReady(packet)
+    if isinstance(packet, ServerBoundPlayedPacket):
+        return handler.handlePlayed(packet)
+    if isinstance(packet, ServerBoundAbortPacket):
+        return handler.handleAbort(packet)
+    return None
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    handler = NullHandler()
+    print(f"{'packet':<32}{'isinstance chain':>18}{'dispatch table':>16}{'packet.handle':>16}")
+    for packet_cls, _name in PACKET_TYPES:
+        packet = packet_cls()
+        legacy = min(timeit.repeat(lambda: legacy_handle(handler, packet), number=number, repeat=3))
+        table = min(timeit.repeat(lambda: handler.handle(packet), number=number, repeat=3))
+        double = min(timeit.repeat(lambda: packet.handle(handler), number=number, repeat=3))
+        print(f"{packet_cls.__name__:<32}"
+              f"{legacy / number * 1e9:>15.0f} ns"
+              f"{table / number * 1e9:>13.0f} ns"
+              f"{double / number * 1e9:>13.0f} ns")
+
+
+if __name__ == '__main__':
+    main()
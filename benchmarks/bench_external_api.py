@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""对比 /api/rooms 每次同步请求外部房间 API 与读取后台刷新缓存的耗时，并观察失败地址的退避
+以及条件请求（ETag/304）与 gzip 省下的流量和转换耗时。
+
+桩服务器提供两个正常地址（延迟 DELAY 秒，支持 ETag 和 gzip，内容不变）和一个总是返回 500 的地址。
+
+用法: python benchmarks/bench_external_api.py [请求数]
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_phira_api import StubServer  # noqa: E402
+from external_api_client import ExternalApiClient  # noqa: E402
+
+DELAY = 0.2
+ROOMS = 50
+
+
+def make_payload(name):
+    return json.dumps({
+        "serverName": name,
+        "rooms": [
+            {"id": str(i), "name": str(i), "playerCount": 2, "maxPlayers": 8,
+             "state": {"type": "SelectChart", "chartId": None}, "locked": False, "cycle": False,
+             "players": [{"id": i * 10 + j, "name": f"p{i}-{j}"} for j in range(2)]}
+            for i in range(ROOMS)
+        ],
+    }).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1
+    hits = {}
+
+    def do_GET(self):
+        StubHandler.hits[self.path] = StubHandler.hits.get(self.path, 0) + 1
+        time.sleep(DELAY)
+        if self.path == "/broken":
+            self.send_error(500)
+            return
+        body = make_payload(self.path.strip("/"))
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = [f"{base}/a", f"{base}/b", f"{base}/broken"]
+
+    client = ExternalApiClient()
+    start = time.perf_counter()
+    for _ in range(requests):
+        for url in urls:
+            client.get_rooms_from_api(url)
+    sync_per_request = (time.perf_counter() - start) / requests
+    print(f"sync fetch per /api/rooms request : {sync_per_request * 1000:8.2f} ms")
+
+    client = ExternalApiClient()
+    StubHandler.hits.clear()
+    client.start_refresher(urls, interval=0.5)
+    time.sleep(DELAY * 2)  # 等第一次刷新完成
+    start = time.perf_counter()
+    rooms = 0
+    for _ in range(requests):
+        rooms = len(client.get_combined_rooms([], urls))
+    cached_per_request = (time.perf_counter() - start) / requests
+    print(f"cached read per /api/rooms request: {cached_per_request * 1000:8.3f} ms ({rooms} rooms)")
+
+    time.sleep(6)
+    print(f"upstream hits in ~7s with 0.5s interval: {dict(StubHandler.hits)}")
+    stats = client.get_stats()
+    for url, url_stats in sorted(stats.pop("urls").items()):
+        print(f"  {url.rsplit('/', 1)[1]:>6}: {url_stats}")
+    print(f"  {stats}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
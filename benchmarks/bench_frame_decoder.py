@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""对比逐字节 varint 读取（receive_message）与 FrameDecoder 批量解帧的吞吐量。
+
+用法: python benchmarks/bench_frame_decoder.py [帧数]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from asyncioutil import FrameDecoder, receive_message  # noqa: E402
+
+
+def build_stream(count: int) -> bytes:
+    # 模拟 touches/judges 流量：大部分是几十字节的小帧，夹杂少量长帧
+    out = bytearray()
+    for i in range(count):
+        size = 300 if i % 50 == 0 else 24 + (i % 16)
+        payload = bytes([0x03]) + bytes(size - 1)
+        length = len(payload)
+        while True:
+            temp = length & 0x7F
+            length >>= 7
+            if length:
+                out.append(temp | 0x80)
+            else:
+                out.append(temp)
+                break
+        out += payload
+    return bytes(out)
+
+
+def make_reader(data: bytes) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader(limit=len(data) + 1)
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+async def bench_receive_message(data: bytes, count: int) -> float:
+    reader = make_reader(data)
+    start = time.perf_counter()
+    for _ in range(count):
+        await receive_message(reader)
+    return time.perf_counter() - start
+
+
+async def bench_frame_decoder(data: bytes, count: int, chunk_size: int = 64 * 1024) -> float:
+    reader = make_reader(data)
+    decoder = FrameDecoder()
+    received = 0
+    start = time.perf_counter()
+    while True:
+        chunk = await reader.read(chunk_size)
+        if not chunk:
+            break
+        received += len(decoder.feed(chunk))
+    elapsed = time.perf_counter() - start
+    assert received == count, (received, count)
+    return elapsed
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    data = build_stream(count)
+    print(f"frames: {count}, bytes: {len(data)}")
+    legacy = await bench_receive_message(data, count)
+    batched = await bench_frame_decoder(data, count)
+    print(f"receive_message : {count / legacy:>12,.0f} frames/s")
+    print(f"FrameDecoder    : {count / batched:>12,.0f} frames/s")
+    print(f"speedup         : {legacy / batched:.2f}x")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
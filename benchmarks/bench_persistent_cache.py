@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""模拟服务器重启后玩家集中重连：对比有无持久化缓存时发往 Phira API 的 /me 请求数。
+
+复用 bench_phira_api.py 中的本地桩服务器。
+
+用法: python benchmarks/bench_persistent_cache.py [玩家数]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_phira_api import StubHandler, StubServer  # noqa: E402
+from persistent_cache import PersistentCache  # noqa: E402
+from phiraapi import AsyncPhiraFetcher  # noqa: E402
+
+
+async def reconnect_storm(host, players, store):
+    """一次“启动”：新建客户端（内存缓存为空），所有玩家各鉴权一次。"""
+    fetcher = AsyncPhiraFetcher(host=host, max_connections=16, store=store)
+    start = time.perf_counter()
+    users = await asyncio.gather(*(fetcher.get_user_info(f"token-{i}") for i in range(players)))
+    elapsed = time.perf_counter() - start
+    assert all(user.id == 42 for user in users)
+    fetcher.close()
+    return fetcher.requests, elapsed
+
+
+def main():
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    print(f"{players} players reconnecting after each restart")
+    for label, path in (("no persistent cache", None), ("sqlite persistent cache", "cache.sqlite3")):
+        with tempfile.TemporaryDirectory() as directory:
+            for boot in range(1, 3):
+                store = PersistentCache(os.path.join(directory, path)) if path else None
+                requests, elapsed = asyncio.run(reconnect_storm(host, players, store))
+                print(f"  {label:<24} boot {boot}: {requests:4d} upstream /me calls, {elapsed:6.3f} s")
+                if store is not None:
+                    store.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
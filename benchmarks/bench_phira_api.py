@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""用本地桩服务器测试 AsyncPhiraFetcher：并发请求期间事件循环是否保持响应、
+keep-alive 连接是否被复用，并与在事件循环里直接用 urllib 同步请求对比；ChartInfoCache
+的命中、single-flight 合并和不存在谱面的缓存；以及 API 失败时抛出 PhiraAPIError
+而不是返回模拟数据。
+
+桩服务器对每个请求延迟 DELAY 秒后返回 JSON，模拟较慢的 Phira API。
+
+用法: python benchmarks/bench_phira_api.py [请求数] [并发上限]
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phiraapi import AsyncPhiraFetcher, ChartInfoCache, ChartNotFoundError, HTTPStatusError, PhiraAPIError  # noqa: E402
+
+DELAY = 0.05
+# 大于等于该 ID 的谱面返回 404
+MISSING_CHART_ID = 100000
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体一起写出，避免 Nagle 与延迟 ACK 叠加带来的额外等待
+    wbufsize = -1
+
+    def do_GET(self):
+        time.sleep(DELAY)
+        if self.path == "/me" and self.headers.get("Authorization") == "Bearer invalid":
+            self.send_error(401)
+            return
+        elif self.path == "/me":
+            data = {"id": 42, "name": "stub", "language": "zh-CN"}
+        elif self.path.startswith("/chart/") and int(self.path.rsplit("/", 1)[1]) >= MISSING_CHART_ID:
+            self.send_error(404)
+            return
+        elif self.path.startswith("/chart/"):
+            data = {"id": int(self.path.rsplit("/", 1)[1]), "name": "Stub Chart"}
+        elif self.path.startswith("/record/"):
+            data = {"score": 987654, "accuracy": 0.99, "full_combo": False}
+        else:
+            self.send_error(404)
+            return
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    # 默认 backlog 只有 5，并发建立连接时会丢 SYN 导致 1 秒重传
+    request_queue_size = 128
+    daemon_threads = True
+
+
+async def measure_loop_lag(stop: asyncio.Event):
+    """每 5ms 醒来一次，记录最大延迟，用于判断事件循环是否被阻塞。"""
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(0.005)
+        worst = max(worst, loop.time() - start - 0.005)
+    return worst
+
+
+async def run_async(host, count, limit):
+    fetcher = AsyncPhiraFetcher(host=host, max_connections=limit)
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    start = time.perf_counter()
+    charts = await asyncio.gather(*(fetcher.get_chart_info(i) for i in range(count)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    lag = await lag_task
+    assert [chart.id for chart in charts] == list(range(count))
+    assert (await fetcher.get_user_info("token")).id == 42
+    assert (await fetcher.get_record_result(1)).score == 987654
+    stats = fetcher.get_stats()
+    fetcher.close()
+    return elapsed, lag, stats
+
+
+async def run_sync_on_loop(host, count):
+    # 旧做法：在事件循环里直接用 urllib 同步请求
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    for i in range(count):
+        with urllib.request.urlopen(f"{host}chart/{i}", timeout=10) as response:
+            json.loads(response.read())
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return elapsed, await lag_task
+
+
+async def run_chart_cache(host):
+    fetcher = AsyncPhiraFetcher(host=host)
+    cache = ChartInfoCache(fetcher, maxsize=64, ttl=60, negative_ttl=60)
+    start = time.perf_counter()
+    # 10 个房主同时选中同一张谱面：只应发出一个请求
+    charts = await asyncio.gather(*(cache.get(7) for _ in range(10)))
+    assert all(chart is charts[0] for chart in charts)
+    # 房主来回切换几张谱面
+    for chart_id in [1, 2, 3, 1, 2, 3, 7, 1]:
+        await cache.get(chart_id)
+    # 不存在的谱面：第一次请求，之后直接命中缓存
+    for _ in range(3):
+        try:
+            await cache.get(MISSING_CHART_ID)
+        except ChartNotFoundError:
+            pass
+    elapsed = time.perf_counter() - start
+    stats = cache.get_stats()
+    fetcher.close()
+    return elapsed, stats, fetcher.requests
+
+
+async def run_failures(host):
+    """token 无效、谱面请求失败、上游无法连接时都应抛出异常"""
+    fetcher = AsyncPhiraFetcher(host=host)
+    try:
+        await fetcher.get_user_info("invalid")
+        raise AssertionError("invalid token authenticated")
+    except HTTPStatusError as e:
+        assert e.status == 401
+    fetcher.close()
+    # 没有服务监听的端口
+    unreachable = AsyncPhiraFetcher(host="http://127.0.0.1:9/", timeout=2)
+    for request in (unreachable.get_user_info("token"), ChartInfoCache(unreachable).get(1)):
+        try:
+            await request
+            raise AssertionError("request to an unreachable API returned data")
+        except PhiraAPIError:
+            pass
+    return fetcher.errors + unreachable.errors
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    print(f"{count} chart requests, stub delay {DELAY * 1000:.0f} ms")
+    elapsed, lag = asyncio.run(run_sync_on_loop(host, count))
+    print(f"  sync  urllib on loop    : {elapsed:6.3f} s, worst loop lag {lag * 1000:7.1f} ms")
+    elapsed, lag, stats = asyncio.run(run_async(host, count, limit))
+    print(f"  async AsyncPhiraFetcher : {elapsed:6.3f} s, worst loop lag {lag * 1000:7.1f} ms (limit {limit})")
+    print(f"  {stats}")
+    elapsed, stats, requests = asyncio.run(run_chart_cache(host))
+    print(f"chart cache: 21 lookups, {requests} upstream requests, {elapsed:6.3f} s")
+    print(f"  {stats}")
+    errors = asyncio.run(run_failures(host))
+    print(f"failures: invalid token and unreachable API raised errors ({errors} counted), no fallback data")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
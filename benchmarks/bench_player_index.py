@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""对比按名字前缀遍历所有在线玩家与查询 player_index 的耗时（默认 50000 个在线玩家），
+以及玩家上线/下线时维护索引的开销。
+
+用法: python benchmarks/bench_player_index.py [在线玩家数]
+"""
+
+import os
+import random
+import string
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from player_index import PlayerIndex, normalize_name  # noqa: E402
+
+
+def legacy_find(online, prefix, limit):
+    # 旧做法：遍历所有在线玩家逐个比较名字
+    key = normalize_name(prefix)
+    matches = [(user_id, name) for user_id, name in online.items() if normalize_name(name).startswith(key)]
+    matches.sort(key=lambda item: (normalize_name(item[1]), item[0]))
+    return matches[:limit]
+
+
+def main():
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rng = random.Random(1)
+    online = {}
+    for user_id in range(user_count):
+        length = rng.randint(4, 12)
+        online[user_id] = "".join(rng.choice(string.ascii_letters + string.digits) for _ in range(length))
+
+    index = PlayerIndex()
+    start = time.perf_counter()
+    for user_id, name in online.items():
+        index.add(user_id, name)
+    build = time.perf_counter() - start
+    print(f"{user_count} online players, index built in {build * 1e3:.1f} ms "
+          f"({build / user_count * 1e6:.2f} us per login)")
+
+    for prefix in ("a", "ab", "abc", "Xy9", "zzzzzz"):
+        expected = legacy_find(online, prefix, 20)
+        players, _ = index.search(prefix, 20)
+        assert [(p["id"], p["name"]) for p in players] == expected
+        number = 20
+        legacy = timeit.timeit(lambda: legacy_find(online, prefix, 20), number=number) / number
+        indexed = timeit.timeit(lambda: index.search(prefix, 20), number=number * 50) / (number * 50)
+        print(f"  prefix {prefix!r:<9} scan {legacy * 1e3:8.2f} ms   index {indexed * 1e6:8.2f} us   x{legacy / indexed:,.0f}")
+
+    # 上线/下线的维护开销
+    number = 2000
+    ids = rng.sample(range(user_count), number)
+    start = time.perf_counter()
+    for user_id in ids:
+        index.remove(user_id)
+    for user_id in ids:
+        index.add(user_id, online[user_id])
+    churn = time.perf_counter() - start
+    print(f"  logout + login: {churn / number * 1e6:.2f} us per player")
+
+
+if __name__ == "__main__":
+    main()
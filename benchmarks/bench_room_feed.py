@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""对比 200 个面板每秒轮询 /api/rooms 与订阅 /api/rooms/events 时 web 服务器的 CPU 和发送字节数。
+
+服务器在子进程中运行（只统计它自己的 CPU 时间），预先创建 ROOMS 个房间，每秒随机做
+CHURN 次变更（切换状态、加入/离开玩家）。
+
+用法: python benchmarks/bench_room_feed.py [面板数] [秒数]
+"""
+
+import asyncio
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 18181
+ROOMS = 100
+USERS_PER_ROOM = 4
+CHURN = 10
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+
+
+async def run_server(duration):
+    import room
+    import web
+    from rymc.phira.protocol.data.state import SelectChart, WaitForReady, Playing
+
+    for i in range(ROOMS):
+        host = FakeUser(i * 100)
+        room.create_room(f"room{i}", host)
+        for j in range(USERS_PER_ROOM):
+            room.add_user(f"room{i}", FakeUser(i * 100 + j), None)
+
+    server = await web.start_web_server(port=PORT)
+    print("ready", flush=True)
+    # 等父进程连上所有面板
+    await asyncio.get_running_loop().run_in_executor(None, sys.stdin.readline)
+    states = [SelectChart(None), WaitForReady(), Playing()]
+    next_user = 1000000
+    cpu_start = time.process_time()
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        room_id = f"room{random.randrange(ROOMS)}"
+        r = room.rooms[room_id]
+        action = random.random()
+        if action < 0.5:
+            room.set_state(room_id, random.choice(states))
+        elif action < 0.75 or len(r.users) <= 1:
+            room.add_user(room_id, FakeUser(next_user), None)
+            next_user += 1
+        else:
+            room.player_leave(room_id, next(reversed(r.users)))
+        await asyncio.sleep(1 / CHURN)
+    cpu = time.process_time() - cpu_start
+    print(f"cpu {cpu:.3f} feed_bytes {web.room_feed.bytes_sent}", flush=True)
+    server.close()
+
+
+async def poll_client(stop, counter):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    request = b"GET /api/rooms HTTP/1.1\r\nHost: bench\r\n\r\n"
+    # 错开各面板的轮询时刻
+    await asyncio.sleep(random.random())
+    while not stop.is_set():
+        writer.write(request)
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+        await reader.readexactly(length)
+        counter[0] += len(head) + length
+        await asyncio.sleep(1)
+    writer.close()
+
+
+async def feed_client(stop, counter):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    writer.write(b"GET /api/rooms/events HTTP/1.1\r\nHost: bench\r\n\r\n")
+    while not stop.is_set():
+        try:
+            data = await asyncio.wait_for(reader.read(65536), 0.2)
+        except asyncio.TimeoutError:
+            continue
+        if not data:
+            break
+        counter[0] += len(data)
+    writer.close()
+
+
+async def run_mode(mode, dashboards, duration):
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, __file__, "--server", str(duration),
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    assert (await proc.stdout.readline()).strip() == b"ready"
+    stop = asyncio.Event()
+    counter = [0]
+    client = poll_client if mode == "poll" else feed_client
+    tasks = [asyncio.create_task(client(stop, counter)) for _ in range(dashboards)]
+    await asyncio.sleep(0.5)
+    proc.stdin.write(b"go\n")
+    await proc.stdin.drain()
+    line = (await proc.stdout.readline()).decode().split()
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await proc.wait()
+    cpu = float(line[1])
+    print(f"{mode:>5}: server CPU {cpu:6.2f} s ({cpu / duration * 100:5.1f}%), "
+          f"received {counter[0] / 1024:10.1f} KB ({counter[0] / duration / 1024:8.1f} KB/s)")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--server":
+        logging.disable(logging.CRITICAL)
+        asyncio.run(run_server(float(sys.argv[2])))
+        return
+    dashboards = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f"{dashboards} dashboards, {ROOMS} rooms, {CHURN} changes/s, {duration:.0f} s")
+    asyncio.run(run_mode("poll", dashboards, duration))
+    asyncio.run(run_mode("feed", dashboards, duration))
+
+
+if __name__ == '__main__':
+    main()
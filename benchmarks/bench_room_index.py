@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""对比 get_roomId 遍历所有房间与查 user_room_index 的开销（默认 10000 个房间）。
+
+用法: python benchmarks/bench_room_index.py [房间数]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import room  # noqa: E402
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+
+
+def legacy_get_roomId(user_id):
+    # 旧版 get_roomId：遍历所有房间
+    for r_id, r in room.rooms.items():
+        if user_id in r.users:
+            return {"roomId": r_id}
+    return {"status": "1"}
+
+
+def main():
+    room_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    users_per_room = 4
+    for i in range(room_count):
+        room_id = f"room{i}"
+        host = FakeUser(i * users_per_room)
+        room.create_room(room_id, host)
+        room.add_user(room_id, host, None)
+        for j in range(1, users_per_room):
+            room.add_user(room_id, FakeUser(i * users_per_room + j), None)
+    assert room.check_user_room_index()["status"] == "0"
+
+    # 查询分布在前、中、后以及不存在的用户
+    total = room_count * users_per_room
+    probes = [0, total // 2, total - 1, total + 1]
+    number = max(1, 200000 // room_count)
+
+    print(f"{room_count} rooms, {total} users, {number} lookups per probe")
+    for user_id in probes:
+        legacy = timeit.timeit(lambda: legacy_get_roomId(user_id), number=number) / number
+        indexed = timeit.timeit(lambda: room.get_roomId(user_id), number=number) / number
+        assert legacy_get_roomId(user_id) == room.get_roomId(user_id)
+        print(f"  user {user_id:>8}: scan {legacy * 1e6:10.2f} us   index {indexed * 1e6:8.3f} us   x{legacy / indexed:,.0f}")
+
+    # 销毁一半房间、移除一部分用户后索引仍应一致
+    for i in range(0, room_count, 2):
+        room.destroy_room(f"room{i}")
+    for i in range(1, room_count, 4):
+        room.remove_user_from_all_rooms(i * users_per_room + 1)
+    result = room.check_user_room_index()
+    print("index consistent after churn:", result["status"] == "0")
+
+
+if __name__ == "__main__":
+    main()
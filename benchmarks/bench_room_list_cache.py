@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""/api/rooms 每秒请求数：旧版（每次重建房间字典、json.dumps 两次）、缓存的响应体、
+带 If-None-Match 的 304（默认 1000 个房间）。
+
+服务器在子进程中运行，客户端使用 CONNECTIONS 个 keep-alive 连接。
+
+用法: python benchmarks/bench_room_list_cache.py [房间数] [每种模式秒数]
+"""
+
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 18182
+CONNECTIONS = 16
+USERS_PER_ROOM = 4
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+
+
+async def run_server(mode, room_count):
+    import room
+    import web
+
+    for i in range(room_count):
+        host = FakeUser(i * USERS_PER_ROOM)
+        room.create_room(f"room{i}", host)
+        for j in range(USERS_PER_ROOM):
+            room.add_user(f"room{i}", FakeUser(i * USERS_PER_ROOM + j), None)
+
+    if mode == "legacy":
+        def legacy_rooms_response(headers):
+            # 旧版：遍历 rooms 重建字典，Content-Length 和响应体各 json.dumps 一次
+            result = {"status": "0", "rooms": [room.room_summary(r_id, r) for r_id, r in room.rooms.items()]}
+            len(json.dumps(result))
+            return 200, 'application/json', json.dumps(result).encode('utf-8'), None
+        web.rooms_response = legacy_rooms_response
+
+    server = await web.start_web_server(port=PORT)
+    print("ready", flush=True)
+    await asyncio.get_running_loop().run_in_executor(None, sys.stdin.readline)
+    server.close()
+
+
+async def client(stop, counter, conditional):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    etag = None
+    while not stop.is_set():
+        request = "GET /api/rooms HTTP/1.1\r\nHost: bench\r\n"
+        if conditional and etag:
+            request += f"If-None-Match: {etag}\r\n"
+        writer.write((request + "\r\n").encode())
+        head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+        length = 0
+        for line in head.split("\r\n")[1:]:
+            name, _, value = line.partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+            elif name.lower() == "etag":
+                etag = value.strip()
+        if length:
+            await reader.readexactly(length)
+        counter[0] += 1
+        counter[1] += len(head) + length
+    writer.close()
+
+
+async def run_mode(mode, room_count, duration):
+    server_mode = "legacy" if mode == "legacy" else "cached"
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, __file__, "--server", server_mode, str(room_count),
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    assert (await proc.stdout.readline()).strip() == b"ready"
+    stop = asyncio.Event()
+    counter = [0, 0]
+    tasks = [asyncio.create_task(client(stop, counter, mode == "304")) for _ in range(CONNECTIONS)]
+    start = time.perf_counter()
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    proc.stdin.write(b"stop\n")
+    await proc.stdin.drain()
+    await proc.wait()
+    print(f"  {mode:>6}: {counter[0] / elapsed:9.0f} req/s   {counter[1] / counter[0] / 1024:8.1f} KB/response")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--server":
+        logging.disable(logging.CRITICAL)
+        asyncio.run(run_server(sys.argv[2], int(sys.argv[3])))
+        return
+    room_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+    print(f"{room_count} rooms, {CONNECTIONS} keep-alive connections, {duration:.0f} s per mode")
+    for mode in ("legacy", "cached", "304"):
+        asyncio.run(run_mode(mode, room_count, duration))
+
+
+if __name__ == '__main__':
+    main()
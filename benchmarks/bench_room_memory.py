@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""对比旧版 Room/RoomUser（普通类，ready/finished 为 {user_id: True}）与当前实现的内存占用，
+报告每个房间、每个用户的字节数（默认 10000 个房间，每个房间 4 人，全部准备并完成）。
+
+用法: python benchmarks/bench_room_memory.py [房间数] [每个房间人数]
+"""
+
+import gc
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import room  # noqa: E402
+from rymc.phira.protocol.data.state import SelectChart  # noqa: E402
+
+
+class LegacyRoomUser:
+    def __init__(self, user_info, connection):
+        self.info = user_info
+        self.connection = connection
+
+
+class LegacyRoom:
+    def __init__(self, roomId):
+        self.id = roomId
+        self.host = None
+        self.state = SelectChart(None)
+        self.live = False
+        self.locked = False
+        self.cycle = False
+        self.users = {}
+        self.monitors = []
+        self.chart = None
+        self.ready = {}
+        self.finished = {}
+
+
+def legacy_fill(r, user_ids):
+    for user_id in user_ids:
+        r.users[user_id] = LegacyRoomUser(None, None)
+        r.ready[user_id] = True
+        r.finished[user_id] = True
+
+
+def current_fill(r, user_ids):
+    for user_id in user_ids:
+        r.users[user_id] = room.RoomUser(None, None)
+        r.ready.add(user_id)
+        r.finished.add(user_id)
+
+
+def measure(room_class, fill, room_count, users_per_room):
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    all_rooms = [room_class(f"room{i}") for i in range(room_count)]
+    empty = tracemalloc.get_traced_memory()[0] - base
+    for i, r in enumerate(all_rooms):
+        fill(r, range(i * users_per_room, (i + 1) * users_per_room))
+    full = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del all_rooms
+    return empty / room_count, (full - empty) / (room_count * users_per_room)
+
+
+def legacy_check_ready(r):
+    all_users = list(r.users.keys())
+    ready_users = list(r.ready.keys())
+    return len(all_users) == len(ready_users) and len(all_users) > 0
+
+
+def legacy_next_host(r):
+    key_list = list(r.users.keys())
+    try:
+        return key_list[(key_list.index(r.host) + 1) % len(key_list)]
+    except ValueError:
+        return key_list[0]
+
+
+def main():
+    room_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    users_per_room = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    print(f"{room_count} rooms x {users_per_room} users, all ready and finished")
+    results = {}
+    for name, room_class, fill in (("legacy", LegacyRoom, legacy_fill), ("slots", room.Room, current_fill)):
+        per_room, per_user = measure(room_class, fill, room_count, users_per_room)
+        results[name] = (per_room, per_user)
+        print(f"  {name:>6}: {per_room:7.0f} bytes/room   {per_user:6.0f} bytes/user")
+    legacy, current = results["legacy"], results["slots"]
+    total_legacy = legacy[0] + legacy[1] * users_per_room
+    total_current = current[0] + current[1] * users_per_room
+    print(f"  room with {users_per_room} users: {total_legacy:.0f} -> {total_current:.0f} bytes "
+          f"({(1 - total_current / total_legacy) * 100:.0f}% smaller)")
+
+    # 每次准备/完成事件的判断，以及循环模式换房主
+    legacy_room, current_room = LegacyRoom("a"), room.Room("a")
+    legacy_fill(legacy_room, range(8))
+    current_fill(current_room, range(8))
+    legacy_room.host = current_room.host = 5
+    number = 200000
+    for label, legacy_func, current_func in (
+            ("all ready check", lambda: legacy_check_ready(legacy_room), current_room.all_ready),
+            ("next host (8 users)", lambda: legacy_next_host(legacy_room), current_room.next_host)):
+        assert legacy_func() == current_func()
+        t_legacy = timeit.timeit(legacy_func, number=number) / number
+        t_current = timeit.timeit(current_func, number=number) / number
+        print(f"  {label:<20} {t_legacy * 1e9:6.0f} ns -> {t_current * 1e9:6.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
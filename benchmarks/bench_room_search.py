@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""对比旧版 /api/rooms/search（重建所有房间再逐条过滤）与 room_search_index 查询的耗时
+（默认 10000 个房间）。
+
+用法: python benchmarks/bench_room_search.py [房间数]
+"""
+
+import logging
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import room  # noqa: E402
+import web  # noqa: E402
+from rymc.phira.protocol.data.state import Playing, WaitForReady  # noqa: E402
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+
+
+def legacy_search_rooms(search_params):
+    # 旧版 search_rooms：重建所有房间的字典，然后逐个条件过滤
+    filtered_rooms = [room.room_summary(r_id, r) for r_id, r in room.rooms.items()]
+    if 'roomId' in search_params and search_params['roomId']:
+        filtered_rooms = [r for r in filtered_rooms if search_params['roomId'] in r['roomId']]
+    if 'state' in search_params and search_params['state']:
+        filtered_rooms = [r for r in filtered_rooms if r['state'] == search_params['state']]
+    if 'locked' in search_params:
+        filtered_rooms = [r for r in filtered_rooms if r['locked'] == search_params['locked']]
+    if 'live' in search_params:
+        filtered_rooms = [r for r in filtered_rooms if r['live'] == search_params['live']]
+    if 'minUsers' in search_params:
+        filtered_rooms = [r for r in filtered_rooms if r['userCount'] >= search_params['minUsers']]
+    if 'maxUsers' in search_params:
+        filtered_rooms = [r for r in filtered_rooms if r['userCount'] <= search_params['maxUsers']]
+    return {"status": "0", "rooms": filtered_rooms}
+
+
+QUERIES = [
+    ("roomId '4242'", {"roomId": "4242"}),
+    ("roomId '42'", {"roomId": "42"}),
+    ("state Playing", {"state": "Playing"}),
+    ("locked", {"locked": True}),
+    ("Playing, 7-8 users", {"state": "Playing", "minUsers": 7, "maxUsers": 8}),
+    ("WaitForReady, unlocked", {"state": "WaitForReady", "locked": False}),
+]
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    room_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rng = random.Random(1)
+    user_id = 0
+    for i in range(room_count):
+        room_id = f"room{i}"
+        room.create_room(room_id, FakeUser(user_id))
+        for _ in range(rng.randint(1, 8)):
+            room.add_user(room_id, FakeUser(user_id), None)
+            user_id += 1
+        roll = rng.random()
+        if roll < 0.05:
+            room.set_state(room_id, Playing())
+        elif roll < 0.15:
+            room.set_state(room_id, WaitForReady())
+        if rng.random() < 0.1:
+            room.set_lock(room_id, True)
+    room.get_room_snapshot()
+
+    print(f"{room_count} rooms, {user_id} users")
+    for name, params in QUERIES:
+        legacy_ids = {r["roomId"] for r in legacy_search_rooms(params)["rooms"]}
+        result = web.search_rooms(dict(params, limit=500))
+        assert result["total"] == len(legacy_ids)
+        assert {r["roomId"] for r in result["rooms"]} <= legacy_ids
+        number = 20
+        legacy = timeit.timeit(lambda: legacy_search_rooms(params), number=number) / number
+        indexed = timeit.timeit(lambda: web.search_rooms(dict(params)), number=number) / number
+        print(f"  {name:<24} {len(legacy_ids):6d} matches   legacy {legacy * 1e3:8.2f} ms   "
+              f"index {indexed * 1e3:7.3f} ms   x{legacy / indexed:,.0f}")
+
+    # 按人数倒序翻页，确认游标分页不重复不遗漏
+    seen = []
+    params = {"state": "Playing", "sort": "userCount", "order": "desc", "limit": 37}
+    while True:
+        result = web.search_rooms(params)
+        seen.extend(r["roomId"] for r in result["rooms"])
+        if not result["nextCursor"]:
+            break
+        params["cursor"] = result["nextCursor"]
+    assert len(seen) == len(set(seen)) == result["total"]
+    print(f"  paged {len(seen)} Playing rooms by userCount desc without gaps or duplicates")
+
+
+if __name__ == "__main__":
+    main()
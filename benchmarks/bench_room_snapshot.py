@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""对比旧版 get_all_rooms（每次遍历 rooms 重建）与读取房间快照的开销，
+并在事件循环修改房间的同时从另一个线程读取，统计读取出错的次数。
+
+用法: python benchmarks/bench_room_snapshot.py [房间数] [秒数]
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import room  # noqa: E402
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+
+
+def legacy_get_all_rooms():
+    # 旧版 get_all_rooms：遍历所有房间和成员重建字典
+    rooms_info = []
+    for room_id, r in room.rooms.items():
+        rooms_info.append(room.room_summary(room_id, r))
+    return {"status": "0", "rooms": rooms_info}
+
+
+def reader(func, stop, stats):
+    while not stop.is_set():
+        try:
+            func()
+            stats[0] += 1
+        except RuntimeError:
+            stats[1] += 1
+
+
+async def churn(duration, room_count):
+    room.attach_room_loop(asyncio.get_running_loop())
+    next_user = 10 ** 7
+    end = time.monotonic() + duration
+    i = 0
+    while time.monotonic() < end:
+        room_id = f"room{i % room_count}"
+        for _ in range(5):
+            room.add_user(room_id, FakeUser(next_user), None)
+            next_user += 1
+        for user_id in list(room.rooms[room_id].users)[-5:]:
+            room.player_leave(room_id, user_id)
+        # 新建并解散一个临时房间，使 rooms 的大小发生变化
+        temp_id = f"temp{i}"
+        room.create_room(temp_id, FakeUser(next_user))
+        room.destroy_room(temp_id)
+        i += 1
+        await asyncio.sleep(0)
+
+
+def concurrent_reads(func, duration, room_count):
+    stop = threading.Event()
+    stats = [0, 0]
+    thread = threading.Thread(target=reader, args=(func, stop, stats))
+    # 缩短 GIL 切换间隔，让读线程更频繁地在修改中途插入
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    thread.start()
+    asyncio.run(churn(duration, room_count))
+    stop.set()
+    thread.join()
+    sys.setswitchinterval(interval)
+    return stats
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    room_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+    users_per_room = 4
+    for i in range(room_count):
+        host = FakeUser(i * users_per_room)
+        room.create_room(f"room{i}", host)
+        for j in range(users_per_room):
+            room.add_user(f"room{i}", FakeUser(i * users_per_room + j), None)
+    assert legacy_get_all_rooms() == room.get_all_rooms()
+
+    number = 200
+    legacy = timeit.timeit(legacy_get_all_rooms, number=number) / number
+    snapshot = timeit.timeit(room.get_all_rooms, number=number) / number
+    current = timeit.timeit(room.get_room_snapshot, number=number * 100) / (number * 100)
+    print(f"{room_count} rooms, {room_count * users_per_room} users")
+    print(f"  get_all_rooms rebuild  {legacy * 1e6:10.1f} us")
+    print(f"  get_all_rooms snapshot {snapshot * 1e6:10.1f} us   (list copy of the snapshot tuple)")
+    print(f"  get_room_snapshot      {current * 1e6:10.3f} us")
+
+    for name, func in (("rebuild", legacy_get_all_rooms), ("snapshot", room.get_all_rooms)):
+        ok, errors = concurrent_reads(func, duration, room_count)
+        print(f"  {name:>8} reads during churn: {ok:8d} ok, {errors:6d} RuntimeError")
+        room.attach_room_loop(None)
+
+
+if __name__ == "__main__":
+    main()
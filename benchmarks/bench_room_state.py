@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""对比旧版状态切换（每次新建状态对象、set_state 后再构造 ClientBoundChangeStatePacket 广播）
+与 room_state_machine（共享状态实例、预编码的状态帧）每次切换的耗时和编码次数
+（默认每个房间 8 人）。
+
+一轮切换为 SelectChart -> WaitForReady -> Playing -> SelectChart。
+
+用法: python benchmarks/bench_room_state.py [每房间人数] [轮数]
+"""
+
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import room  # noqa: E402
+import room_state  # noqa: E402
+from room_state import room_state_machine  # noqa: E402
+from rymc.phira.protocol import PacketRegistry  # noqa: E402
+from rymc.phira.protocol.data.state import Playing, SelectChart, WaitForReady  # noqa: E402
+from rymc.phira.protocol.packet.clientbound import ClientBoundChangeStatePacket  # noqa: E402
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+
+
+class FakeConnection:
+    def __init__(self):
+        self.frames = []
+
+    def send_encoded(self, data):
+        self.frames.append(data)
+        return True
+
+
+encodes = 0
+_encode_to_bytes = PacketRegistry.encode_to_bytes
+
+
+def counting_encode(packet):
+    global encodes
+    encodes += 1
+    return _encode_to_bytes(packet)
+
+
+def legacy_round(room_id, chart_id):
+    # 旧版 main.py：每次切换新建状态对象，广播时再为数据包新建一个
+    room.set_state(room_id, WaitForReady())
+    room.broadcast_to_room(room_id, ClientBoundChangeStatePacket(WaitForReady()))
+    room.set_state(room_id, Playing())
+    room.broadcast_to_room(room_id, ClientBoundChangeStatePacket(Playing()))
+    room.set_chart(room_id, chart_id)
+    room.set_state(room_id, SelectChart(chartId=chart_id))
+    room.broadcast_to_room(room_id, ClientBoundChangeStatePacket(SelectChart(chartId=room.rooms[room_id].chart)))
+
+
+def machine_round(room_id, chart_id):
+    room_state_machine.transition(room_id, WaitForReady)
+    room_state_machine.transition(room_id, Playing)
+    room_state_machine.select_chart(room_id, chart_id)
+
+
+def run(name, round_func, users, rounds):
+    global encodes
+    room_id = f"bench-{name}"
+    connections = [FakeConnection() for _ in range(users)]
+    room.create_room(room_id, FakeUser(0))
+    for i, connection in enumerate(connections):
+        room.add_user(room_id, FakeUser(i), connection)
+    encodes = 0
+    start = time.perf_counter()
+    for i in range(rounds):
+        round_func(room_id, i % 16)
+    elapsed = time.perf_counter() - start
+    transitions = rounds * 3
+    print(f"  {name:>8}: {elapsed / transitions * 1e6:7.2f} us/transition   "
+          f"{encodes / transitions:.3f} encodes/transition")
+    frames = connections[0].frames
+    room.destroy_room(room_id)
+    return frames
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    # 统计编码次数（room_state 的状态帧缓存也经过这里）
+    PacketRegistry.encode_to_bytes = staticmethod(counting_encode)
+    print(f"{users} users per room, {rounds} rounds ({rounds * 3} transitions)")
+    legacy = run("legacy", legacy_round, users, rounds)
+    machine = run("machine", machine_round, users, rounds)
+    # 两种方式发出的字节必须完全相同
+    assert legacy == machine
+    print(f"  state frames encoded by room_state: {room_state.state_cache.encodes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""测试 upstream 容错层：长尾延迟下对冲请求的效果，以及上游故障时熔断器的快速失败。
+
+桩服务器模式：
+- 长尾：大部分请求 10ms 返回，每 TAIL_EVERY 个请求中有一个耗时 TAIL_DELAY；
+- 故障：所有请求 2 秒后返回 503。
+
+用法: python benchmarks/bench_upstream.py [请求数]
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_phira_api import StubServer  # noqa: E402
+import upstream  # noqa: E402
+from phiraapi import AsyncPhiraFetcher, PhiraAPIError  # noqa: E402
+
+TAIL_EVERY = 50
+TAIL_DELAY = 0.5
+OUTAGE_DELAY = 2.0
+
+mode = "tail"
+counter = itertools.count()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1
+
+    def do_GET(self):
+        if mode == "outage":
+            time.sleep(OUTAGE_DELAY)
+            self.send_error(503)
+            return
+        time.sleep(TAIL_DELAY if next(counter) % TAIL_EVERY == TAIL_EVERY - 1 else 0.01)
+        body = json.dumps({"id": int(self.path.rsplit("/", 1)[1]), "name": "Stub Chart"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+
+async def run_tail(host, count, hedging):
+    upstream.endpoints.clear()
+    upstream.HEDGING_ENABLED = hedging
+    fetcher = AsyncPhiraFetcher(host=host, max_connections=16)
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        await fetcher.get_chart_info(i)
+        latencies.append(time.perf_counter() - start)
+    fetcher.close()
+    return latencies, upstream.get_endpoint("chart").to_dict()
+
+
+async def run_outage(host, count):
+    global mode
+    mode = "outage"
+    upstream.endpoints.clear()
+    upstream.HEDGING_ENABLED = False
+    fetcher = AsyncPhiraFetcher(host=host, max_connections=16)
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        try:
+            await fetcher.get_chart_info(i)
+        except PhiraAPIError:
+            pass
+        latencies.append(time.perf_counter() - start)
+    fetcher.close()
+    return latencies, upstream.get_endpoint("chart").to_dict()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    # 故障阶段每个请求都会打印失败警告，这里只关心统计
+    logging.getLogger().setLevel(logging.ERROR)
+
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    print(f"long tail: {count} sequential requests, 1 in {TAIL_EVERY} takes {TAIL_DELAY * 1000:.0f} ms")
+    for hedging in (False, True):
+        latencies, stats = asyncio.run(run_tail(host, count, hedging))
+        print(f"  hedging {'on ' if hedging else 'off'}: p50 {percentile(latencies, 50) * 1000:6.1f} ms  "
+              f"p95 {percentile(latencies, 95) * 1000:6.1f} ms  p99 {percentile(latencies, 99) * 1000:6.1f} ms  "
+              f"total {sum(latencies):6.2f} s  hedged {stats['hedged']} (won {stats['hedgeWins']})")
+
+    outage_count = 20
+    print(f"outage: {outage_count} sequential requests, upstream answers 503 after {OUTAGE_DELAY:.0f} s")
+    latencies, stats = asyncio.run(run_outage(host, outage_count))
+    print(f"  total {sum(latencies):6.2f} s, failures {stats['failures']}, rejected {stats['rejected']}, "
+          f"breaker {stats['breaker']['state']}")
+    print(f"  latency after breaker opened: max {max(latencies[stats['failures']:]) * 1000:.2f} ms")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
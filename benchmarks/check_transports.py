@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""检查 stream 和 buffered 两种传输模式对同一组客户端行为的处理结果一致：
+
+- 版本握手后 ping 收到 pong
+- 多个帧合在一次写入、以及一个帧逐字节分多次写入
+- 超过接收缓冲区的帧（buffered 模式需要扩容）
+- 不支持的协议版本、超过 MAX_FRAME_SIZE 的长度前缀、握手超时：服务器关闭连接
+- 异步处理器未完成时收到的包按顺序排队；超过 MAX_DEFERRED_PACKETS 时服务器关闭连接
+
+任何一项不一致或不符合预期时以状态码 1 退出。
+
+用法: python benchmarks/check_transports.py
+"""
+
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+from asyncioutil import MAX_FRAME_SIZE, encode_varint  # noqa: E402
+from connection import MAX_DEFERRED_PACKETS  # noqa: E402
+
+PORT = 18190
+PING = encode_varint(1) + b"\x00"
+PONG = encode_varint(1) + b"\x00"
+# 接收缓冲区设得很小，让聊天包超过它
+RECV_BUFFER_SIZE = 64
+CHAT_MESSAGE = "x" * 180
+# 收到这条聊天消息时处理器返回一个需要等待 SLOW_HANDLER_DELAY 秒的协程，模拟等待 Phira API
+SLOW_MESSAGE = "slow"
+SLOW_HANDLER_DELAY = 0.5
+
+
+def chat_frame(message):
+    payload = b"\x02" + encode_varint(len(message)) + message.encode("utf-8")
+    return encode_varint(len(payload)) + payload
+
+
+async def read_until_closed(reader, timeout=2):
+    """读到服务器关闭连接，返回 (收到的字节, 是否被关闭)"""
+    data = b""
+    try:
+        while True:
+            chunk = await asyncio.wait_for(reader.read(4096), timeout)
+            if not chunk:
+                return data, True
+            data += chunk
+    except (asyncio.TimeoutError, ConnectionResetError):
+        return data, False
+
+
+async def read_pongs(reader, count, timeout=2):
+    data = await asyncio.wait_for(reader.readexactly(len(PONG) * count), timeout)
+    return data == PONG * count
+
+
+async def scenario_ping(received):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    writer.write(b"\x01" + PING)
+    ok = await read_pongs(reader, 1)
+    writer.close()
+    return ok
+
+
+async def scenario_batched_and_split(received):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    writer.write(b"\x01" + PING * 20)
+    ok = await read_pongs(reader, 20)
+    for byte in chat_frame("split") + PING:
+        writer.write(bytes([byte]))
+        await writer.drain()
+        await asyncio.sleep(0.001)
+    ok = ok and await read_pongs(reader, 1)
+    writer.close()
+    return ok and received[-1:] == ["split"]
+
+
+async def scenario_large_frame(received):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    writer.write(b"\x01" + chat_frame(CHAT_MESSAGE) + PING)
+    ok = await read_pongs(reader, 1)
+    writer.close()
+    return ok and received[-1:] == [CHAT_MESSAGE]
+
+
+async def scenario_bad_version(received):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    writer.write(b"\x07" + PING)
+    data, closed = await read_until_closed(reader)
+    writer.close()
+    return closed and not data
+
+
+async def scenario_oversized_frame(received):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    # 长度前缀刚好超过 MAX_FRAME_SIZE，服务器不应为它分配缓冲区
+    writer.write(b"\x01" + encode_varint(MAX_FRAME_SIZE + 1) + b"\x02")
+    data, closed = await read_until_closed(reader)
+    writer.close()
+    return closed and not data
+
+
+async def scenario_version_timeout(received):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    data, closed = await read_until_closed(reader, timeout=server.VERSION_TIMEOUT + 2)
+    writer.close()
+    return closed and not data
+
+
+async def scenario_deferred_within_limit(received):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    messages = [f"m{i}" for i in range(MAX_DEFERRED_PACKETS - 1)]
+    writer.write(b"\x01" + chat_frame(SLOW_MESSAGE) + b"".join(chat_frame(m) for m in messages))
+    await asyncio.sleep(SLOW_HANDLER_DELAY + 0.2)
+    # 排队的包在处理器完成后按顺序处理，连接仍然可用
+    writer.write(PING)
+    ok = await read_pongs(reader, 1)
+    writer.close()
+    return ok and received[-len(messages):] == messages
+
+
+async def scenario_deferred_overflow(received):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    writer.write(b"\x01" + chat_frame(SLOW_MESSAGE) + chat_frame("flood") * (MAX_DEFERRED_PACKETS + 1))
+    data, closed = await read_until_closed(reader, timeout=SLOW_HANDLER_DELAY)
+    writer.close()
+    return closed and not data
+
+
+SCENARIOS = [
+    ("ping -> pong", scenario_ping),
+    ("batched and split frames", scenario_batched_and_split),
+    ("frame larger than receive buffer", scenario_large_frame),
+    ("unsupported version closes", scenario_bad_version),
+    ("oversized length prefix closes", scenario_oversized_frame),
+    ("version timeout closes", scenario_version_timeout),
+    ("deferred packets within limit", scenario_deferred_within_limit),
+    ("deferred packet flood closes", scenario_deferred_overflow),
+]
+
+
+async def run_mode(mode):
+    received = []
+
+    def receive(packet):
+        received.append(packet.message)
+        if packet.message == SLOW_MESSAGE:
+            return asyncio.sleep(SLOW_HANDLER_DELAY)
+
+    def handler(connection):
+        connection.set_receiver(receive)
+
+    srv = server.Server("127.0.0.1", PORT, handler)
+    srv.transport_mode = mode
+    task = asyncio.create_task(srv.start())
+    await asyncio.sleep(0.2)
+    results = {}
+    for name, scenario in SCENARIOS:
+        try:
+            results[name] = await scenario(received)
+        except Exception as e:
+            results[name] = f"{type(e).__name__}: {e}"
+        await asyncio.sleep(0.05)
+    results["connections released"] = srv.active_connections == 0
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    return results
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    server.RECV_BUFFER_SIZE = RECV_BUFFER_SIZE
+    server.VERSION_TIMEOUT = 0.5
+    results = {mode: asyncio.run(run_mode(mode)) for mode in ("stream", "buffered")}
+    failed = False
+    for name in results["stream"]:
+        stream, buffered = results["stream"][name], results["buffered"][name]
+        ok = stream is True and buffered is True
+        failed = failed or not ok
+        print(f"  {'ok  ' if ok else 'FAIL'} {name:<34} stream: {stream}   buffered: {buffered}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""压力测试：事件循环模拟游戏流量（建房、进出房间、准备、通过状态机切换状态）的同时，
+多个线程模拟 admin 面板并发执行解散房间、踢人、强制准备并读取房间列表。
+
+检查：
+- admin 线程中的修改和 Connection.send 都在事件循环线程中执行
+- 没有出现异常，user_room_index 与 rooms 一致，快照与房间实际状态一致
+
+加 --unsafe 时不把房间交给事件循环，用来对比旧的行为。
+
+用法: python benchmarks/stress_room_registry.py [秒数] [admin 线程数] [--unsafe]
+"""
+
+import asyncio
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import room  # noqa: E402
+from room_state import room_state_machine  # noqa: E402
+from rymc.phira.protocol.data.state import Playing, WaitForReady  # noqa: E402
+
+USERS = 2000
+ROOM_IDS = [f"room{i}" for i in range(200)]
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loop_thread = None
+        self.off_loop_sends = 0
+        self.sends = 0
+        self.errors = []
+        self.game_ops = 0
+        self.admin_ops = 0
+        self.reads = 0
+
+    def error(self, where, e):
+        with self.lock:
+            self.errors.append(f"{where}: {type(e).__name__}: {e}")
+
+
+stats = Stats()
+
+
+class FakeConnection:
+    """只记录发送发生在哪个线程"""
+    connected = True
+
+    def send(self, packet):
+        return self.send_encoded(None)
+
+    def send_encoded(self, data):
+        with stats.lock:
+            stats.sends += 1
+            if threading.get_ident() != stats.loop_thread:
+                stats.off_loop_sends += 1
+        return True
+
+
+async def game_traffic(duration):
+    rng = random.Random(1)
+    users = [FakeUser(i) for i in range(USERS)]
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        for _ in range(50):
+            user = rng.choice(users)
+            try:
+                room_id = room.user_room_index.get(user.id)
+                if room_id is None:
+                    room_id = rng.choice(ROOM_IDS)
+                    if room_id not in room.rooms:
+                        room.create_room(room_id, user)
+                    room.add_user(room_id, user, FakeConnection())
+                else:
+                    roll = rng.random()
+                    if roll < 0.3:
+                        room.player_leave(room_id, user.id)
+                        if room_id in room.rooms and not room.rooms[room_id].users:
+                            room.destroy_room(room_id)
+                    elif roll < 0.6:
+                        room.set_ready(room_id, user.id)
+                    elif roll < 0.8:
+                        # 随机切换状态，转换表不允许的切换会被拒绝
+                        kind = rng.choice([None, WaitForReady, Playing])
+                        if kind is None:
+                            room_state_machine.select_chart(room_id, rng.choice([None, 1, 2]))
+                        else:
+                            room_state_machine.transition(room_id, kind)
+                    else:
+                        room.clear_ready(room_id)
+                stats.game_ops += 1
+            except Exception as e:
+                stats.error("game", e)
+        await asyncio.sleep(0)
+
+
+def admin_worker(seed, stop):
+    rng = random.Random(seed)
+    while not stop.is_set():
+        room_id = rng.choice(ROOM_IDS)
+        user_id = rng.randrange(USERS)
+        try:
+            roll = rng.random()
+            if roll < 0.1:
+                room.admin_force_destroy_room(room_id)
+            elif roll < 0.3:
+                room.admin_force_kick_player(room_id, user_id)
+            elif roll < 0.5:
+                room.admin_force_ready(room_id, user_id)
+            else:
+                for r in room.get_all_rooms()["rooms"]:
+                    if r["userCount"] != len(r["users"]):
+                        raise AssertionError(f"inconsistent summary for {r['roomId']}")
+                room.get_room_detail(room_id)
+                with stats.lock:
+                    stats.reads += 1
+                continue
+            with stats.lock:
+                stats.admin_ops += 1
+        except Exception as e:
+            stats.error("admin", e)
+
+
+async def run(duration, threads, unsafe):
+    stats.loop_thread = threading.get_ident()
+    if not unsafe:
+        room.attach_room_loop(asyncio.get_running_loop())
+    stop = threading.Event()
+    workers = [threading.Thread(target=admin_worker, args=(i, stop)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    await game_traffic(duration)
+    stop.set()
+    # admin 线程可能正在等待事件循环执行修改，继续运行事件循环直到它们退出
+    while any(worker.is_alive() for worker in workers):
+        await asyncio.sleep(0.01)
+    room.publish_snapshot()
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    unsafe = "--unsafe" in sys.argv
+    duration = float(args[0]) if args else 5
+    threads = int(args[1]) if len(args) > 1 else 4
+    asyncio.run(run(duration, threads, unsafe))
+
+    problems = list(stats.errors)
+    index_check = room.check_user_room_index()
+    if index_check["status"] != "0":
+        problems.extend(index_check["errors"][:5])
+    snapshot = room.get_room_snapshot()
+    for room_id, r in room.rooms.items():
+        view = snapshot.views.get(room_id)
+        if view is None or view.summary != room.room_summary(room_id, r):
+            problems.append(f"snapshot out of date for {room_id}")
+    if set(snapshot.views) != set(room.rooms):
+        problems.append("snapshot room set differs from rooms")
+
+    print(f"mode: {'unsafe (no room loop)' if unsafe else 'room loop'}, {duration:.0f} s, {threads} admin threads")
+    print(f"  game ops {stats.game_ops}, admin ops {stats.admin_ops}, admin reads {stats.reads}")
+    print(f"  sends {stats.sends}, sends off the loop thread {stats.off_loop_sends}")
+    print(f"  problems: {len(problems)}")
+    for problem in problems[:10]:
+        print(f"    {problem}")
+    if not unsafe and (problems or stats.off_loop_sends):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
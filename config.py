@@ -13,3 +13,14 @@ def get_port(key: str, default: int) -> int:
             return config.get(key, default)
     except FileNotFoundError:
         return default
+# 【新增】get_value 读取的 config.json 内容，只在第一次调用时解析
+_values = None
+def get_value(key: str, default):
+    global _values
+    if _values is None:
+        try:
+            with open("config.json", "r") as f:
+                _values = json.load(f)
+        except FileNotFoundError:
+            _values = {}
+    return _values.get(key, default)
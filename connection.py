@@ -1,13 +1,106 @@
 # 修改 connection.py
 import asyncio
+import inspect
 import logging
+from collections import deque
 
-from asyncioutil import write_message
+from asyncioutil import write_frames
 from rymc.phira.protocol import PacketRegistry
+from rymc.phira.protocol.packet.clientbound import ClientBoundPongPacket
 from rymc.phira.protocol.util import ByteBuf
 
 logger = logging.getLogger(__name__)
 
+# 【新增】ping 快速路径：ping 包只有一个 0x00 ID 字节，直接回复预编码好的 pong 帧
+PING_PACKET_ID = 0x00
+PONG_FRAME = PacketRegistry.encode_to_bytes(ClientBoundPongPacket.INSTANCE)
+# 延迟统计的指数移动平均系数
+LATENCY_EWMA_ALPHA = 0.2
+
+# 【新增】异步处理器未完成时最多排队的包数，超过时断开连接（与发送队列一样有上限）
+MAX_DEFERRED_PACKETS = 256
+
+# 单次 flush 最多合并的帧数
+MAX_FRAMES_PER_FLUSH = 64
+# 每次 flush 合并帧数的分布区间（上界）
+FLUSH_BUCKETS = (1, 2, 4, 8, 16, 32, MAX_FRAMES_PER_FLUSH)
+
+
+class SendStats:
+    """发送合并统计：flush 次数、帧数以及每次 flush 合并帧数的分布。"""
+
+    def __init__(self):
+        self.flushes = 0
+        self.frames = 0
+        self.bytes = 0
+        self.max_frames_per_flush = 0
+        self.histogram = [0] * len(FLUSH_BUCKETS)
+
+    def record(self, frame_count: int, byte_count: int):
+        self.flushes += 1
+        self.frames += frame_count
+        self.bytes += byte_count
+        if frame_count > self.max_frames_per_flush:
+            self.max_frames_per_flush = frame_count
+        for index, bound in enumerate(FLUSH_BUCKETS):
+            if frame_count <= bound:
+                self.histogram[index] += 1
+                break
+
+    def to_dict(self):
+        return {
+            "flushes": self.flushes,
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "avgFramesPerFlush": round(self.frames / self.flushes, 3) if self.flushes else 0,
+            "maxFramesPerFlush": self.max_frames_per_flush,
+            "framesPerFlush": {f"<={bound}": count for bound, count in zip(FLUSH_BUCKETS, self.histogram)},
+        }
+
+
+# 全局发送统计（所有连接累计）
+send_stats = SendStats()
+
+
+def get_send_stats():
+    """获取全局发送合并统计"""
+    return send_stats.to_dict()
+
+
+def frame_packet_id(frame: bytes) -> int:
+    """返回一个带长度前缀的帧中的数据包 ID。"""
+    index = 0
+    while frame[index] & 0x80:
+        index += 1
+    return frame[index + 1]
+
+
+def broadcast(connections, packet, exclude=None):
+    """把同一个数据包发送给多个连接：只编码一次，所有接收者共享同一份不可变 bytes。
+
+    :param connections: 接收者连接的可迭代对象
+    :param packet: 要发送的 ClientBoundPacket
+    :param exclude: 可选，不发送的连接（例如发送者自己）
+    :return: 成功放入发送队列的连接数
+    """
+    data = PacketRegistry.encode_to_bytes(packet)
+    if frame_packet_id(data) != 0x00 and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Broadcast packet: %s", data.hex())
+    return broadcast_encoded(connections, data, exclude)
+
+
+# 【新增】发送已经编码好的帧（例如 room_state 中预编码的状态切换包）
+def broadcast_encoded(connections, data, exclude=None):
+    """把一份已编码的帧发送给多个连接，返回成功放入发送队列的连接数"""
+    sent = 0
+    for connection in connections:
+        if connection is None or connection is exclude:
+            continue
+        if connection.send_encoded(data):
+            sent += 1
+    return sent
+
+
 class Connection:
     def __init__(self, writer: asyncio.StreamWriter):
         self.writer = writer
@@ -17,10 +110,23 @@ class Connection:
         self.last_activity = asyncio.get_event_loop().time()
         # 【新增】创建一个队列来管理发送任务
         self.write_queue = asyncio.Queue(maxsize=100)  # 设置队列最大容量
+        # 本连接的发送合并统计
+        self.send_stats = SendStats()
+        # 【新增】ping 统计：收到 ping 的时间戳，用于计算 ping 间隔和 pong 回复耗时
+        self.ping_count = 0
+        self.last_ping_at = None
+        self.ping_interval = None  # 相邻两次 ping 的间隔（EWMA，秒）
+        self.pong_turnaround = None  # 从收到 ping 到 pong 写入 socket 的耗时（EWMA，秒）
+        self._pending_pings = deque()
+        # 【新增】异步处理器：handler 返回协程时在后台执行，期间收到的包按顺序排队
+        self._handler_task = None
+        self._deferred_packets = deque()
         # 【新增】启动一个后台任务专门负责发送
         self._sender_task = asyncio.create_task(self._send_loop())
         # 【新增】启动连接健康检查
         self._health_check_task = asyncio.create_task(self._health_check())
+        # 【新增】close() 创建的关闭任务，保留引用以便等待它完成
+        self._close_task = None
 
     # 【新增】发送循环，确保同一时间只有一个包写入 Socket
     async def _send_loop(self):
@@ -29,18 +135,31 @@ class Connection:
                 # 等待队列中有数据
                 try:
                     data = await asyncio.wait_for(self.write_queue.get(), timeout=5)
+                    # 【修改】取出队列里当前所有待发数据，合并成一次写入和一次 drain
+                    batch = [data]
+                    while len(batch) < MAX_FRAMES_PER_FLUSH:
+                        try:
+                            batch.append(self.write_queue.get_nowait())
+                        except asyncio.QueueEmpty:
+                            break
                     # 更新最后活动时间
                     self.last_activity = asyncio.get_event_loop().time()
                     # 写数据 (此时是串行的，不会冲突)
                     try:
-                        await write_message(self.writer, data)
+                        await write_frames(self.writer, batch)
+                        if self._pending_pings:
+                            self._record_pongs(batch)
+                        byte_count = sum(len(item) for item in batch)
+                        self.send_stats.record(len(batch), byte_count)
+                        send_stats.record(len(batch), byte_count)
                     except Exception as e:
                         logger.error(f"Error writing to socket: {e}")
                         self.connected = False
                         self.close()
                         break
                     finally:
-                        self.write_queue.task_done()
+                        for _ in batch:
+                            self.write_queue.task_done()
                 except asyncio.TimeoutError:
                     # 超时，检查连接状态
                     continue
@@ -74,36 +193,128 @@ class Connection:
                 logger.warning("Attempting to send packet on closed connection")
                 return False
             
-            data = PacketRegistry.encode(packet).toBytes()
-            if data[0] != 0x00:
-                logger.debug(f"Send packet: {data.hex()}")
-            
-            # 【修改】不再创建新任务，而是放入队列
-            try:
-                self.write_queue.put_nowait(data)
-                return True
-            except asyncio.QueueFull:
-                logger.error("Send queue full, packet dropped")
-                return False
+            data = PacketRegistry.encode_to_bytes(packet)
+            if frame_packet_id(data) != 0x00 and logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Send packet: %s", data.hex())
         except Exception as e:
             logger.error(f"Failed to enqueue packet: {e}")
             return False
+        return self.send_encoded(data)
+
+    def send_encoded(self, data: bytes):
+        """发送已经编码好的完整帧（含长度前缀），供广播复用同一份 bytes。"""
+        if not self.connected:
+            logger.warning("Attempting to send packet on closed connection")
+            return False
+        # 【修改】不再创建新任务，而是放入队列
+        try:
+            self.write_queue.put_nowait(data)
+            return True
+        except asyncio.QueueFull:
+            logger.error("Send queue full, packet dropped")
+            return False
 
     def set_receiver(self, receiver):
         self.receiver = receiver
 
     def on_receive(self, data):
-        if data[0] != 0x00:
-            logger.debug(f"Receive packet: {data.hex()}")
+        if data[0] == PING_PACKET_ID and len(data) == 1:
+            # 【新增】ping 快速路径：不解码、不创建对象、不经过 handler
+            self._on_ping()
+            return
+        # 【修改】只在开启 DEBUG 时才把整个包转成十六进制字符串
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Receive packet: %s", data.hex())
         if self.receiver is None:
             return
         # 更新最后活动时间
         self.last_activity = asyncio.get_event_loop().time()
+        if self._handler_task is not None and len(self._deferred_packets) >= MAX_DEFERRED_PACKETS:
+            # 【新增】处理器等待上游期间客户端持续发包，不再无限排队
+            logger.warning(f"Too many packets queued behind a pending handler ({MAX_DEFERRED_PACKETS}), closing connection")
+            self.close()
+            return
         try:
-            self.receiver(PacketRegistry.decode(ByteBuf(data)))
+            packet = PacketRegistry.decode(ByteBuf.wrap(data))
+            if self._handler_task is not None:
+                # 上一个异步处理器还没完成，排队以保证处理顺序
+                self._deferred_packets.append(packet)
+                return
+            result = self.receiver(packet)
+            if inspect.isawaitable(result):
+                self._handler_task = asyncio.ensure_future(self._run_handlers(result))
         except Exception as e:
             logger.error(f"Error processing received packet: {e}")
 
+    async def _run_handlers(self, pending):
+        """等待异步处理器完成，再依次处理期间排队的包。"""
+        try:
+            while True:
+                try:
+                    await pending
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error processing received packet: {e}")
+                pending = None
+                while pending is None and self._deferred_packets:
+                    packet = self._deferred_packets.popleft()
+                    try:
+                        result = self.receiver(packet)
+                    except Exception as e:
+                        logger.error(f"Error processing received packet: {e}")
+                        continue
+                    if inspect.isawaitable(result):
+                        pending = result
+                if pending is None:
+                    break
+        finally:
+            # 【修改】正常结束时队列已经为空；被取消时丢弃还没处理的包，不留给之后的处理器
+            self._deferred_packets.clear()
+            self._handler_task = None
+
+    def _on_ping(self):
+        now = asyncio.get_event_loop().time()
+        self.last_activity = now
+        if self.last_ping_at is not None:
+            self.ping_interval = self._ewma(self.ping_interval, now - self.last_ping_at)
+        self.last_ping_at = now
+        self.ping_count += 1
+        if self.send_encoded(PONG_FRAME):
+            self._pending_pings.append(now)
+
+    def _record_pongs(self, batch):
+        now = asyncio.get_event_loop().time()
+        for frame in batch:
+            if frame is PONG_FRAME and self._pending_pings:
+                self.pong_turnaround = self._ewma(self.pong_turnaround, now - self._pending_pings.popleft())
+
+    @staticmethod
+    def _ewma(previous, sample):
+        if previous is None:
+            return sample
+        return previous + LATENCY_EWMA_ALPHA * (sample - previous)
+
+    def get_ping_stats(self):
+        """获取本连接的 ping 统计（时间单位：毫秒）。
+
+        服务器只能看到客户端发来的 ping，所以这里记录的是 ping 间隔和
+        服务器端 pong 回复耗时；完整的往返时间由客户端测量。"""
+        return {
+            "pingCount": self.ping_count,
+            "lastPingAgo": round((asyncio.get_event_loop().time() - self.last_ping_at) * 1000, 1)
+            if self.last_ping_at is not None else None,
+            "pingInterval": round(self.ping_interval * 1000, 1) if self.ping_interval is not None else None,
+            "pongTurnaround": round(self.pong_turnaround * 1000, 3) if self.pong_turnaround is not None else None,
+        }
+
+    def on_receive_batch(self, frames):
+        """依次处理一次 socket 读取中解析出的所有帧。"""
+        for data in frames:
+            if not self.connected:
+                break
+            self.on_receive(data)
+
     def is_closed(self):
         return not self.connected or self.writer.is_closing()
 
@@ -117,7 +328,13 @@ class Connection:
             self._sender_task.cancel()
         if self._health_check_task:
             self._health_check_task.cancel()
-        asyncio.create_task(self.close_and_wait())
+        self._close_task = asyncio.create_task(self.close_and_wait())
+
+    # 【新增】
+    async def wait_closed(self) -> None:
+        """等待 close() 开始的关闭流程（包括 closeHandler）完成"""
+        if self._close_task is not None:
+            await self._close_task
 
     async def close_and_wait(self, writer_timeout: float = 2) -> None:
         if self.writer is None:
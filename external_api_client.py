@@ -1,38 +1,221 @@
 #!/usr/bin/env python3
 
+import gzip
 import json
 import logging
+import threading
+import time
+import urllib.error
 import urllib.request
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Sequence
+
+import config
 
 logger = logging.getLogger(__name__)
 
+# 后台刷新间隔（秒）
+REFRESH_INTERVAL = config.get_value("external_api_refresh_interval", 5)
+# 刷新失败后的退避：初始等待和最大等待（秒），每次失败翻倍
+BACKOFF_BASE = 2
+BACKOFF_MAX = 300
+# 【新增】还没有缓存时返回的空房间列表：每次返回同一个对象，web 的 RoomListCache 按对象判断是否变化
+_EMPTY_ROOMS = ()
+
 class ExternalApiClient:
     """外部API客户端，用于获取非py端phira服务器的房间信息"""
     
     def __init__(self):
         self.cache = {}
         self.cache_time = {}
-        self.cache_timeout = 30  # 缓存30秒
+        self.cache_timeout = 30  # 缓存30秒，超过后视为过期（仍会返回，同时后台刷新）
+        # 【新增】后台刷新状态
+        self.failures = {}  # api_url -> 连续失败次数
+        self.next_attempt = {}  # api_url -> 下次允许请求的时间（退避）
+        self.last_error = {}  # api_url -> 最近一次错误
+        self._refreshing = set()  # 正在刷新的 api_url
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="external-api")
+        self._refresher = None
+        self.refresh_interval = REFRESH_INTERVAL
+        # 【新增】条件请求：api_url -> {"etag", "last_modified", "rooms", "size", "convert_time"}
+        self.validators = {}
+        self.requests = 0
+        self.not_modified = 0
+        self.gzip_responses = 0
+        self.bytes_received = 0
+        self.bytes_saved = 0  # 304 省下的完整响应大小 + gzip 压缩省下的大小
+        self.convert_time_skipped = 0.0  # 304 时跳过的解析与格式转换耗时（秒）
     
     def get_rooms_from_api(self, api_url: str) -> List[Dict]:
-        """从外部API获取房间信息"""
+        """从外部API获取房间信息（同步请求，失败时返回空列表）"""
         try:
-            logger.info(f"Fetching rooms from external API: {api_url}")
-            
-            # 发送请求
-            response = urllib.request.urlopen(api_url, timeout=10)
-            data = response.read().decode('utf-8')
-            api_data = json.loads(data)
-            
-            # 转换格式
-            rooms = self._convert_api_format(api_data)
-            logger.info(f"Fetched {len(rooms)} rooms from external API")
-            return rooms
+            return self._fetch_rooms(api_url)
         except Exception as e:
             logger.error(f"Error fetching rooms from external API: {e}")
             return []
     
+    def _fetch_rooms(self, api_url: str) -> List[Dict]:
+        """从外部API获取并转换房间信息，失败时抛出异常
+        
+        带上次响应的 ETag/Last-Modified 发出条件请求并接受 gzip；
+        上游返回 304 时直接复用上次转换好的房间列表。"""
+        logger.debug(f"Fetching rooms from external API: {api_url}")
+        
+        headers = {"Accept-Encoding": "gzip"}
+        previous = self.validators.get(api_url)
+        if previous is not None:
+            if previous["etag"]:
+                headers["If-None-Match"] = previous["etag"]
+            if previous["last_modified"]:
+                headers["If-Modified-Since"] = previous["last_modified"]
+        
+        # 发送请求
+        with self._lock:
+            self.requests += 1
+        try:
+            response = urllib.request.urlopen(urllib.request.Request(api_url, headers=headers), timeout=10)
+        except urllib.error.HTTPError as e:
+            if e.code != 304 or previous is None:
+                raise
+            # 未修改：不下载、不解析、不转换
+            with self._lock:
+                self.not_modified += 1
+                self.bytes_saved += previous["size"]
+                self.convert_time_skipped += previous["convert_time"]
+            logger.debug(f"External API {api_url} not modified, reusing {len(previous['rooms'])} rooms")
+            return previous["rooms"]
+        
+        with response:
+            raw = response.read()
+            content_encoding = response.headers.get("Content-Encoding", "").lower()
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+        if content_encoding == "gzip":
+            data = gzip.decompress(raw)
+        else:
+            data = raw
+        with self._lock:
+            self.bytes_received += len(raw)
+            if data is not raw:
+                self.gzip_responses += 1
+                self.bytes_saved += len(data) - len(raw)
+        
+        start = time.perf_counter()
+        api_data = json.loads(data.decode('utf-8'))
+        
+        # 转换格式
+        rooms = self._convert_api_format(api_data)
+        convert_time = time.perf_counter() - start
+        logger.debug(f"Fetched {len(rooms)} rooms from external API")
+        
+        if etag or last_modified:
+            self.validators[api_url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "rooms": rooms,
+                "size": len(raw),
+                "convert_time": convert_time,
+            }
+        else:
+            self.validators.pop(api_url, None)
+        return rooms
+    
+    def get_cached_rooms(self, api_url: str) -> Sequence[Dict]:
+        """返回缓存的房间列表，不阻塞。
+        
+        stale-while-revalidate：缓存过期时照常返回旧数据，同时在后台刷新；
+        从未获取成功时返回空元组 _EMPTY_ROOMS（总是同一个对象）。"""
+        with self._lock:
+            rooms = self.cache.get(api_url)
+            fetched_at = self.cache_time.get(api_url)
+        if fetched_at is None or time.time() - fetched_at > self.cache_timeout:
+            self.refresh_async(api_url)
+        return rooms if rooms is not None else _EMPTY_ROOMS
+    
+    def refresh_async(self, api_url: str) -> bool:
+        """在后台线程池中刷新一个地址；正在刷新或处于退避期时不重复提交。"""
+        with self._lock:
+            if api_url in self._refreshing or time.time() < self.next_attempt.get(api_url, 0):
+                return False
+            self._refreshing.add(api_url)
+        try:
+            self._executor.submit(self._refresh, api_url)
+        except RuntimeError:
+            # 解释器退出时线程池已关闭
+            with self._lock:
+                self._refreshing.discard(api_url)
+            return False
+        return True
+    
+    def _refresh(self, api_url: str):
+        try:
+            rooms = self._fetch_rooms(api_url)
+        except Exception as e:
+            with self._lock:
+                failures = self.failures.get(api_url, 0) + 1
+                self.failures[api_url] = failures
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (failures - 1))
+                self.next_attempt[api_url] = time.time() + delay
+                self.last_error[api_url] = str(e)
+            logger.error(f"Error fetching rooms from external API {api_url} "
+                         f"({failures} consecutive failures, retry in {delay}s): {e}")
+        else:
+            with self._lock:
+                self.cache[api_url] = rooms
+                self.cache_time[api_url] = time.time()
+                self.failures.pop(api_url, None)
+                self.next_attempt.pop(api_url, None)
+                self.last_error.pop(api_url, None)
+        finally:
+            with self._lock:
+                self._refreshing.discard(api_url)
+    
+    def start_refresher(self, api_urls: List[str], interval: float = None) -> Optional[threading.Thread]:
+        """启动后台刷新线程：每隔 interval 秒并行刷新所有地址（空地址会被忽略）"""
+        api_urls = [api_url for api_url in api_urls if api_url]
+        if not api_urls or self._refresher is not None:
+            return self._refresher
+        if interval is not None:
+            self.refresh_interval = interval
+        
+        def run():
+            while True:
+                for api_url in api_urls:
+                    self.refresh_async(api_url)
+                time.sleep(self.refresh_interval)
+        
+        self._refresher = threading.Thread(target=run, name="external-api-refresher", daemon=True)
+        self._refresher.start()
+        logger.info(f"External API refresher started for {len(api_urls)} URLs, interval {self.refresh_interval}s")
+        return self._refresher
+    
+    def get_stats(self) -> Dict:
+        """获取外部API请求统计，以及每个外部地址的缓存与刷新状态"""
+        now = time.time()
+        with self._lock:
+            urls = {
+                api_url: {
+                    "rooms": len(self.cache.get(api_url) or []),
+                    "ageSeconds": round(now - self.cache_time[api_url], 1) if api_url in self.cache_time else None,
+                    "stale": api_url not in self.cache_time or now - self.cache_time[api_url] > self.cache_timeout,
+                    "failures": self.failures.get(api_url, 0),
+                    "retryInSeconds": round(max(0, self.next_attempt[api_url] - now), 1)
+                    if api_url in self.next_attempt else 0,
+                    "lastError": self.last_error.get(api_url),
+                }
+                for api_url in set(self.cache_time) | set(self.failures)
+            }
+        return {
+            "requests": self.requests,
+            "notModified": self.not_modified,
+            "gzipResponses": self.gzip_responses,
+            "bytesReceived": self.bytes_received,
+            "bytesSaved": self.bytes_saved,
+            "convertMsSkipped": round(self.convert_time_skipped * 1000, 1),
+            "urls": urls,
+        }
+    
     def _convert_api_format(self, api_data: Dict) -> List[Dict]:
         """将外部API格式转换为项目内部格式"""
         converted_rooms = []
@@ -123,7 +306,10 @@ class ExternalApiClient:
         combined_rooms = local_rooms.copy()
         
         for api_url in external_api_urls:
-            external_rooms = self.get_rooms_from_api(api_url)
+            if not api_url:
+                continue
+            # 【修改】读取后台刷新的缓存，不在请求路径上发起网络请求
+            external_rooms = self.get_cached_rooms(api_url)
             combined_rooms.extend(external_rooms)
         
         return combined_rooms
@@ -13,15 +13,18 @@ import config
 import gitutil
 from connection import Connection
 from i10n import get_i10n_text
-from phiraapi import PhiraFetcher
+from phiraapi import async_fetcher, chart_info_cache, ChartNotFoundError, HTTPStatusError, PhiraAPIError
+from player_index import player_index
+from relay import room_relay
 from room import *
+from room_state import room_state_machine
 from rymc.phira.protocol.data import UserProfile
 from rymc.phira.protocol.data.message import *
 from rymc.phira.protocol.handler import SimplePacketHandler
 from rymc.phira.protocol.packet.clientbound import *
 from rymc.phira.protocol.packet.serverbound import *
 from server import Server
-from web import start_web_server_thread
+from web import start_web_server
 import admin
 
 HOST = config.get_host("host", "0.0.0.0")
@@ -50,18 +53,54 @@ logging.basicConfig(
 )
 
 logger = logging.getLogger("main")
-fetcher = PhiraFetcher()
+# 【修改】使用异步 Phira API 客户端，请求期间不阻塞事件循环
+fetcher = async_fetcher
 
 # 初始化TTL缓存: 最大1000个token，每个存活5分钟
 auth_cache = TTLCache(maxsize=1000, ttl=300)
+# 【新增】鉴权完成前还不知道玩家语言，鉴权失败的提示使用该语言
+DEFAULT_LANGUAGE = "zh-CN"
 online_user_list = {}
+# 【新增】成绩获取：每条成绩的最长等待时间（秒），超时后不再等待该成绩即可结束本局
+RECORD_FETCH_DEADLINE = config.get_value("record_fetch_deadline", 5)
+# roomId -> RoundResults，本局正在后台获取的成绩
+round_results = {}
 git_info = gitutil.get_git_version(str(Path(__file__).resolve().parent))
 
 
+class RoundResults:
+    """一个房间本局的成绩获取状态，用于等待所有成绩广播完再结束本局，并记录各阶段耗时。"""
+
+    def __init__(self):
+        self.started = asyncio.get_running_loop().time()  # 第一份成绩提交的时间
+        self.tasks = {}  # user_id -> 正在获取成绩的 Task
+        self.fetched = 0
+        self.failed = 0
+        self.slowest = 0.0  # 最慢一次获取的耗时（秒）
+
+    def log_summary(self, roomId):
+        elapsed = asyncio.get_running_loop().time() - self.started
+        logger.info(f"Round results for room {roomId}: {self.fetched} fetched, {self.failed} failed, "
+                    f"slowest fetch {self.slowest * 1000:.1f} ms, first submission -> game end {elapsed * 1000:.1f} ms")
+
+
 class MainHandler(SimplePacketHandler):
-    def handleAuthenticate(self, packet: ServerBoundAuthenticatePacket) -> None:
+    async def handleAuthenticate(self, packet: ServerBoundAuthenticatePacket) -> None:
         logger.info(f"Authenticate with token {packet.token}")
-        user_info = self._get_cached_user_info(packet.token)
+        try:
+            user_info = await self._get_cached_user_info(packet.token)
+        except PhiraAPIError as e:
+            # 【新增】Phira API 故障或 token 无效时鉴权失败，不缓存结果
+            logger.warning(f"Authentication failed: {e}")
+            if not self.connection.is_closed():
+                invalid_token = isinstance(e, HTTPStatusError) and 400 <= e.status < 500
+                text = get_i10n_text(DEFAULT_LANGUAGE, "auth_failed" if invalid_token else "phira_api_unavailable")
+                self.connection.send(ClientBoundAuthenticatePacket.Failed(text))
+                self.connection.close()
+            return
+        if self.connection.is_closed():
+            # 等待 API 期间连接已断开
+            return
 
         if user_info.id in online_user_list:
             old_connection: Connection = online_user_list[user_info.id]
@@ -75,6 +114,8 @@ class MainHandler(SimplePacketHandler):
                 old_connection.closeHandler()
 
         online_user_list[user_info.id] = self.connection
+        # 【新增】维护玩家名索引，供 web/admin 按名字查找玩家
+        player_index.add(user_info.id, user_info.name)
 
         self.user_info = user_info
         self.user_lang = user_info.language
@@ -96,14 +137,14 @@ class MainHandler(SimplePacketHandler):
         else:
             logger.debug(f"Error while getting git info: {git_info.error}")
 
-    def _get_cached_user_info(self, token: str) -> Optional[any]:
+    async def _get_cached_user_info(self, token: str) -> Optional[any]:
         """带缓存的获取用户信息"""
         if token in auth_cache:
             logger.debug(f"Cache hit for token {token[:8]}...")
             return auth_cache[token]
 
         logger.debug(f"Cache miss for token {token[:8]}..., fetching from API")
-        user_info = fetcher.get_user_info(token)
+        user_info = await fetcher.get_user_info(token)
         auth_cache[token] = user_info
         return user_info
 
@@ -117,8 +158,10 @@ class MainHandler(SimplePacketHandler):
             logger.info(f"用户 [{self.user_info.id}] {self.user_info.name} 下线。")
             
             # 从在线用户列表中移除
-            if self.user_info.id in online_user_list:
+            # 【修改】只移除属于本连接的记录：旧连接晚于重新登录关闭时，不能删掉新会话
+            if online_user_list.get(self.user_info.id) is self.connection:
                 del online_user_list[self.user_info.id]
+                player_index.remove(self.user_info.id)
                 logger.debug(f"Online user list after disconnect: {online_user_list}")
             
             # 获取这个用户所在的所有房间
@@ -134,18 +177,16 @@ class MainHandler(SimplePacketHandler):
                             if roomId in rooms and len(rooms[roomId].users) == 0:
                                 logger.info(f"Room {roomId} is empty, destroying...")
                                 destroy_room(roomId)
+                                round_results.pop(roomId, None)
                             
                             # 提醒这些房间里的所有其他玩家
                             packet = ClientBoundMessagePacket(
                                 LeaveRoomMessage(self.user_info.id, self.user_info.name))
                             # 广播给房间里的其他人
-                            if roomId in rooms:
-                                for _, room_user in rooms[roomId].users.items():
-                                    if room_user.connection != self.connection:
-                                        try:
-                                            room_user.connection.send(packet)
-                                        except Exception as e:
-                                            logger.error(f"Failed to send leave message to user: {e}")
+                            try:
+                                broadcast_to_room(roomId, packet, exclude=self.connection)
+                            except Exception as e:
+                                logger.error(f"Failed to send leave message to user: {e}")
                         except Exception as e:
                             logger.error(f"Error handling room leave for {roomId}: {e}")
             except Exception as e:
@@ -165,6 +206,24 @@ class MainHandler(SimplePacketHandler):
         else:
             logger.info("Anonymous user disconnected")
 
+    def handleTouches(self, packet: ServerBoundTouchesPacket) -> None:
+        """转发触摸数据：交给 room_relay 按 tick 合并后广播给房间内其他人。"""
+        if getattr(self, 'user_info', None) is None:
+            return
+        room_id_query_result = get_roomId(self.user_info.id)
+        if room_id_query_result.get("status") == "1":
+            return
+        room_relay.push_touches(room_id_query_result["roomId"], self.user_info.id, packet.data)
+
+    def handleJudges(self, packet: ServerBoundJudgesPacket) -> None:
+        """转发判定数据：交给 room_relay 按 tick 合并后广播给房间内其他人。"""
+        if getattr(self, 'user_info', None) is None:
+            return
+        room_id_query_result = get_roomId(self.user_info.id)
+        if room_id_query_result.get("status") == "1":
+            return
+        room_relay.push_judges(room_id_query_result["roomId"], self.user_info.id, packet.data)
+
     def handleCreateRoom(self, packet: ServerBoundCreateRoomPacket) -> None:
         logger.info(f"Create room with id {packet.roomId}")
         creat_room_result = create_room(packet.roomId, self.user_info)
@@ -209,7 +268,7 @@ class MainHandler(SimplePacketHandler):
 
             # Check if room exists and is in WaitForReady state
             if packet.roomId in rooms:
-                if isinstance(rooms[packet.roomId].state, WaitForReady):
+                if room_state_machine.in_state(packet.roomId, WaitForReady):
                     # Room is in ready state, cannot join
                     packet_room_in_ready = ClientBoundJoinRoomPacket.Failed(
                         get_i10n_text(self.user_lang, "room_in_ready_state"))
@@ -230,21 +289,14 @@ class MainHandler(SimplePacketHandler):
                 monitors = get_all_monitors(packet.roomId)["monitors"]
                 # 检查是否是直播
                 islive = is_live(packet.roomId)["isLive"]
-                # 通知其他用户
-                connections = get_connections(packet.roomId)["connections"]
-                for connection in connections:
-                    # 如果当前要发送的消息是要发给自己
-                    if connection == self.connection:
-                        # 跳过发送
-                        continue
-                    # 否则发送给其他用户
-                    # TODO：这里的false（指下文）是monitor状态
-                    # 暂时没实现，也不清楚什么意思
-                    # 所以todo
-                    packet = ClientBoundOnJoinRoomPacket(UserProfile(self.user_info.id, self.user_info.name), False)
-                    connection.send(packet)
-                    packet_message = ClientBoundMessagePacket(JoinRoomMessage(self.user_info.id, self.user_info.name))
-                    connection.send(packet_message)
+                # 通知其他用户（跳过自己）
+                # TODO：这里的false（指下文）是monitor状态
+                # 暂时没实现，也不清楚什么意思
+                # 所以todo
+                packet_on_join = ClientBoundOnJoinRoomPacket(UserProfile(self.user_info.id, self.user_info.name), False)
+                broadcast_to_room(packet.roomId, packet_on_join, exclude=self.connection)
+                packet_message = ClientBoundMessagePacket(JoinRoomMessage(self.user_info.id, self.user_info.name))
+                broadcast_to_room(packet.roomId, packet_message, exclude=self.connection)
                 # 通知自己
                 # 4 required positional arguments: 'gameState', 'users', 'monitors', and 'isLive'
                 packet = ClientBoundJoinRoomPacket.Success(gameState=room_state, users=user_profiles, monitors=monitors,
@@ -335,14 +387,13 @@ class MainHandler(SimplePacketHandler):
             LeaveRoomMessage(self.user_info.id, self.user_info.name)
         )
 
-        for other in room.users.values():
-            if other.connection is not self.connection:
-                other.connection.send(leave_msg)
+        broadcast_to_room(roomId, leave_msg, exclude=self.connection)
 
         # --------- 执行之前记录的决策 ---------
         if should_destroy_room:
             logger.info(f"Room {roomId} is empty, destroying...")
             destroy_room(roomId)
+            round_results.pop(roomId, None)
         elif new_host_id:
             logger.info(f"Room {roomId} has new host {new_host_id}")
             change_host(roomId, new_host_id)
@@ -350,7 +401,7 @@ class MainHandler(SimplePacketHandler):
             if new_host_id in room.users:
                 room.users[new_host_id].connection.send(ClientBoundChangeHostPacket(True))
 
-    def handleSelectChart(self, packet: ServerBoundSelectChartPacket) -> None:
+    async def handleSelectChart(self, packet: ServerBoundSelectChartPacket) -> None:
         logger.info(f"Select chart with id {packet.id}")
         # 获取用户所在房间
         roomId = get_roomId(self.user_info.id)
@@ -373,23 +424,33 @@ class MainHandler(SimplePacketHandler):
             self.connection.send(ClientBoundChangeHostPacket(False))
             return
         # 是房主
-        # 设置chart
-        set_chart(roomId, packet.id)
-        # 通知其他用户
-        chart_info = PhiraFetcher.get_chart_info(packet.id)
-        connections = get_connections(roomId)["connections"]
-        for connection in connections:
-            # 如果当前要发送的消息是要发给自己
-            # if connection == self.connection:
-            # 跳过发送
-            #    continue
-            # 状态改变
-            packet_state_change = ClientBoundChangeStatePacket(SelectChart(chartId=packet.id))
-            connection.send(packet_state_change)
-            # 发送醒目提示
-            # 中间的name是铺面name……
-            packet_chat = ClientBoundMessagePacket(SelectChartMessage(self.user_info.id, chart_info.name, packet.id))
-            connection.send(packet_chat)
+        # 【新增】只有 SelectChart 状态下可以换谱面
+        if not room_state_machine.can_transition(roomId, SelectChart):
+            self.connection.send(ClientBoundSelectChartPacket.Failed(get_i10n_text(self.user_lang, "not_select_chart")))
+            return
+        # 【修改】先从缓存获取谱面信息，谱面不存在时不修改房间状态
+        try:
+            chart_info = await chart_info_cache.get(packet.id)
+        except ChartNotFoundError:
+            packet_not_found = ClientBoundSelectChartPacket.Failed(get_i10n_text(self.user_lang, "chart_not_found"))
+            self.connection.send(packet_not_found)
+            return
+        except PhiraAPIError:
+            # 【新增】Phira API 不可用时不修改房间状态
+            packet_unavailable = ClientBoundSelectChartPacket.Failed(get_i10n_text(self.user_lang, "phira_api_unavailable"))
+            self.connection.send(packet_unavailable)
+            return
+        if roomId not in rooms or get_host(roomId).get("host") != self.user_info.id:
+            # 等待 API 期间房间已解散或房主已变更
+            return
+        # 【修改】设置chart并切换状态，状态机负责通知房间内所有用户
+        if room_state_machine.select_chart(roomId, packet.id)["status"] != "0":
+            # 等待 API 期间房间已开始游戏
+            self.connection.send(ClientBoundSelectChartPacket.Failed(get_i10n_text(self.user_lang, "not_select_chart")))
+            return
+        # 发送醒目提示
+        # 中间的name是铺面name……
+        broadcast_to_room(roomId, ClientBoundMessagePacket(SelectChartMessage(self.user_info.id, chart_info.name, packet.id)))
 
         # 通知自己
         packet_success = ClientBoundSelectChartPacket.Success()
@@ -433,16 +494,13 @@ class MainHandler(SimplePacketHandler):
             return
 
         # Change lock state
-        rooms[roomId].locked = packet.lock
+        set_lock(roomId, packet.lock)
 
         # Send success response
         self.connection.send(ClientBoundLockRoomPacket.Success())
 
         # Broadcast lock state change to all room members
-        connections = get_connections(roomId)["connections"]
-        for connection in connections:
-            packet_lock_msg = ClientBoundMessagePacket(LockRoomMessage(packet.lock))
-            connection.send(packet_lock_msg)
+        broadcast_to_room(roomId, ClientBoundMessagePacket(LockRoomMessage(packet.lock)))
 
     def handleCycleRoom(self, packet: ServerBoundCycleRoomPacket) -> None:
         """Handle lock/unlock room request."""
@@ -481,16 +539,13 @@ class MainHandler(SimplePacketHandler):
             return
 
         # Change lock state
-        rooms[roomId].cycle = packet.cycle
+        set_cycle_mode(roomId, packet.cycle)
 
         # Send success response
         self.connection.send(ClientBoundCycleRoomPacket.Success())
 
         # Broadcast lock state change to all room members
-        connections = get_connections(roomId)["connections"]
-        for connection in connections:
-            packet_cycle_msg = ClientBoundMessagePacket(CycleRoomMessage(packet.cycle))
-            connection.send(packet_cycle_msg)
+        broadcast_to_room(roomId, ClientBoundMessagePacket(CycleRoomMessage(packet.cycle)))
 
     #        connection.send(packet)
     def handleRequestStart(self, packet: ServerBoundRequestStartPacket) -> None:
@@ -504,7 +559,7 @@ class MainHandler(SimplePacketHandler):
             return
         roomId = roomId["roomId"]
         # 检查是否在SelectChart状态
-        if not isinstance(rooms[roomId].state, SelectChart):
+        if not room_state_machine.can_transition(roomId, WaitForReady):
             packet_not_select_chart = ClientBoundRequestStartPacket.Failed(
                 get_i10n_text(self.user_lang, "not_select_chart"))
             self.connection.send(packet_not_select_chart)
@@ -516,15 +571,10 @@ class MainHandler(SimplePacketHandler):
             self.connection.send(packet_not_host)
             self.connection.send(ClientBoundChangeHostPacket(False))
             return
-        # 切换状态WaitForReady
-        set_state(roomId, WaitForReady())
+        # 【修改】切换状态WaitForReady（状态机广播状态包）
+        room_state_machine.transition(roomId, WaitForReady)
         # 把房主的state设置为ready
         set_ready(roomId, self.user_info.id)
-        # 广播ClientBoundRequestStartPacket
-        connections = get_connections(roomId)["connections"]
-        for connection in connections:
-            packet_state_change = ClientBoundChangeStatePacket(WaitForReady())
-            connection.send(packet_state_change)
         # 给自己发送通知
         packet_notify = ClientBoundRequestStartPacket.Success()
         logger.debug(f"Sending packet: {packet_notify}")
@@ -544,41 +594,69 @@ class MainHandler(SimplePacketHandler):
         logger.info(f"Played submission from user {self.user_info.id} in room {roomId}, record ID: {packet.id}")
 
         # Check if room is in Playing state
-        if not isinstance(rooms[roomId].state, Playing):
+        if not room_state_machine.in_state(roomId, Playing):
             packet_not_playing_state = ClientBoundPlayedPacket.Failed("Not in playing state")
             self.connection.send(packet_not_playing_state)
             return
 
-        try:
-            # Fetch record result from Phira API
-            result_info = fetcher.get_record_result(packet.id)
-
-            # Send success response to the submitting player
+        # 【修改】立即确认，成绩在后台获取，到达后再广播
+        results = round_results.get(roomId)
+        if results is None:
+            results = round_results[roomId] = RoundResults()
+        if self.user_info.id in results.tasks:
+            # 重复提交：上一次的成绩还在获取中
             self.connection.send(ClientBoundPlayedPacket.Success())
+            return
 
-            # Broadcast PlayedMessage to all room members (including self)
-            connections = get_connections(roomId)["connections"]
-            for connection in connections:
-                packet_played_msg = ClientBoundMessagePacket(
-                    PlayedMessage(
-                        user=self.user_info.id,
-                        score=result_info.score,
-                        accuracy=result_info.accuracy,
-                        fullCombo=result_info.full_combo
-                    )
-                )
-                connection.send(packet_played_msg)
+        # Send success response to the submitting player
+        self.connection.send(ClientBoundPlayedPacket.Success())
+
+        # Mark user as finished
+        set_finished(roomId, self.user_info.id)
 
-            # Mark user as finished
-            set_finished(roomId, self.user_info.id)
+        results.tasks[self.user_info.id] = asyncio.create_task(
+            self._fetch_and_broadcast_record(roomId, results, self.user_info.id, packet.id))
 
-            # Check if all players have finished
-            self.checkAllFinished(roomId)
+    async def _fetch_and_broadcast_record(self, roomId, results: RoundResults, user_id, record_id):
+        """后台获取一条成绩并广播 PlayedMessage，完成后检查本局是否可以结束。"""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            # Fetch record result from Phira API
+            result_info = await asyncio.wait_for(fetcher.get_record_result(record_id), RECORD_FETCH_DEADLINE)
+            elapsed = loop.time() - start
+            results.fetched += 1
+            results.slowest = max(results.slowest, elapsed)
+            logger.info(f"Fetched record {record_id} of user {user_id} in room {roomId} in {elapsed * 1000:.1f} ms")
 
+            # Broadcast PlayedMessage to all room members (including self)
+            packet_played_msg = ClientBoundMessagePacket(
+                PlayedMessage(
+                    user=user_id,
+                    score=result_info.score,
+                    accuracy=result_info.accuracy,
+                    fullCombo=result_info.full_combo
+                )
+            )
+            broadcast_to_room(roomId, packet_played_msg)
+        except asyncio.TimeoutError:
+            results.failed += 1
+            logger.warning(f"Fetching record {record_id} of user {user_id} in room {roomId} "
+                           f"exceeded the {RECORD_FETCH_DEADLINE}s deadline, skipping its broadcast")
         except Exception as e:
+            results.failed += 1
             logger.error(f"Error processing played packet: {e}")
-            packet_error = ClientBoundPlayedPacket.Failed(f"Failed to fetch record: {str(e)}")
-            self.connection.send(packet_error)
+        finally:
+            del results.tasks[user_id]
+
+        # 房间已解散或已进入下一局时不再处理
+        if round_results.get(roomId) is not results:
+            return
+        if roomId not in rooms:
+            del round_results[roomId]
+            return
+        # Check if all players have finished
+        self.checkAllFinished(roomId)
 
     def handleAbort(self, packet: ServerBoundAbortPacket) -> None:
         """Handle abort packet with score submission."""
@@ -593,7 +671,7 @@ class MainHandler(SimplePacketHandler):
         logger.info(f"Abort submission from user {self.user_info.id} in room {roomId}")
 
         # Check if room is in Playing state
-        if not isinstance(rooms[roomId].state, Playing):
+        if not room_state_machine.in_state(roomId, Playing):
             packet_not_playing_state = ClientBoundAbortPacket.Failed("Not in playing state")
             self.connection.send(packet_not_playing_state)
             return
@@ -602,10 +680,7 @@ class MainHandler(SimplePacketHandler):
         self.connection.send(ClientBoundAbortPacket.Success())
 
         # Broadcast PlayedMessage to all room members (including self)
-        connections = get_connections(roomId)["connections"]
-        for connection in connections:
-            packet_played_msg = ClientBoundMessagePacket(AbortMessage(self.user_info.id))
-            connection.send(packet_played_msg)
+        broadcast_to_room(roomId, ClientBoundMessagePacket(AbortMessage(self.user_info.id)))
 
         # Mark user as finished
         set_finished(roomId, self.user_info.id)
@@ -626,7 +701,7 @@ class MainHandler(SimplePacketHandler):
         logger.info(f"Cancel ready at room {roomId} by user {self.user_info.id}")
 
         # Check if room is in WaitForReady state
-        if not isinstance(rooms[roomId].state, WaitForReady):
+        if not room_state_machine.in_state(roomId, WaitForReady):
             packet_not_ready_state = ClientBoundCancelReadyPacket.Failed(
                 get_i10n_text(self.user_lang, "not_ready_state"))
             self.connection.send(packet_not_ready_state)
@@ -637,16 +712,11 @@ class MainHandler(SimplePacketHandler):
 
         if is_host:
             # Host canceling: change room state back to SelectChart and cancel all ready states
-            set_state(roomId, SelectChart(chartId=rooms[roomId].chart))
+            # 【修改】状态机同时广播状态包
+            room_state_machine.select_chart(roomId, rooms[roomId].chart)
 
             # Cancel all ready states
-            rooms[roomId].ready.clear()
-
-            # Broadcast state change to all room members
-            connections = get_connections(roomId)["connections"]
-            for connection in connections:
-                packet_state_change = ClientBoundChangeStatePacket(SelectChart(chartId=rooms[roomId].chart))
-                connection.send(packet_state_change)
+            clear_ready(roomId)
 
             # Send success response
             self.connection.send(ClientBoundCancelReadyPacket.Success())
@@ -668,12 +738,7 @@ class MainHandler(SimplePacketHandler):
             self.connection.send(ClientBoundCancelReadyPacket.Success())
 
             # Broadcast cancel ready message to room members
-            connections = get_connections(roomId)["connections"]
-            for connection in connections:
-                packet_cancel_ready_msg = ClientBoundMessagePacket(
-                    CancelReadyMessage(self.user_info.id)
-                )
-                connection.send(packet_cancel_ready_msg)
+            broadcast_to_room(roomId, ClientBoundMessagePacket(CancelReadyMessage(self.user_info.id)))
 
     def handleReady(self, packet: ServerBoundReadyPacket) -> None:
         """Handle player ready request."""
@@ -688,7 +753,7 @@ class MainHandler(SimplePacketHandler):
         logger.info(f"Ready at room {roomId} by user {self.user_info.id}")
 
         # Check if room is in WaitForReady state
-        if not isinstance(rooms[roomId].state, WaitForReady):
+        if not room_state_machine.in_state(roomId, WaitForReady):
             packet_not_ready_state = ClientBoundReadyPacket.Failed(get_i10n_text(self.user_lang, "not_ready_state"))
             self.connection.send(packet_not_ready_state)
             return
@@ -710,111 +775,93 @@ class MainHandler(SimplePacketHandler):
         self.connection.send(ClientBoundReadyPacket.Success())
 
         # Broadcast ready state change to room members
-        connections = get_connections(roomId)["connections"]
-        for connection in connections:
-            # Send ready message to all users
-            packet_ready_msg = ClientBoundMessagePacket(
-                ReadyMessage(self.user_info.id)
-            )
-            connection.send(packet_ready_msg)
+        broadcast_to_room(roomId, ClientBoundMessagePacket(ReadyMessage(self.user_info.id)))
 
         self.checkReady(roomId)
 
     def checkReady(self, roomId):
         # Check if all players are ready
         room = rooms[roomId]
-        all_users = list(room.users.keys())
-        ready_users = list(room.ready.keys())
-
-        connections = get_connections(roomId)["connections"]
 
         # Check if everyone is ready (including host)
-        if len(all_users) == len(ready_users) and len(all_users) > 0:
+        if room.all_ready():
             logger.info(f"All players ready in room {roomId}, starting game...")
 
             # Clear ready states before starting
-            room.ready.clear()
+            clear_ready(roomId)
 
             # Send StartPlayingMessage to all room members
-            for connection in connections:
-                packet_start_msg = ClientBoundMessagePacket(
-                    StartPlayingMessage()
-                )
-                connection.send(packet_start_msg)
-
-            # Change room state to Playing
-            set_state(roomId, Playing())
+            broadcast_to_room(roomId, ClientBoundMessagePacket(StartPlayingMessage()))
 
-            # Broadcast state change to all room members
-            for connection in connections:
-                packet_state_change = ClientBoundChangeStatePacket(Playing())
-                connection.send(packet_state_change)
+            # 【修改】Change room state to Playing，状态机广播状态包
+            room_state_machine.transition(roomId, Playing)
+            # 新一局开始，丢弃上一局残留的成绩获取状态
+            round_results.pop(roomId, None)
 
     def checkAllFinished(self, roomId):
         """Check if all players have finished playing and return to SelectChart state."""
         room = rooms[roomId]
-        all_users = list(room.users.keys())
-        finished_users = list(room.finished.keys())
+
+        results = round_results.get(roomId)
+        if results is not None and results.tasks:
+            # 还有成绩在获取中，等最后一条成绩广播后再结束本局
+            return
 
         # Check if everyone has finished (including those who aborted)
-        if len(all_users) == len(finished_users) and len(all_users) > 0:
+        if room.all_finished():
             logger.info(f"All players finished in room {roomId}, returning to SelectChart...")
 
-            connections = get_connections(roomId)["connections"]
-
             # Send GameEndMessage to all room members
-            for connection in connections:
-                packet_game_end = ClientBoundMessagePacket(GameEndMessage())
-                connection.send(packet_game_end)
+            broadcast_to_room(roomId, ClientBoundMessagePacket(GameEndMessage()))
 
             if room.cycle:
                 room_users = get_all_users(roomId)["users"]
 
                 target_key = room.host
 
-                key_list = list(room_users.keys())
-
-                try:
-                    target_index = key_list.index(target_key)
-                    next_index = (target_index + 1) % len(key_list)
-                    new_host = key_list[next_index]
-
-                except ValueError:
-                    new_host = key_list[0]
+                # 【修改】按加入顺序轮换房主，不再构造 key 列表再 index()
+                new_host = room.next_host()
 
                 change_host(roomId, new_host)
                 logger.info(f"新房主将为: [{new_host}] {room_users[new_host].info.name}")
 
                 room_users[new_host].connection.send(ClientBoundChangeHostPacket(True))
-                room_users[target_key].connection.send(ClientBoundChangeHostPacket(False))
-
-            # Change room state back to SelectChart
-            room.chart = None
-            set_state(roomId, SelectChart(chartId=room.chart))
+                if target_key in room_users:
+                    room_users[target_key].connection.send(ClientBoundChangeHostPacket(False))
 
-            # Broadcast state change to all room members
-            for connection in connections:
-                packet_state_change = ClientBoundChangeStatePacket(SelectChart(chartId=room.chart))
-                connection.send(packet_state_change)
+            # 【修改】Change room state back to SelectChart，状态机广播状态包
+            room_state_machine.select_chart(roomId, None)
 
             # Clear finished states for next round
-            room.finished.clear()
+            clear_finished(roomId)
+
+            if results is not None:
+                del round_results[roomId]
+                results.log_summary(roomId)
 
 
 def handle_connection(connection: Connection):
     handler = MainHandler(connection)
 
-    connection.set_receiver(lambda packet: packet.handle(handler))
+    connection.set_receiver(handler.handle)
     connection.on_close(lambda: handler.on_player_disconnected())
 
 
+async def run_servers():
+    # 【新增】房间由主事件循环管理：admin 线程的修改转到这里执行，快照在这里按批发布
+    attach_room_loop(asyncio.get_running_loop())
+
+    # 【修改】web 服务器与游戏服务器运行在同一个事件循环中
+    web_server = await start_web_server()
+
+    # Start main server
+    server = Server(HOST, PORT, handle_connection)
+    async with web_server:
+        await server.start()
+
+
 if __name__ == '__main__':
-    # Start web server thread
-    start_web_server_thread()
-    
     # Start admin server thread
     admin.start_admin_server_thread()
     
-    # Start main server
-    server = Server(HOST, PORT, handle_connection)
-    asyncio.run(server.start())
+    asyncio.run(run_servers())
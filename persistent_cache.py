@@ -0,0 +1,153 @@
+"""持久化的用户/谱面信息缓存（SQLite，WAL 模式）。
+
+服务器重启后内存缓存全部失效，所有玩家重连时都会请求 ``/me``。这里把
+Phira API 的原始响应按 token 的哈希（用户信息）或谱面 ID（谱面信息）
+存入 SQLite，重启后按需读取，不在启动时整体加载。
+
+所有 SQLite 操作都在一个专用线程中执行（连接也在该线程中打开），事件循环只等待
+读取结果；写入排进同一个线程后立即返回，之后的读取能看到之前的写入。
+
+通过 config.json 中的 ``persistent_cache_path`` 启用，未配置时不启用。
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import sqlite3
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# 数据库文件路径，为空时不启用持久化缓存
+PERSISTENT_CACHE_PATH = config.get_value("persistent_cache_path", None)
+# 用户信息、谱面信息的有效期（秒）
+PERSISTENT_CACHE_USER_TTL = config.get_value("persistent_cache_user_ttl", 1800)
+PERSISTENT_CACHE_CHART_TTL = config.get_value("persistent_cache_chart_ttl", 86400)
+
+
+def hash_token(token: str) -> str:
+    """token 不以明文落盘，只保存其 sha256。"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class PersistentCache:
+    """以 SQLite 保存 Phira API 响应文本，每条记录带过期时间。"""
+
+    def __init__(self, path: str, user_ttl: float = PERSISTENT_CACHE_USER_TTL,
+                 chart_ttl: float = PERSISTENT_CACHE_CHART_TTL):
+        self.path = path
+        self.user_ttl = user_ttl
+        self.chart_ttl = chart_ttl
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        self.db = None
+        # 【新增】持有数据库连接的单线程执行器
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="persistent-cache")
+        try:
+            self._executor.submit(self._open).result()
+        except BaseException:
+            self._executor.shutdown(wait=False)
+            raise
+
+    def _open(self):
+        self.db = sqlite3.connect(self.path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # WAL 模式下 NORMAL 已能保证数据库不损坏，只可能丢失最近的少量写入
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS users "
+                        "(token_hash TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS charts "
+                        "(chart_id INTEGER PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)")
+        removed = self._purge_expired()
+        if removed:
+            logger.info(f"Purged {removed} expired entries from persistent cache {self.path}")
+
+    async def _read(self, sql, key):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._get, sql, key)
+
+    def _write(self, sql, key, data, ttl):
+        try:
+            self._executor.submit(self._put, sql, key, data, ttl)
+        except RuntimeError:
+            # 已经 close()
+            pass
+
+    def _get(self, sql, key):
+        try:
+            row = self.db.execute(sql, (key, time.time())).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.error(f"Persistent cache read failed: {e}")
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def _put(self, sql, key, data, ttl):
+        try:
+            self.db.execute(sql, (key, data, time.time() + ttl))
+            self.writes += 1
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.error(f"Persistent cache write failed: {e}")
+
+    async def get_user(self, token: str):
+        """返回缓存的 ``/me`` 响应文本，不存在或已过期时返回 None。"""
+        return await self._read("SELECT data FROM users WHERE token_hash = ? AND expires > ?", hash_token(token))
+
+    def put_user(self, token: str, data: str):
+        """写入在后台线程中执行，不等待完成"""
+        self._write("INSERT OR REPLACE INTO users VALUES (?, ?, ?)", hash_token(token), data, self.user_ttl)
+
+    async def get_chart(self, chartid: int):
+        """返回缓存的 ``/chart/{id}`` 响应文本，不存在或已过期时返回 None。"""
+        return await self._read("SELECT data FROM charts WHERE chart_id = ? AND expires > ?", int(chartid))
+
+    def put_chart(self, chartid: int, data: str):
+        """写入在后台线程中执行，不等待完成"""
+        self._write("INSERT OR REPLACE INTO charts VALUES (?, ?, ?)", int(chartid), data, self.chart_ttl)
+
+    def purge_expired(self) -> int:
+        """删除所有已过期的记录，返回删除的条数（阻塞调用线程直到完成）。"""
+        return self._executor.submit(self._purge_expired).result()
+
+    def _purge_expired(self) -> int:
+        now = time.time()
+        removed = self.db.execute("DELETE FROM users WHERE expires <= ?", (now,)).rowcount
+        removed += self.db.execute("DELETE FROM charts WHERE expires <= ?", (now,)).rowcount
+        return removed
+
+    def close(self):
+        """等待排队的写入完成后关闭数据库"""
+        try:
+            self._executor.submit(self.db.close)
+        except RuntimeError:
+            return
+        self._executor.shutdown(wait=True)
+
+    def get_stats(self):
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "errors": self.errors,
+        }
+
+
+def open_persistent_cache(path: str = PERSISTENT_CACHE_PATH):
+    """按配置打开持久化缓存；未配置或打开失败时返回 None（不影响服务器启动）。"""
+    if not path:
+        return None
+    try:
+        return PersistentCache(path)
+    except sqlite3.Error as e:
+        logger.error(f"Failed to open persistent cache {path}: {e}")
+        return None
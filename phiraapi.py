@@ -1,7 +1,29 @@
 from typing import Optional
-import urllib.request
+import asyncio
+import logging
+import ssl
 import json
 from datetime import datetime
+from urllib.parse import urlsplit
+
+from cachetools import TTLCache
+
+import config
+from persistent_cache import open_persistent_cache
+from upstream import endpoint_name, get_endpoint
+
+logger = logging.getLogger(__name__)
+
+# Phira API 地址，可在 config.json 中改为本地测试服务器
+PHIRA_API_HOST = config.get_value("phira_api_host", "https://phira.5wyxi.com/")
+# 异步客户端的最大并发请求数（同时也是每个主机的最大连接数）
+PHIRA_API_MAX_CONNECTIONS = config.get_value("phira_api_max_connections", 8)
+# 单次请求超时（秒）
+PHIRA_API_TIMEOUT = config.get_value("phira_api_timeout", 10)
+# 谱面信息缓存：最大条目数、有效期（秒）、不存在谱面的缓存有效期（秒）
+CHART_CACHE_SIZE = config.get_value("chart_cache_size", 1024)
+CHART_CACHE_TTL = config.get_value("chart_cache_ttl", 600)
+CHART_CACHE_NEGATIVE_TTL = config.get_value("chart_cache_negative_ttl", 60)
 
 
 class UserInfo:
@@ -60,50 +82,355 @@ class RecordResult:
         self.std = kwargs.get('std', 0.0)
         self.std_score = kwargs.get('std_score', 0.0)
 
-class PhiraFetcher:
-    host: str = "https://phira.5wyxi.com/"
+class PhiraAPIError(IOError):
+    """Phira API 请求失败：网络错误、超时、非 2xx 状态码或熔断器打开。"""
 
-    @staticmethod
-    def fetch(url, headers=None):
-        try:
-            req = urllib.request.Request(url, headers=headers or {})
-            with urllib.request.urlopen(req, timeout=10) as response:
-                if 200 <= response.getcode() < 300:
-                    return response.read().decode('utf-8')
+
+class HTTPStatusError(PhiraAPIError):
+    """HTTP 请求返回了非 2xx 状态码。"""
+
+    def __init__(self, status: int, url: str):
+        super().__init__(f"HTTP request failed with status code: {status}")
+        self.status = status
+        self.url = url
+
+
+class AsyncPhiraFetcher:
+    """Phira API 的异步客户端，不阻塞事件循环。
+
+    直接基于 asyncio 实现 HTTP/1.1：每个主机维护一个 keep-alive 连接池，
+    用信号量限制同时进行的请求数。请求失败时抛出 PhiraAPIError。
+
+    ``store`` 为可选的 PersistentCache，成功获取的用户/谱面信息会写入其中，
+    重启后优先从中读取。
+    """
+
+    def __init__(self, host: str = None, max_connections: int = None, timeout: float = None, store=None):
+        self.host = host or PHIRA_API_HOST
+        self.store = store
+        self.max_connections = max_connections or PHIRA_API_MAX_CONNECTIONS
+        self.timeout = timeout or PHIRA_API_TIMEOUT
+        # (scheme, hostname, port) -> [(reader, writer), ...] 空闲连接
+        self._idle = {}
+        self._semaphore = None
+        self._ssl_context = None
+        # 统计
+        self.requests = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.errors = 0
+
+    def _get_semaphore(self):
+        # 延迟创建，保证信号量绑定到实际运行的事件循环
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        return self._semaphore
+
+    async def _open(self, key):
+        scheme, hostname, port = key
+        ssl_context = None
+        if scheme == "https":
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            ssl_context = self._ssl_context
+        reader, writer = await asyncio.open_connection(hostname, port, ssl=ssl_context)
+        self.connections_opened += 1
+        return reader, writer
+
+    def _release(self, key, reader, writer, keep_alive):
+        if keep_alive and not writer.is_closing() and not reader.at_eof():
+            self._idle.setdefault(key, []).append((reader, writer))
+        else:
+            writer.close()
+
+    async def _request(self, reader, writer, hostname, target, headers):
+        lines = [f"GET {target} HTTP/1.1", f"Host: {hostname}", "Connection: keep-alive",
+                 "Accept: application/json"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by server")
+        parts = status_line.decode("latin-1").split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise IOError(f"Malformed HTTP status line: {status_line!r}")
+        version, status = parts[0], int(parts[1])
+
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == "HTTP/1.1"
+        connection_header = response_headers.get("connection", "").lower()
+        if connection_header == "close":
+            keep_alive = False
+        elif connection_header == "keep-alive":
+            keep_alive = True
+
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size_line = await reader.readline()
+                size = int(size_line.split(b";", 1)[0].strip(), 16)
+                if size == 0:
+                    # 跳过 trailer
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                body += await reader.readexactly(size)
+                await reader.readexactly(2)
+        elif "content-length" in response_headers:
+            body = await reader.readexactly(int(response_headers["content-length"]))
+        else:
+            # 没有长度信息，只能读到连接关闭
+            body = await reader.read()
+            keep_alive = False
+        return status, bytes(body), keep_alive
+
+    async def fetch_raw(self, url, headers=None):
+        """发出 GET 请求，返回 (状态码, 响应体 bytes)。
+
+        请求经过 upstream 的熔断器、延迟统计和（可选的）对冲请求。网络错误、
+        5xx 和熔断打开（CircuitOpenError）直接抛出。"""
+        endpoint = get_endpoint(endpoint_name(urlsplit(url).path))
+
+        async def request():
+            status, body = await self._fetch_raw_once(url, headers)
+            if status >= 500:
+                raise HTTPStatusError(status, url)
+            return status, body
+
+        return await endpoint.call(request)
+
+    async def _fetch_raw_once(self, url, headers=None):
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        host_header = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+
+        async with self._get_semaphore():
+            self.requests += 1
+            # 复用的空闲连接可能已被服务器关闭，失败时用新连接重试一次
+            while True:
+                idle = self._idle.get(key)
+                reused = bool(idle)
+                if reused:
+                    reader, writer = idle.pop()
+                    self.connections_reused += 1
                 else:
-                    raise IOError(f"HTTP request failed with status code: {response.getcode()}")
+                    reader, writer = await asyncio.wait_for(self._open(key), self.timeout)
+                try:
+                    status, body, keep_alive = await asyncio.wait_for(
+                        self._request(reader, writer, host_header, target, headers or {}), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    writer.close()
+                    if reused:
+                        logger.debug(f"Stale keep-alive connection to {parts.hostname}, retrying: {e}")
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                self._release(key, reader, writer, keep_alive)
+                return status, body
+
+    async def fetch(self, url, headers=None, on_success=None):
+        """获取响应文本。
+
+        【修改】失败时抛出 PhiraAPIError（非 2xx 状态码为其子类 HTTPStatusError），
+        不再返回模拟响应。``on_success`` 只在获取成功时以响应文本调用（用于写入持久化缓存）。"""
+        try:
+            status, body = await self.fetch_raw(url, headers)
         except Exception as e:
-            # 模拟响应，避免依赖问题导致服务器无法启动
-            if "me" in url:
-                # 模拟用户信息响应
-                return '{"id": 1, "name": "Test User", "language": "zh-CN"}'
-            elif "chart" in url:
-                # 模拟谱面信息响应
-                chart_id = url.split('/')[-1]
-                return '{"id": ' + chart_id + ', "name": "Test Chart"}'
-            elif "record" in url:
-                # 模拟记录结果响应
-                return '{"score": 1000000, "accuracy": 100.0, "full_combo": true, "perfect": 100, "good": 0, "bad": 0, "miss": 0, "max_combo": 100, "std": 100.0, "std_score": 1000000}'
-            raise e
-
-    @classmethod
-    def get_user_info(cls, token: str) -> UserInfo:
-        url = f"{cls.host}me"
+            self.errors += 1
+            logger.warning(f"Phira API request to {url} failed: {e!r}")
+            raise PhiraAPIError(f"Phira API request to {url} failed: {e!r}") from e
+        if not 200 <= status < 300:
+            self.errors += 1
+            logger.warning(f"Phira API request to {url} failed with status code: {status}")
+            raise HTTPStatusError(status, url)
+        text = body.decode('utf-8')
+        if on_success is not None:
+            on_success(text)
+        return text
+
+    async def get_user_info(self, token: str) -> UserInfo:
+        url = f"{self.host}me"
         headers = {"Authorization": f"Bearer {token}"}
-        response_text = cls.fetch(url, headers)
+        response_text = await self.store.get_user(token) if self.store is not None else None
+        if response_text is None:
+            on_success = (lambda text: self.store.put_user(token, text)) if self.store is not None else None
+            response_text = await self.fetch(url, headers, on_success)
         data = json.loads(response_text)
         return UserInfo(**data)
 
-    @classmethod
-    def get_chart_info(cls, chartid: int) -> ChartInfo:
-        url = f"{cls.host}chart/{chartid}"
-        response_text = cls.fetch(url)
+    async def get_chart_info(self, chartid: int) -> ChartInfo:
+        url = f"{self.host}chart/{chartid}"
+        response_text = await self.store.get_chart(chartid) if self.store is not None else None
+        if response_text is None:
+            on_success = (lambda text: self.store.put_chart(chartid, text)) if self.store is not None else None
+            response_text = await self.fetch(url, on_success=on_success)
         data = json.loads(response_text)
         return ChartInfo(**data)
 
-    @classmethod
-    def get_record_result(cls, recordid: int) -> RecordResult:
-        url = f"{cls.host}record/{recordid}"
-        response_text = cls.fetch(url)
+    async def get_record_result(self, recordid: int) -> RecordResult:
+        url = f"{self.host}record/{recordid}"
+        response_text = await self.fetch(url)
         data = json.loads(response_text)
-        return RecordResult(**data)
\ No newline at end of file
+        return RecordResult(**data)
+
+    def close(self):
+        """关闭所有空闲连接。"""
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+    def get_stats(self):
+        return {
+            "requests": self.requests,
+            "connectionsOpened": self.connections_opened,
+            "connectionsReused": self.connections_reused,
+            "idleConnections": sum(len(connections) for connections in self._idle.values()),
+            "errors": self.errors,
+        }
+
+
+class ChartNotFoundError(LookupError):
+    """Phira API 返回 404：谱面不存在。"""
+
+    def __init__(self, chartid):
+        super().__init__(f"Chart {chartid} not found")
+        self.chartid = chartid
+
+
+class ChartInfoCache:
+    """谱面信息缓存。
+
+    - LRU + TTL（cachetools.TTLCache），存在的谱面缓存 ``ttl`` 秒；
+    - 404 的谱面单独缓存 ``negative_ttl`` 秒，期间直接抛出 ChartNotFoundError；
+    - 同一谱面的并发查询共享同一个请求（single-flight）。
+
+    网络错误等其他失败不会被缓存，直接抛出 PhiraAPIError。
+    """
+
+    def __init__(self, fetcher: AsyncPhiraFetcher, maxsize: int = CHART_CACHE_SIZE,
+                 ttl: float = CHART_CACHE_TTL, negative_ttl: float = CHART_CACHE_NEGATIVE_TTL):
+        self.fetcher = fetcher
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._missing = TTLCache(maxsize=maxsize, ttl=negative_ttl)
+        # chartid -> 正在进行的请求（Future）
+        self._inflight = {}
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def get(self, chartid: int) -> ChartInfo:
+        """获取谱面信息，谱面不存在时抛出 ChartNotFoundError。"""
+        chart_info = self._cache.get(chartid)
+        if chart_info is not None:
+            self.hits += 1
+            return chart_info
+        if chartid in self._missing:
+            self.negative_hits += 1
+            raise ChartNotFoundError(chartid)
+
+        future = self._inflight.get(chartid)
+        if future is not None:
+            self.coalesced += 1
+            # shield：某个等待者被取消时不影响其他等待者和请求本身；
+            # 发起请求的任务被取消时等待者收到 PhiraAPIError（见下）
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[chartid] = future
+        try:
+            chart_info = await self._load(chartid)
+        except asyncio.CancelledError:
+            # 【修改】不把取消传给合并进来的等待者，否则它们的处理器会静默结束；
+            # 改为普通的请求失败，让它们照常回复 phira_api_unavailable
+            future.set_exception(PhiraAPIError(f"Request for chart {chartid} was cancelled"))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(chart_info)
+            return chart_info
+        finally:
+            del self._inflight[chartid]
+
+    async def _load(self, chartid):
+        store = self.fetcher.store
+        if store is not None:
+            response_text = await store.get_chart(chartid)
+            if response_text is not None:
+                chart_info = ChartInfo(**json.loads(response_text))
+                self._cache[chartid] = chart_info
+                return chart_info
+        url = f"{self.fetcher.host}chart/{chartid}"
+        try:
+            status, body = await self.fetcher.fetch_raw(url)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Phira API request to {url} failed: {e!r}")
+            raise PhiraAPIError(f"Phira API request to {url} failed: {e!r}") from e
+        if status == 404:
+            self._missing[chartid] = True
+            raise ChartNotFoundError(chartid)
+        if not 200 <= status < 300:
+            self.errors += 1
+            logger.warning(f"Phira API request to {url} failed with status code: {status}")
+            raise HTTPStatusError(status, url)
+        response_text = body.decode('utf-8')
+        chart_info = ChartInfo(**json.loads(response_text))
+        self._cache[chartid] = chart_info
+        if store is not None:
+            store.put_chart(chartid, response_text)
+        return chart_info
+
+    def invalidate(self, chartid: int = None):
+        """移除一个谱面的缓存；不传参数时清空全部缓存。"""
+        if chartid is None:
+            self._cache.clear()
+            self._missing.clear()
+        else:
+            self._cache.pop(chartid, None)
+            self._missing.pop(chartid, None)
+
+    def get_stats(self):
+        lookups = self.hits + self.negative_hits + self.misses + self.coalesced
+        return {
+            "size": len(self._cache),
+            "negativeSize": len(self._missing),
+            "maxSize": self._cache.maxsize,
+            "hits": self.hits,
+            "negativeHits": self.negative_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "inflight": len(self._inflight),
+            "hitRate": round((self.hits + self.negative_hits + self.coalesced) / lookups, 3) if lookups else 0,
+        }
+
+
+# 全局异步客户端（配置了 persistent_cache_path 时带持久化缓存）
+async_fetcher = AsyncPhiraFetcher(store=open_persistent_cache())
+# 全局谱面信息缓存
+chart_info_cache = ChartInfoCache(async_fetcher)
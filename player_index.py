@@ -0,0 +1,87 @@
+"""在线玩家名索引。
+
+按规范化后的玩家名（NFKC + casefold）维护一个有序列表，前缀查询用二分查找定位，
+只接触匹配的玩家。玩家所在房间直接查 room.user_room_index。
+
+由 main.py 在鉴权成功和断开连接时维护；查询可以在 web 的事件循环或 admin 线程中进行。
+"""
+
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from urllib.parse import parse_qs
+
+from room import user_room_index
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def normalize_name(name):
+    """玩家名的规范形式：全角/半角、大小写不敏感"""
+    return unicodedata.normalize("NFKC", str(name)).casefold().strip()
+
+
+class PlayerIndex:
+
+    def __init__(self):
+        # user_id -> (规范化名字, 显示名字)
+        self.users = {}
+        # (规范化名字, user_id) 的有序列表
+        self.names = []
+        self._lock = threading.Lock()
+
+    def add(self, user_id, name):
+        """记录一个在线玩家；同一玩家重复登录时更新名字"""
+        with self._lock:
+            self._remove(user_id)
+            key = normalize_name(name)
+            self.users[user_id] = (key, name)
+            insort(self.names, (key, user_id))
+
+    def remove(self, user_id):
+        with self._lock:
+            self._remove(user_id)
+
+    def _remove(self, user_id):
+        entry = self.users.pop(user_id, None)
+        if entry is None:
+            return
+        i = bisect_left(self.names, (entry[0], user_id))
+        if i < len(self.names) and self.names[i] == (entry[0], user_id):
+            del self.names[i]
+
+    def search(self, prefix, limit=DEFAULT_LIMIT):
+        """按名字前缀查找在线玩家，返回 (玩家列表, 是否还有更多)。
+        每个玩家为 {"id", "name", "roomId"}，不在房间内时 roomId 为 None"""
+        key = normalize_name(prefix)
+        limit = max(1, min(limit, MAX_LIMIT))
+        with self._lock:
+            start = bisect_left(self.names, (key,))
+            matches = []
+            for name_key, user_id in self.names[start:start + limit + 1]:
+                if not name_key.startswith(key):
+                    break
+                matches.append((user_id, self.users[user_id][1]))
+        more = len(matches) > limit
+        players = [{"id": user_id, "name": name, "roomId": user_room_index.get(user_id)}
+                   for user_id, name in matches[:limit]]
+        return players, more
+
+    def get_stats(self):
+        return {"online": len(self.users)}
+
+
+player_index = PlayerIndex()
+
+
+def find_players(query):
+    """处理 ``?name=<前缀>&limit=<数量>`` 形式的查询字符串（web 和 admin 共用）。
+    参数不合法时抛出 ValueError"""
+    params = parse_qs(query)
+    prefix = params.get("name", [""])[0]
+    if not prefix.strip():
+        raise ValueError("name is required")
+    limit = int(params.get("limit", [DEFAULT_LIMIT])[0])
+    players, more = player_index.search(prefix, limit)
+    return {"status": "0", "players": players, "more": more}
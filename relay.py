@@ -0,0 +1,135 @@
+"""touches/judges 转发。
+
+客户端游玩时会高频发送 touches 和 judges。这里不逐包转发，而是把每个
+玩家在一个 tick 内产生的数据合并起来，每个 tick 每个玩家只编码一帧，
+再广播给房间内的其他人，所以发送频率只取决于 tick 长度，与客户端的
+发送频率无关。
+
+ServerBound 的 touches/judges 数据是一个 Vec：先是 ULEB128（与 varint
+相同）编码的元素个数，后面紧跟各元素。合并时把个数相加、元素字节直接
+拼接即可，不需要解析单个元素。
+"""
+
+import asyncio
+import logging
+
+import config
+from connection import broadcast
+from room import rooms
+from rymc.phira.protocol.packet.clientbound import ClientBoundTouchesPacket, ClientBoundJudgesPacket
+from rymc.phira.protocol.util import ByteBuf, decodeVarInt, encodeVarInt
+
+logger = logging.getLogger(__name__)
+
+# 转发 tick 长度（毫秒），建议 16–50
+RELAY_TICK_MS = config.get_value("relay_tick_ms", 33)
+
+
+class PendingFrames:
+    """一个玩家在当前 tick 内累积的某一类数据。"""
+
+    __slots__ = ("count", "data")
+
+    def __init__(self):
+        self.count = 0
+        self.data = bytearray()
+
+    def append(self, payload: bytes) -> bool:
+        buf = ByteBuf.wrap(payload)
+        try:
+            count = decodeVarInt(buf)
+        except Exception:
+            return False
+        self.count += count
+        self.data += memoryview(payload)[buf.reader_index:]
+        return True
+
+    def to_bytes(self) -> bytes:
+        buf = ByteBuf()
+        encodeVarInt(buf, self.count)
+        buf.writeBytes(self.data)
+        return buf.toBytes()
+
+
+class RoomRelay:
+    """按房间、按玩家缓存 touches/judges，并在每个 tick 合并广播。"""
+
+    def __init__(self, tick_ms: float = RELAY_TICK_MS):
+        self.tick = tick_ms / 1000
+        # roomId -> {user_id: [PendingFrames | None, PendingFrames | None]}（touches, judges）
+        self.pending = {}
+        self._task = None
+        self.ticks = 0
+        self.packets_in = 0
+        self.frames_out = 0
+        self.dropped = 0
+
+    def push_touches(self, roomId, user_id, data: bytes):
+        self._push(roomId, user_id, 0, data)
+
+    def push_judges(self, roomId, user_id, data: bytes):
+        self._push(roomId, user_id, 1, data)
+
+    def _push(self, roomId, user_id, kind, data):
+        if not data:
+            return
+        players = self.pending.get(roomId)
+        if players is None:
+            players = self.pending[roomId] = {}
+        slots = players.get(user_id)
+        if slots is None:
+            slots = players[user_id] = [None, None]
+        pending = slots[kind]
+        if pending is None:
+            pending = slots[kind] = PendingFrames()
+        if pending.append(data):
+            self.packets_in += 1
+        else:
+            self.dropped += 1
+            logger.debug(f"Dropped malformed relay payload from user {user_id} in room {roomId}")
+        self._ensure_task()
+
+    def _ensure_task(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        # 没有待转发数据时任务自行退出，空闲时不占用事件循环
+        while self.pending:
+            await asyncio.sleep(self.tick)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing relay: {e}")
+
+    def flush(self):
+        """把当前 tick 累积的数据合并后广播出去。"""
+        pending, self.pending = self.pending, {}
+        self.ticks += 1
+        for roomId, players in pending.items():
+            room = rooms.get(roomId)
+            if room is None:
+                continue
+            recipients = [user.connection for user in room.users.values()]
+            for user_id, (touches, judges) in players.items():
+                source = room.users.get(user_id)
+                exclude = source.connection if source is not None else None
+                if touches is not None:
+                    broadcast(recipients, ClientBoundTouchesPacket(user_id, touches.to_bytes()), exclude)
+                    self.frames_out += 1
+                if judges is not None:
+                    broadcast(recipients, ClientBoundJudgesPacket(user_id, judges.to_bytes()), exclude)
+                    self.frames_out += 1
+
+    def get_stats(self):
+        return {
+            "tickMs": self.tick * 1000,
+            "ticks": self.ticks,
+            "packetsIn": self.packets_in,
+            "framesOut": self.frames_out,
+            "dropped": self.dropped,
+        }
+
+
+# 全局实例
+room_relay = RoomRelay()
@@ -1,31 +1,211 @@
 from rymc.phira.protocol.data.state import *
+from connection import broadcast, broadcast_encoded
+import concurrent.futures
+import functools
+import json
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
 # 全局房间"列表"（实际是 dict）
 rooms = {}
 
+# 【新增】新房间的初始状态（未选谱面），所有房间共享这一个实例，状态对象不会被修改
+INITIAL_STATE = SelectChart(None)
+
+# 【新增】用户 -> 房间索引（user_id -> roomId），避免每次查询都遍历所有房间
+# 由 add_user / player_leave / destroy_room 维护，其他函数只读
+user_room_index = {}
+
+# 【新增】房间变更监听器：listener(event, roomId, fields)
+# event 为 create / destroy / join / leave / update，由下面的修改函数在变更后调用
+room_listeners = []
+
+# 【新增】已修改、等待写入下一版快照的房间（dict 用作有序集合，新房间按创建顺序发布）
+_dirty_rooms = {}
+# roomId -> RoomView，只在发布快照时修改，顺序与 rooms 一致
+_room_views = {}
+# 【修改】房间所属的事件循环：设置后所有修改都在该循环中执行，快照也在其中按批发布；
+# 未设置时（脚本、测试）直接在调用线程中修改，快照在读取时发布
+_room_loop = None
+_room_loop_thread = None
+_publish_scheduled = False
+# 其他线程等待事件循环执行修改的最长时间（秒）
+ROOM_CALL_TIMEOUT = 5
+
 # RoomUser 类：用于存储用户的详细信息和其网络连接
 class RoomUser:
     """一个简单的容器，用于存储用户信息和其连接。"""
+    __slots__ = ("info", "connection")
+
     def __init__(self, user_info, connection):
         self.info = user_info      # 存储 UserProfile/UserInfo 对象
         self.connection = connection # 存储 Connection 对象
 
 class Room:
+    # 【修改】使用 __slots__，每个房间不再带 __dict__
+    __slots__ = ("id", "host", "state", "live", "locked", "cycle", "users", "monitors", "chart", "ready", "finished")
+
     def __init__(self, roomId):
         self.id = roomId
         self.host = None
-        self.state = SelectChart(None)
+        self.state = INITIAL_STATE
         self.live = False
         self.locked = False
         self.cycle = False
-        self.users = {} # 这个字典现在会存储 RoomUser 实例
+        self.users = {} # 这个字典现在会存储 RoomUser 实例，按加入顺序排列，也是循环模式下的房主轮换顺序
         self.monitors = []
         self.chart = None
-        self.ready = {} # 用于存储用户是否准备好的状态
-        self.finished = {} # 用于存储用户是否完成游戏的状态
+        # 【修改】已准备/已完成的用户 id 集合；只包含仍在房间内的用户，所以 len() 就是当前准备/完成的人数
+        self.ready = set()
+        self.finished = set()
+
+    def all_ready(self):
+        """房间内所有人（包括房主）都已准备"""
+        return 0 < len(self.users) == len(self.ready)
+
+    def all_finished(self):
+        """房间内所有人都已完成（包括中途放弃的）"""
+        return 0 < len(self.users) == len(self.finished)
+
+    def next_host(self):
+        """循环模式下的下一任房主：按加入顺序排在当前房主之后的玩家，到末尾后回到第一个。
+
+        users 按加入顺序排列，本身就是房主轮换的环，这里从头走到当前房主。每局最多调用一次，
+        房间人数很少；单独维护一个链表环要给每个房间多加两个 dict，抵消 __slots__ 省下的内存"""
+        users = iter(self.users)
+        for user_id in users:
+            if user_id == self.host:
+                return next(users, next(iter(self.users)))
+        # 当前房主已不在房间内
+        return next(iter(self.users), None)
+
+def add_room_listener(listener):
+    """订阅房间变更事件"""
+    room_listeners.append(listener)
+
+def remove_room_listener(listener):
+    """取消订阅房间变更事件"""
+    if listener in room_listeners:
+        room_listeners.remove(listener)
+
+def notify_room_listeners(event, roomId, **fields):
+    """把一次房间变更通知给所有监听器，单个监听器出错不影响其他监听器"""
+    mark_room_dirty(roomId)
+    for listener in room_listeners:
+        try:
+            listener(event, roomId, fields)
+        except Exception as e:
+            logger.error(f"Room listener failed on {event} {roomId}: {e}")
+
+
+class RoomView:
+    """某个房间在某一版本时的只读信息"""
+    __slots__ = ("version", "summary", "detail", "_summary_json", "_detail_json")
+
+    def __init__(self, version, summary, detail):
+        self.version = version
+        self.summary = summary  # room_summary() 的结果
+        self.detail = detail    # get_room_detail() 中的 room 字典
+        self._summary_json = None
+        self._detail_json = None
+
+    def summary_json(self):
+        """summary 的 JSON bytes，首次使用时编码，之后复用"""
+        if self._summary_json is None:
+            self._summary_json = json.dumps(self.summary).encode('utf-8')
+        return self._summary_json
+
+    def detail_json(self):
+        """detail 的 JSON bytes，首次使用时编码，之后复用"""
+        if self._detail_json is None:
+            self._detail_json = json.dumps(self.detail).encode('utf-8')
+        return self._detail_json
+
+
+class RoomSnapshot:
+    """带版本号的全部房间信息。发布后不再修改，读者只需取得引用，无需加锁。
+
+    未变化的房间在相邻版本之间共享同一个 RoomView，其中的字典不得修改。"""
+    __slots__ = ("version", "rooms", "views")
+
+    def __init__(self, version, rooms, views):
+        self.version = version
+        self.rooms = rooms  # tuple，元素为各房间的 summary
+        self.views = views  # roomId -> RoomView
+
+
+_snapshot = RoomSnapshot(0, (), {})
+
+def attach_room_loop(loop):
+    """把房间交给 loop 管理，需要在 loop 所在线程中调用。
+    此后其他线程的修改都转到 loop 中执行，同一轮事件循环内的多次修改合并为一个快照版本"""
+    global _room_loop, _room_loop_thread
+    _room_loop = loop
+    _room_loop_thread = threading.get_ident() if loop is not None else None
+
+def call_in_room_loop(func, *args, **kwargs):
+    """在房间所属的事件循环中执行 func(*args, **kwargs) 并返回结果（可在任意线程调用）。
+    未设置事件循环或已在其线程中时直接调用；等待超过 ROOM_CALL_TIMEOUT 秒时抛出 TimeoutError"""
+    loop = _room_loop
+    if loop is None or threading.get_ident() == _room_loop_thread:
+        return func(*args, **kwargs)
+    future = concurrent.futures.Future()
+
+    def run(call):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(call())
+        except BaseException as e:
+            future.set_exception(e)
+
+    loop.call_soon_threadsafe(run, functools.partial(func, *args, **kwargs))
+    try:
+        return future.result(ROOM_CALL_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        # 还没开始执行的话就不再执行
+        future.cancel()
+        raise TimeoutError(f"Room loop did not run {func.__name__} within {ROOM_CALL_TIMEOUT}s")
+
+def room_mutation(func):
+    """修改房间的函数：从其他线程（例如 admin 的请求线程）调用时转到房间事件循环中执行"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return call_in_room_loop(func, *args, **kwargs)
+    return wrapper
+
+def mark_room_dirty(roomId):
+    """记录房间已修改，安排发布新快照（可在任意线程调用）"""
+    global _publish_scheduled
+    _dirty_rooms[roomId] = None
+    if _room_loop is not None and not _publish_scheduled:
+        _publish_scheduled = True
+        _room_loop.call_soon_threadsafe(publish_snapshot)
+
+def publish_snapshot():
+    """重建已修改房间的 RoomView 并发布新版本快照"""
+    global _snapshot, _publish_scheduled
+    _publish_scheduled = False
+    if not _dirty_rooms:
+        return _snapshot
+    version = _snapshot.version + 1
+    for room_id in list(_dirty_rooms):
+        del _dirty_rooms[room_id]
+        room = rooms.get(room_id)
+        if room is None:
+            _room_views.pop(room_id, None)
+        else:
+            _room_views[room_id] = RoomView(version, room_summary(room_id, room), _room_detail(room_id, room))
+    _snapshot = RoomSnapshot(version, tuple(view.summary for view in _room_views.values()), dict(_room_views))
+    return _snapshot
+
+def get_room_snapshot():
+    """获取当前房间快照，O(1)"""
+    if _room_loop is None and _dirty_rooms:
+        return publish_snapshot()
+    return _snapshot
 
 # 初始化监控列表
 monitors = [] # 先初始化为空列表
@@ -37,25 +217,29 @@ except FileNotFoundError:
     logger.warning("monitors.txt not found. No monitors loaded.")
 
 
+@room_mutation
 def create_room(roomId, user_info):
     """Create a room with the given ID.
     房间创建返回定义:
     0: 成功
     1: 房间已存在
     2: 玩家已在房间内"""
-    # [修复] 变量覆盖：将循环变量 roomId 改为 existing_room_id，避免覆盖参数 roomId
-    for existing_room_id, room in rooms.items():
-        if user_info.id in room.users:
-            return {"status": "2"}
+    # 【修改】通过索引判断玩家是否已在房间内
+    if user_info.id in user_room_index:
+        return {"status": "2"}
 
     if roomId in rooms:                 # 已存在
         return {"status": "1"}
     rooms[roomId] = Room(roomId)       # 初始化并放入字典
     # 设置房主
     rooms[roomId].host = user_info.id
+    mark_room_dirty(roomId)
+    if room_listeners:
+        notify_room_listeners("create", roomId, room=room_summary(roomId, rooms[roomId]))
     
     return {"status": "0"}
 
+@room_mutation
 def destroy_room(roomId):
     """Destroy the room with the given ID.
     房间销毁返回定义:
@@ -63,10 +247,16 @@ def destroy_room(roomId):
     1: 房间不存在"""
     if roomId not in rooms:            # 房间不存在
         return {"status": "1"}
-    del rooms[roomId]
+    room = rooms.pop(roomId)
+    # 【新增】同步清理索引中仍指向该房间的用户
+    for user_id in room.users:
+        if user_room_index.get(user_id) == roomId:
+            del user_room_index[user_id]
+    notify_room_listeners("destroy", roomId)
     
     return {"status": "0"}
 
+@room_mutation
 def add_user(roomId, user_info, connection):
     """Add a user to the room.
     返回定义:
@@ -76,12 +266,11 @@ def add_user(roomId, user_info, connection):
     3: 房间已锁定"""
     logger.info(f"{user_info.id} 正在加入房间 {roomId}")
     
-    # [修复] 变量覆盖：将循环变量 roomId 改为 existing_room_id
-    for existing_room_id, room in rooms.items():
-        if user_info.id in room.users:
-            # 注意：这里的 status 3 在原始定义中是"房间已锁定"，但逻辑是在检查"玩家是否已在其他房间"
-            # 根据上下文，这里可能想返回类似"玩家忙"的状态，保留原逻辑 status 3
-            return {"status": "3"}
+    # 【修改】通过索引判断玩家是否已在其他房间
+    if user_info.id in user_room_index:
+        # 注意：这里的 status 3 在原始定义中是"房间已锁定"，但逻辑是在检查"玩家是否已在其他房间"
+        # 根据上下文，这里可能想返回类似"玩家忙"的状态，保留原逻辑 status 3
+        return {"status": "3"}
             
     if roomId not in rooms:            # 房间不存在
         logger.warning(f"{user_info.id} 试图加入不存在的房间 {roomId}")
@@ -94,8 +283,11 @@ def add_user(roomId, user_info, connection):
         return {"status": "3"}
     # 【修改】现在存储 RoomUser 实例，而不是直接存储 user_info
     rooms[roomId].users[user_info.id] = RoomUser(user_info, connection)
+    user_room_index[user_info.id] = roomId
+    notify_room_listeners("join", roomId, user={"id": user_info.id, "name": user_info.name})
     return {"status": "0"}
 
+@room_mutation
 def add_monitor(roomId, monitor_id):
     """Add a monitor to the room.
     返回定义:
@@ -113,6 +305,7 @@ def add_monitor(roomId, monitor_id):
     # 设置live为True
     if not rooms[roomId].live:
         rooms[roomId].live = True
+    notify_room_listeners("update", roomId, changes={"live": True, "monitorCount": len(rooms[roomId].monitors)})
     return {"status": "0"}
 
 def get_host(roomId):
@@ -130,12 +323,13 @@ def get_roomId(user_id):
     返回定义:
     0: 成功
     1: 用户不存在"""
-    # [优化] 虽然这里没有覆盖参数，但为了统一代码风格，将循环变量改为 r_id
-    for r_id, room in rooms.items():
-        if user_id in room.users:
-            return {"roomId": r_id}
+    # 【修改】直接查索引，O(1)
+    r_id = user_room_index.get(user_id)
+    if r_id is not None:
+        return {"roomId": r_id}
     return {"status": "1"}
 
+@room_mutation
 def change_host(roomId, host_id):
     """Change the host of the room.
     返回定义:
@@ -147,8 +341,10 @@ def change_host(roomId, host_id):
     if host_id not in rooms[roomId].users: # 新房主不存在
         return {"status": "2"}
     rooms[roomId].host = host_id
+    notify_room_listeners("update", roomId, changes={"host": host_id})
     return {"status": "0"}
 
+@room_mutation
 def room_lock_state_change(roomId):
     """Lock the room.
     返回定义:
@@ -157,12 +353,21 @@ def room_lock_state_change(roomId):
     if roomId not in rooms:            # 房间不存在
         return {"status": "1"}
     #如果原来这个房间被锁定
-    if rooms[roomId].locked:
-        rooms[roomId].locked = False
-    else:
-        rooms[roomId].locked = True
+    return set_lock(roomId, not rooms[roomId].locked)
+
+@room_mutation
+def set_lock(roomId, locked):
+    """Set the lock state of the room.
+    返回定义:
+    0: 成功
+    1: 房间不存在"""
+    if roomId not in rooms:            # 房间不存在
+        return {"status": "1"}
+    rooms[roomId].locked = locked
+    notify_room_listeners("update", roomId, changes={"locked": locked})
     return {"status": "0"}
 
+@room_mutation
 def set_state(roomId, state):
     """Set the state of the room.
     返回定义:
@@ -171,8 +376,10 @@ def set_state(roomId, state):
     if roomId not in rooms:            # 房间不存在
         return {"status": "1"}
     rooms[roomId].state = state
+    notify_room_listeners("update", roomId, changes={"state": type(state).__name__})
     return {"status": "0"}
 
+@room_mutation
 def set_cycle_mode(roomId, cycle):
     """Set the cycle mode of the room.
     返回定义:
@@ -181,8 +388,10 @@ def set_cycle_mode(roomId, cycle):
     if roomId not in rooms:            # 房间不存在
         return {"status": "1"}
     rooms[roomId].cycle = cycle
+    notify_room_listeners("update", roomId, changes={"cycle": cycle})
     return {"status": "0"}
 
+@room_mutation
 def set_chart(roomId, chart):
     """Set the chart of the room.
     返回定义:
@@ -191,10 +400,11 @@ def set_chart(roomId, chart):
     if roomId not in rooms:            # 房间不存在
         return {"status": "1"}
     rooms[roomId].chart = chart
-    #改变状态为SelectChart
-    set_state(roomId, SelectChart(chartId=chart))
+    notify_room_listeners("update", roomId, changes={"chart": chart})
+    # 【修改】不再在这里切换到 SelectChart，状态切换统一由 room_state.room_state_machine 完成
     return {"status": "0"}
 
+@room_mutation
 def player_leave(roomId, user_id):
     """Remove a user from the room.
     返回定义:
@@ -206,9 +416,17 @@ def player_leave(roomId, user_id):
     if user_id not in rooms[roomId].users: # 用户不存在
         return {"status": "2"}
     # 【修改】使用 del 从字典中删除用户
-    del rooms[roomId].users[user_id]
+    room = rooms[roomId]
+    del room.users[user_id]
+    # 离开的用户不再计入准备/完成人数
+    room.ready.discard(user_id)
+    room.finished.discard(user_id)
+    if user_room_index.get(user_id) == roomId:
+        del user_room_index[user_id]
+    notify_room_listeners("leave", roomId, userId=user_id)
     return {"status": "0"}
 
+@room_mutation
 def monitor_leave(roomId, monitor_id):
     """Remove a monitor from the room.
     返回定义:
@@ -220,6 +438,7 @@ def monitor_leave(roomId, monitor_id):
     if monitor_id not in rooms[roomId].monitors: # 监控不存在
         return {"status": "2"}
     rooms[roomId].monitors.remove(monitor_id)
+    notify_room_listeners("update", roomId, changes={"monitorCount": len(rooms[roomId].monitors)})
     return {"status": "0"}
 
 # 【修改】is_monitor 函数定义和逻辑
@@ -246,6 +465,27 @@ def get_connections(roomId):
         connections.append(rooms[roomId].users[user_id].connection)
     return {"status": "0", "connections": connections}
 
+def broadcast_to_room(roomId, packet, exclude=None):
+    """Broadcast a packet to every user in the room, encoding it only once.
+    返回定义:
+    0: 成功
+    1: 房间不存在"""
+    if roomId not in rooms:            # 房间不存在
+        return {"status": "1"}
+    sent = broadcast([user.connection for user in rooms[roomId].users.values()], packet, exclude)
+    return {"status": "0", "sent": sent}
+
+# 【新增】
+def broadcast_encoded_to_room(roomId, data, exclude=None):
+    """Send an already encoded frame to every user in the room.
+    返回定义:
+    0: 成功
+    1: 房间不存在"""
+    if roomId not in rooms:            # 房间不存在
+        return {"status": "1"}
+    sent = broadcast_encoded([user.connection for user in rooms[roomId].users.values()], data, exclude)
+    return {"status": "0", "sent": sent}
+
 def get_room_state(roomId):
     """Get the state of the room.
     返回定义:
@@ -282,6 +522,7 @@ def is_live(roomId):
         return {"status": "1"}
     return {"status": "0", "isLive": rooms[roomId].live}
 
+@room_mutation
 def set_ready(roomId, user_id):
     """Set a user as ready in the room.
     返回定义:
@@ -293,10 +534,12 @@ def set_ready(roomId, user_id):
     if user_id not in rooms[roomId].users: # 用户不存在
         return {"status": "2"}
     #设置用户为准备好
-    #这里把用户的id放进ready字典
-    rooms[roomId].ready[user_id] = True
+    #这里把用户的id放进ready集合
+    rooms[roomId].ready.add(user_id)
+    mark_room_dirty(roomId)
     return {"status": "0"}
 
+@room_mutation
 def cancel_ready(roomId, user_id):
     """Cancel a user's ready status in the room.
     返回定义:
@@ -308,10 +551,12 @@ def cancel_ready(roomId, user_id):
     if user_id not in rooms[roomId].users: # 用户不存在
         return {"status": "2"}
     #取消用户的ready状态
-    #这里把用户的id从ready字典中移除
-    del rooms[roomId].ready[user_id]
+    #这里把用户的id从ready集合中移除
+    rooms[roomId].ready.discard(user_id)
+    mark_room_dirty(roomId)
     return {"status": "0"}
 
+@room_mutation
 def set_finished(roomId, user_id):
     """Set a user as finished in the room.
     返回定义:
@@ -323,10 +568,12 @@ def set_finished(roomId, user_id):
     if user_id not in rooms[roomId].users: # 用户不存在
         return {"status": "2"}
     #设置用户为完成
-    #这里把用户的id放进finished字典
-    rooms[roomId].finished[user_id] = True
+    #这里把用户的id放进finished集合
+    rooms[roomId].finished.add(user_id)
+    mark_room_dirty(roomId)
     return {"status": "0"}
 
+@room_mutation
 def cancel_finished(roomId, user_id):
     """Cancel a user's finished status in the room.
     返回定义:
@@ -338,8 +585,33 @@ def cancel_finished(roomId, user_id):
     if user_id not in rooms[roomId].users: # 用户不存在
         return {"status": "2"}
     #取消用户的finished状态
-    #这里把用户的id从finished字典中移除
-    del rooms[roomId].finished[user_id]
+    #这里把用户的id从finished集合中移除
+    rooms[roomId].finished.discard(user_id)
+    mark_room_dirty(roomId)
+    return {"status": "0"}
+
+@room_mutation
+def clear_ready(roomId):
+    """Clear the ready status of every user in the room.
+    返回定义:
+    0: 成功
+    1: 房间不存在"""
+    if roomId not in rooms:            # 房间不存在
+        return {"status": "1"}
+    rooms[roomId].ready.clear()
+    mark_room_dirty(roomId)
+    return {"status": "0"}
+
+@room_mutation
+def clear_finished(roomId):
+    """Clear the finished status of every user in the room.
+    返回定义:
+    0: 成功
+    1: 房间不存在"""
+    if roomId not in rooms:            # 房间不存在
+        return {"status": "1"}
+    rooms[roomId].finished.clear()
+    mark_room_dirty(roomId)
     return {"status": "0"}
 
 #---群体操作---
@@ -349,13 +621,12 @@ def get_rooms_of_user(user_id):
     返回定义:
     0: 成功"""
     #TODO:1:用户不存在
-    rooms_of_user = []
-    # [优化] 将循环变量改为 r_id，避免未来可能的混淆
-    for r_id in rooms:
-        if user_id in rooms[r_id].users:
-            rooms_of_user.append(r_id)
+    # 【修改】一个用户同时只能在一个房间内，直接查索引
+    r_id = user_room_index.get(user_id)
+    rooms_of_user = [r_id] if r_id is not None else []
     return {"status": "0", "rooms": rooms_of_user}
 
+@room_mutation
 def remove_user_from_all_rooms(user_id):
     """Remove a user from all rooms.
     返回定义:
@@ -364,16 +635,16 @@ def remove_user_from_all_rooms(user_id):
     
     user_was_in_a_room = False # 标志，用于判断用户是否至少从一个房间被移除了
     
-    # 遍历所有房间的 ID
-    # 使用 list(rooms.keys()) 是为了在遍历时避免字典结构被修改可能导致的问题
-    # [优化] 将循环变量改为 r_id
-    for r_id in list(rooms.keys()):
-        # 调用 player_leave 尝试从当前房间移除用户
+    # 【修改】通过索引找到用户所在的房间，不再遍历所有房间
+    r_id = user_room_index.get(user_id)
+    if r_id is not None:
+        # 调用 player_leave 从该房间移除用户（同时会清理索引）
         result = player_leave(r_id, user_id)
-        
-        # 如果 player_leave 返回状态 0 (成功移除)
         if result.get("status") == "0":
-            user_was_in_a_room = True # 标记为 True，表示用户至少在一个房间中被发现并移除了
+            user_was_in_a_room = True
+        else:
+            # 索引指向的房间已不存在或用户不在其中，清理脏数据
+            user_room_index.pop(user_id, None)
             
     if user_was_in_a_room:
         return {"status": "0"} # 用户至少从一个房间被移除，视为成功
@@ -382,31 +653,56 @@ def remove_user_from_all_rooms(user_id):
         return {"status": "1"} # 用户不存在于任何房间
 
 
+def check_user_room_index():
+    """检查 user_room_index 与 rooms 中的实际成员是否一致（用于调试）。
+    返回定义:
+    0: 一致
+    1: 不一致，errors 中列出问题"""
+    errors = []
+    seen = {}
+    for r_id, room in rooms.items():
+        for user_id in room.users:
+            if user_id in seen:
+                errors.append(f"user {user_id} is in both room {seen[user_id]} and room {r_id}")
+            seen[user_id] = r_id
+            indexed = user_room_index.get(user_id)
+            if indexed != r_id:
+                errors.append(f"user {user_id} is in room {r_id} but indexed as {indexed}")
+    for user_id, r_id in user_room_index.items():
+        if user_id not in seen:
+            errors.append(f"user {user_id} indexed as room {r_id} but not in any room")
+    if errors:
+        return {"status": "1", "errors": errors}
+    return {"status": "0"}
+
+
+def room_summary(room_id, room):
+    """房间列表中单个房间的信息（/api/rooms 与房间事件流共用）"""
+    users_info = {}
+    for user_id, user in room.users.items():
+        users_info[user_id] = {
+            "id": user.info.id,
+            "name": user.info.name
+        }
+    return {
+        "roomId": room_id,
+        "host": room.host,
+        "state": str(type(room.state).__name__),
+        "locked": room.locked,
+        "live": room.live,
+        "cycle": room.cycle,
+        "userCount": len(room.users),
+        "monitorCount": len(room.monitors),
+        "chart": room.chart,
+        "users": users_info
+    }
+
+
 def get_all_rooms():
     """Get all rooms information.
-    返回所有房间的详细信息，包括房间ID、状态、人数等"""
-    rooms_info = []
-    for room_id, room in rooms.items():
-        users_info = {}
-        for user_id, user in room.users.items():
-            users_info[user_id] = {
-                "id": user.info.id,
-                "name": user.info.name
-            }
-        room_info = {
-            "roomId": room_id,
-            "host": room.host,
-            "state": str(type(room.state).__name__),
-            "locked": room.locked,
-            "live": room.live,
-            "cycle": room.cycle,
-            "userCount": len(room.users),
-            "monitorCount": len(room.monitors),
-            "chart": room.chart,
-            "users": users_info
-        }
-        rooms_info.append(room_info)
-    return {"status": "0", "rooms": rooms_info}
+    返回所有房间的详细信息，包括房间ID、状态、人数等
+    【修改】直接取当前快照，不再遍历 rooms 重建；返回的房间字典是共享的，不要修改"""
+    return {"status": "0", "rooms": list(get_room_snapshot().rooms)}
 
 
 def get_room_detail(roomId):
@@ -414,10 +710,14 @@ def get_room_detail(roomId):
     返回定义:
     0: 成功
     1: 房间不存在"""
-    if roomId not in rooms:
+    view = get_room_snapshot().views.get(roomId)
+    if view is None:
         return {"status": "1"}
-    
-    room = rooms[roomId]
+    return {"status": "0", "room": view.detail}
+
+
+def _room_detail(roomId, room):
+    """房间详情（/api/room/<id>），发布快照时生成"""
     users_info = []
     for user_id, user in room.users.items():
         users_info.append({
@@ -433,16 +733,17 @@ def get_room_detail(roomId):
         "live": room.live,
         "cycle": room.cycle,
         "users": users_info,
-        "monitors": room.monitors,
+        "monitors": list(room.monitors),
         "chart": room.chart,
         "readyCount": len(room.ready),
         "finishedCount": len(room.finished)
     }
     
-    return {"status": "0", "room": room_detail}
+    return room_detail
 
 #---管理员操作函数---
 
+@room_mutation
 def admin_force_destroy_room(roomId):
     """管理员强制解散房间
     返回定义:
@@ -463,16 +764,14 @@ def admin_force_destroy_room(roomId):
     from rymc.phira.protocol.packet.clientbound import ClientBoundMessagePacket
     from rymc.phira.protocol.data.message import AbortMessage
     
-    for conn in connections:
-        if conn:
-            try:
-                packet = ClientBoundMessagePacket(AbortMessage("房间已被管理员解散"))
-                conn.send(packet)
-            except Exception as e:
-                logger.error(f"Failed to send abort message: {e}")
+    try:
+        broadcast(connections, ClientBoundMessagePacket(AbortMessage("房间已被管理员解散")))
+    except Exception as e:
+        logger.error(f"Failed to send abort message: {e}")
     
     return result
 
+@room_mutation
 def admin_force_kick_player(roomId, user_id):
     """管理员强制踢出玩家
     返回定义:
@@ -507,15 +806,14 @@ def admin_force_kick_player(roomId, user_id):
     from rymc.phira.protocol.data import UserProfile
     
     packet = ClientBoundMessagePacket(LeaveRoomMessage(user_id, "Unknown"))
-    for _, room_user in rooms[roomId].users.items():
-        if room_user.connection != player_connection:
-            try:
-                room_user.connection.send(packet)
-            except Exception as e:
-                logger.error(f"Failed to send leave message: {e}")
+    try:
+        broadcast_to_room(roomId, packet, exclude=player_connection)
+    except Exception as e:
+        logger.error(f"Failed to send leave message: {e}")
     
     return result
 
+@room_mutation
 def admin_force_ready(roomId, user_id):
     """管理员强制玩家准备
     返回定义:
@@ -532,15 +830,16 @@ def admin_force_ready(roomId, user_id):
     result = set_ready(roomId, user_id)
     
     # 通知房间内所有玩家
-    from rymc.phira.protocol.packet.clientbound import ClientBoundReadyPacket
+    from rymc.phira.protocol.packet.clientbound import ClientBoundMessagePacket
+    from rymc.phira.protocol.data.message import ReadyMessage
     
     if result["status"] == "0":
-        packet = ClientBoundReadyPacket(user_id, True)
-        for _, room_user in rooms[roomId].users.items():
-            try:
-                room_user.connection.send(packet)
-            except Exception as e:
-                logger.error(f"Failed to send ready message: {e}")
+        # 【修改】与玩家自己准备时一样广播 ReadyMessage（ClientBoundReadyPacket 是对请求者的应答，不接受参数）
+        packet = ClientBoundMessagePacket(ReadyMessage(user_id))
+        try:
+            broadcast_to_room(roomId, packet)
+        except Exception as e:
+            logger.error(f"Failed to send ready message: {e}")
     
     return result
 
@@ -0,0 +1,233 @@
+"""房间搜索索引。
+
+作为 room.py 的房间监听器，随房间的创建、解散、成员进出和状态变化增量更新，
+``/api/rooms/search`` 查询时只接触符合条件的房间：
+
+- roomId：房间号所有长度不超过 NGRAM 的子串 -> 房间集合。查询不超过 NGRAM
+  个字符时直接取集合，更长时取各个 NGRAM 子串集合的交集后再核对子串
+- state：状态名 -> 房间集合
+- locked / live：为 True 的房间集合
+- userCount：人数 -> 房间集合（人数的取值很少，范围查询合并几个集合即可）
+
+结果按 roomId / userCount / created（创建顺序）排序，用游标分页。
+"""
+
+import base64
+import json
+
+from room import add_room_listener
+
+NGRAM = 3
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+SORT_KEYS = ("roomId", "userCount", "created")
+
+
+def ngrams(text, size):
+    """text 中所有长度为 size 的子串"""
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class RoomSearchIndex:
+
+    def __init__(self):
+        # roomId -> [state, locked, live, userCount, created]
+        self.entries = {}
+        self.by_gram = {}
+        self.by_state = {}
+        self.by_count = {}
+        self.locked = set()
+        self.live = set()
+        self.created = 0
+
+    # ---- 维护 ----
+    def on_room_event(self, event, roomId, fields):
+        if event == "create":
+            self._add(roomId, fields["room"])
+        elif event == "destroy":
+            self._remove(roomId)
+        elif roomId not in self.entries:
+            return
+        elif event == "join":
+            self._set_count(roomId, self.entries[roomId][3] + 1)
+        elif event == "leave":
+            self._set_count(roomId, self.entries[roomId][3] - 1)
+        elif event == "update":
+            changes = fields["changes"]
+            if "state" in changes:
+                self._set_state(roomId, changes["state"])
+            if "locked" in changes:
+                self._set_flag(self.locked, roomId, changes["locked"])
+            if "live" in changes:
+                self._set_flag(self.live, roomId, changes["live"])
+
+    def _add(self, roomId, summary):
+        if roomId in self.entries:
+            self._remove(roomId)
+        self.created += 1
+        self.entries[roomId] = [None, False, False, None, self.created]
+        for size in range(1, NGRAM + 1):
+            for gram in ngrams(roomId, size):
+                self.by_gram.setdefault(gram, set()).add(roomId)
+        self._set_state(roomId, summary["state"])
+        self._set_flag(self.locked, roomId, summary["locked"])
+        self._set_flag(self.live, roomId, summary["live"])
+        self._set_count(roomId, summary["userCount"])
+
+    def _remove(self, roomId):
+        entry = self.entries.pop(roomId, None)
+        if entry is None:
+            return
+        for size in range(1, NGRAM + 1):
+            for gram in ngrams(roomId, size):
+                self._discard(self.by_gram, gram, roomId)
+        self._discard(self.by_state, entry[0], roomId)
+        self._discard(self.by_count, entry[3], roomId)
+        self.locked.discard(roomId)
+        self.live.discard(roomId)
+
+    def _set_state(self, roomId, state):
+        entry = self.entries[roomId]
+        if entry[0] == state:
+            return
+        self._discard(self.by_state, entry[0], roomId)
+        entry[0] = state
+        self.by_state.setdefault(state, set()).add(roomId)
+
+    def _set_count(self, roomId, count):
+        entry = self.entries[roomId]
+        if entry[3] == count:
+            return
+        self._discard(self.by_count, entry[3], roomId)
+        entry[3] = count
+        self.by_count.setdefault(count, set()).add(roomId)
+
+    def _set_flag(self, flagged, roomId, value):
+        self.entries[roomId][1 if flagged is self.locked else 2] = bool(value)
+        if value:
+            flagged.add(roomId)
+        else:
+            flagged.discard(roomId)
+
+    @staticmethod
+    def _discard(buckets, key, roomId):
+        bucket = buckets.get(key)
+        if bucket is not None:
+            bucket.discard(roomId)
+            if not bucket:
+                del buckets[key]
+
+    # ---- 查询 ----
+    def match(self, roomId=None, state=None, locked=None, live=None, min_users=None, max_users=None):
+        """返回符合全部条件的房间号集合"""
+        candidates = []
+        if roomId:
+            candidates.append(self._match_room_id(roomId))
+        if state:
+            candidates.append(self.by_state.get(state, set()))
+        if min_users is not None or max_users is not None:
+            low = min_users if min_users is not None else float("-inf")
+            high = max_users if max_users is not None else float("inf")
+            candidates.append(set().union(*(rooms for count, rooms in self.by_count.items()
+                                             if low <= count <= high)))
+        if candidates:
+            # 从最小的集合开始求交集
+            candidates.sort(key=len)
+            result = set(candidates[0])
+            for other in candidates[1:]:
+                result &= other
+        elif locked:
+            result = set(self.locked)
+        elif live:
+            result = set(self.live)
+        else:
+            result = set(self.entries)
+        if locked is not None:
+            result = result & self.locked if locked else result - self.locked
+        if live is not None:
+            result = result & self.live if live else result - self.live
+        return result
+
+    def _match_room_id(self, query):
+        if len(query) <= NGRAM:
+            return self.by_gram.get(query, set())
+        postings = sorted((self.by_gram.get(gram, set()) for gram in ngrams(query, NGRAM)), key=len)
+        result = set(postings[0])
+        for other in postings[1:]:
+            result &= other
+        return {roomId for roomId in result if query in roomId}
+
+    def sort_key(self, sort):
+        if sort == "roomId":
+            return lambda roomId: (roomId, roomId)
+        column = 3 if sort == "userCount" else 4
+        entries = self.entries
+        return lambda roomId: (entries[roomId][column], roomId)
+
+    def search(self, params):
+        """按 /api/rooms/search 的参数查询，返回 (本页房间号列表, 总数, 下一页游标)。
+        参数不合法时抛出 ValueError"""
+        sort = params.get("sort", "roomId")
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key {sort!r}")
+        descending = params.get("order", "asc") == "desc"
+        limit = params.get("limit", DEFAULT_LIMIT)
+        if not isinstance(limit, int) or isinstance(limit, bool) or limit <= 0:
+            raise ValueError("limit must be a positive integer")
+        limit = min(limit, MAX_LIMIT)
+
+        matched = self.match(
+            roomId=_optional(params, "roomId", str),
+            state=_optional(params, "state", str),
+            locked=_optional(params, "locked", bool),
+            live=_optional(params, "live", bool),
+            min_users=_optional(params, "minUsers", int),
+            max_users=_optional(params, "maxUsers", int),
+        )
+        key = self.sort_key(sort)
+        ordered = sorted(matched, key=key, reverse=descending)
+
+        start = 0
+        cursor = params.get("cursor")
+        if cursor:
+            after = decode_cursor(cursor)
+            try:
+                if descending:
+                    start = next((i for i, roomId in enumerate(ordered) if key(roomId) < after), len(ordered))
+                else:
+                    start = next((i for i, roomId in enumerate(ordered) if key(roomId) > after), len(ordered))
+            except TypeError as e:
+                # 游标来自另一种排序方式
+                raise ValueError("Cursor does not match sort key") from e
+        page = ordered[start:start + limit]
+        next_cursor = None
+        if start + limit < len(ordered):
+            next_cursor = encode_cursor(key(page[-1]))
+        return page, len(ordered), next_cursor
+
+
+def _optional(params, name, kind):
+    value = params.get(name)
+    if value is None or value == "":
+        return None
+    if kind is int and isinstance(value, bool) or not isinstance(value, kind):
+        raise ValueError(f"{name} must be {kind.__name__}")
+    return value
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, AttributeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(key, list) or len(key) != 2:
+        raise ValueError("Invalid cursor")
+    return tuple(key)
+
+
+room_search_index = RoomSearchIndex()
+add_room_listener(room_search_index.on_room_event)
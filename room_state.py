@@ -0,0 +1,167 @@
+"""房间状态机。
+
+房间状态只能按 TRANSITIONS 中的转换表切换：
+
+- SelectChart -> SelectChart（换谱面）/ WaitForReady（房主开始）
+- WaitForReady -> SelectChart（房主取消）/ Playing（全部准备）
+- Playing -> SelectChart（全部完成）
+
+状态对象是共享的不可变单例（SelectChart 按谱面 ID 缓存），每个状态对应的
+ClientBoundChangeStatePacket 也只编码一次。每次切换后依次调用转换钩子
+hook(roomId, old_state, new_state)；广播状态包就是其中一个钩子，其他模块
+（统计、持久化等）用 add_transition_hook 订阅即可。
+"""
+
+import logging
+from collections import Counter
+
+from cachetools import LRUCache
+
+from room import INITIAL_STATE, broadcast_encoded_to_room, call_in_room_loop, rooms, set_chart, set_state
+from rymc.phira.protocol import PacketRegistry
+from rymc.phira.protocol.data.state import Playing, SelectChart, WaitForReady
+from rymc.phira.protocol.packet.clientbound import ClientBoundChangeStatePacket
+
+logger = logging.getLogger(__name__)
+
+# 状态类型 -> 可以切换到的状态类型
+TRANSITIONS = {
+    SelectChart: (SelectChart, WaitForReady),
+    WaitForReady: (SelectChart, Playing),
+    Playing: (SelectChart,),
+}
+
+# 缓存多少个谱面的 SelectChart 状态
+CHART_STATE_CACHE_SIZE = 1024
+
+WAIT_FOR_READY = WaitForReady()
+PLAYING = Playing()
+
+
+def encode_state(state):
+    """编码 state 对应的 ClientBoundChangeStatePacket 帧"""
+    return PacketRegistry.encode_to_bytes(ClientBoundChangeStatePacket(state))
+
+
+class StateCache:
+    """共享的状态实例及其预编码的状态切换帧"""
+
+    def __init__(self):
+        # 状态类型 -> (实例, 帧)
+        self.fixed = {
+            WaitForReady: (WAIT_FOR_READY, encode_state(WAIT_FOR_READY)),
+            Playing: (PLAYING, encode_state(PLAYING)),
+        }
+        # 谱面 ID -> (SelectChart 实例, 帧)
+        self.charts = LRUCache(maxsize=CHART_STATE_CACHE_SIZE)
+        self.charts[None] = (INITIAL_STATE, encode_state(INITIAL_STATE))
+        self.encodes = len(self.fixed) + 1
+
+    def _chart_entry(self, chartId):
+        entry = self.charts.get(chartId)
+        if entry is None:
+            state = SelectChart(chartId=chartId)
+            entry = (state, encode_state(state))
+            self.charts[chartId] = entry
+            self.encodes += 1
+        return entry
+
+    def select_chart(self, chartId):
+        """chartId 对应的共享 SelectChart 实例"""
+        return self._chart_entry(chartId)[0]
+
+    def frame(self, state):
+        """state 对应的已编码 ClientBoundChangeStatePacket 帧"""
+        if type(state) is SelectChart:
+            return self._chart_entry(state.chartId)[1]
+        return self.fixed[type(state)][1]
+
+
+state_cache = StateCache()
+
+
+class RoomStateMachine:
+
+    def __init__(self):
+        self.hooks = []
+        # "旧状态->新状态" -> 次数
+        self.transitions = Counter()
+        self.rejected = 0
+
+    def add_transition_hook(self, hook):
+        """订阅状态切换：hook(roomId, old_state, new_state)，在房间事件循环中调用"""
+        if hook not in self.hooks:
+            self.hooks.append(hook)
+
+    def remove_transition_hook(self, hook):
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    def in_state(self, roomId, kind):
+        """房间当前是否处于 kind 状态（房间不存在时为 False）"""
+        room = rooms.get(roomId)
+        return room is not None and type(room.state) is kind
+
+    def can_transition(self, roomId, kind):
+        """房间当前能否切换到 kind 状态（房间不存在时为 False）"""
+        room = rooms.get(roomId)
+        return room is not None and kind in TRANSITIONS[type(room.state)]
+
+    def transition(self, roomId, kind):
+        """把房间切换到 WaitForReady 或 Playing（SelectChart 用 select_chart）。
+        返回定义:
+        0: 成功
+        1: 房间不存在
+        2: 转换表不允许这次切换"""
+        return call_in_room_loop(self._transition, roomId, state_cache.fixed[kind][0])
+
+    def select_chart(self, roomId, chartId):
+        """设置房间谱面并切换到 SelectChart，返回值同 transition"""
+        return call_in_room_loop(self._select_chart, roomId, chartId)
+
+    def _select_chart(self, roomId, chartId):
+        if roomId not in rooms:
+            return {"status": "1"}
+        if not self.can_transition(roomId, SelectChart):
+            return self._reject(roomId, SelectChart)
+        set_chart(roomId, chartId)
+        return self._transition(roomId, state_cache.select_chart(chartId))
+
+    def _transition(self, roomId, state):
+        room = rooms.get(roomId)
+        if room is None:
+            return {"status": "1"}
+        old_state = room.state
+        if type(state) not in TRANSITIONS[type(old_state)]:
+            return self._reject(roomId, type(state))
+        set_state(roomId, state)
+        self.transitions[f"{type(old_state).__name__}->{type(state).__name__}"] += 1
+        for hook in self.hooks:
+            try:
+                hook(roomId, old_state, state)
+            except Exception as e:
+                logger.error(f"Room state hook failed on {roomId}: {e}")
+        return {"status": "0"}
+
+    def _reject(self, roomId, kind):
+        self.rejected += 1
+        logger.warning(f"Rejected state change of room {roomId}: "
+                       f"{type(rooms[roomId].state).__name__} -> {kind.__name__}")
+        return {"status": "2"}
+
+    def get_stats(self):
+        return {
+            "transitions": dict(self.transitions),
+            "rejected": self.rejected,
+            "encodedFrames": state_cache.encodes,
+            "cachedCharts": len(state_cache.charts),
+        }
+
+
+def broadcast_state_change(roomId, old_state, new_state):
+    """转换钩子：把预编码的状态切换帧发给房间内所有人"""
+    broadcast_encoded_to_room(roomId, state_cache.frame(new_state))
+
+
+room_state_machine = RoomStateMachine()
+room_state_machine.add_transition_hook(broadcast_state_change)
@@ -10,6 +10,8 @@ mapping client-bound packet classes to their identifier.
 When adding new packet types, ensure that they are registered in the
 appropriate dictionary. The ordering of class checks when encoding is
 important: Python's ``issubclass`` is used to account for inheritance.
+The result of that scan is cached per concrete class (including the
+``Failed``/``Success`` variants), so each class is resolved only once.
 """
 
 from __future__ import annotations
@@ -113,6 +115,12 @@ class PacketRegistry:
         ClientBoundAbortPacket: 0x13,
     }
 
+    # Cache from concrete client-bound packet class to its resolved packet ID.
+    _resolved_packet_ids: Dict[type, int] = {}
+
+    # Bytes reserved in front of the packet body for the VarInt length prefix.
+    _FRAME_HEADER_SIZE = 5
+
     @staticmethod
     def decode(buf: ByteBuf) -> ServerBoundPacket:
         """Decode a server-bound packet from the given buffer.
@@ -149,20 +157,67 @@ class PacketRegistry:
 
         :param packet: the packet to encode
         :raises CodecException: if the packet class is not registered
-        :return: a read-only :class:`ByteBuf` containing the encoded packet
+        :return: a new :class:`ByteBuf` containing the encoded packet
         """
-        packet_cls = packet.__class__
-        packet_id: int | None = None
-        for registered_cls, pid in PacketRegistry._server_bound_packet_map.items():
-            if issubclass(packet_cls, registered_cls):
-                packet_id = pid
-                break
-        if packet_id is None:
-            raise CodecException(f"Unknown ClientBound packet class: {packet_cls.__name__}")
+        packet_id = PacketRegistry._resolve_packet_id(packet.__class__)
         buf = ByteBuf()
         buf.writeByte(packet_id)
         packet.encode(buf)
-        return buf.asReadOnly()
+        # The buffer is freshly allocated and owned by the caller, so no
+        # defensive read-only copy is needed.
+        return buf
+
+    @staticmethod
+    def encode_to_bytes(packet: ClientBoundPacket) -> bytes:
+        """Encode a client-bound packet into a complete length-prefixed frame.
+
+        The packet ID and body are written after a reserved header, the
+        VarInt length is then filled in directly in front of the body, and
+        the frame is returned as ``bytes`` with a single final copy. The
+        result can be written to the socket as-is.
+
+        :param packet: the packet to encode
+        :raises CodecException: if the packet class is not registered
+        :return: the length-prefixed frame
+        """
+        packet_id = PacketRegistry._resolve_packet_id(packet.__class__)
+        header_size = PacketRegistry._FRAME_HEADER_SIZE
+        buf = ByteBuf()
+        buf.buffer = bytearray(header_size)
+        buf.writeByte(packet_id)
+        packet.encode(buf)
+        storage = buf.buffer
+        length = len(storage) - header_size
+        start = header_size
+        # Write the VarInt backwards into the reserved header so that it ends
+        # right before the packet body.
+        prefix = bytearray()
+        while True:
+            temp = length & 0x7F
+            length >>= 7
+            if length:
+                prefix.append(temp | 0x80)
+            else:
+                prefix.append(temp)
+                break
+        start -= len(prefix)
+        storage[start:header_size] = prefix
+        return bytes(memoryview(storage)[start:])
+
+    @staticmethod
+    def _resolve_packet_id(packet_cls: type) -> int:
+        """Return the packet ID registered for ``packet_cls`` or one of its bases.
+
+        :raises CodecException: if the packet class is not registered
+        """
+        packet_id = PacketRegistry._resolved_packet_ids.get(packet_cls)
+        if packet_id is not None:
+            return packet_id
+        for registered_cls, pid in PacketRegistry._server_bound_packet_map.items():
+            if issubclass(packet_cls, registered_cls):
+                PacketRegistry._resolved_packet_ids[packet_cls] = pid
+                return pid
+        raise CodecException(f"Unknown ClientBound packet class: {packet_cls.__name__}")
 
 
 __all__ = ["PacketRegistry"]
\ No newline at end of file
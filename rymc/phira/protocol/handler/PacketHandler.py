@@ -4,10 +4,17 @@ When a server-bound packet is received, the network layer will invoke
 ``handle`` on the packet, passing in an implementation of ``PacketHandler``.
 The appropriate method corresponding to the packet type is then called.
 Implementers should override each method to provide custom logic.
+
+``PacketHandler.handle`` dispatches through a table mapping packet types to
+handler methods. The table is resolved once per handler class and bound
+once per handler instance; additional packet types can be added with
+:meth:`PacketHandler.register_packet_type`.
 """
 
 from __future__ import annotations
 
+from typing import Callable, Dict, Optional
+
 from ..packet.serverbound.ServerBoundAbortPacket import ServerBoundAbortPacket  # type: ignore circular import
 from ..packet.serverbound.ServerBoundAuthenticatePacket import ServerBoundAuthenticatePacket  # type: ignore circular import
 from ..packet.serverbound.ServerBoundCancelReadyPacket import ServerBoundCancelReadyPacket  # type: ignore circular import
@@ -29,47 +36,96 @@ from ..packet.serverbound.ServerBoundTouchesPacket import ServerBoundTouchesPack
 class PacketHandler:
     """Base class defining handlers for each server-bound packet type."""
 
+    # Mapping from packet type to the name of the handler method. Subclasses
+    # extend this through ``register_packet_type`` rather than editing it.
+    _packet_handler_names: Dict[type, str] = {
+        ServerBoundPingPacket: "handlePing",
+        ServerBoundAuthenticatePacket: "handleAuthenticate",
+        ServerBoundChatPacket: "handleChat",
+        ServerBoundTouchesPacket: "handleTouches",
+        ServerBoundJudgesPacket: "handleJudges",
+        ServerBoundCreateRoomPacket: "handleCreateRoom",
+        ServerBoundJoinRoomPacket: "handleJoinRoom",
+        ServerBoundLeaveRoomPacket: "handleLeaveRoom",
+        ServerBoundLockRoomPacket: "handleLockRoom",
+        ServerBoundCycleRoomPacket: "handleCycleRoom",
+        ServerBoundSelectChartPacket: "handleSelectChart",
+        ServerBoundRequestStartPacket: "handleRequestStart",
+        ServerBoundReadyPacket: "handleReady",
+        ServerBoundCancelReadyPacket: "handleCancelReady",
+        ServerBoundPlayedPacket: "handlePlayed",
+        ServerBoundAbortPacket: "handleAbort",
+    }
+
+    # Bumped on every registration so cached tables are rebuilt lazily.
+    _dispatch_generation: int = 0
+
+    # Per-instance table of packet type to bound method, bound on first use.
+    _dispatch_table: Optional[Dict[type, Callable]] = None
+    _dispatch_table_generation: int = -1
+
+    @classmethod
+    def register_packet_type(cls, packet_cls: type, method_name: str) -> None:
+        """Route packets of ``packet_cls`` to ``method_name`` on this handler class.
+
+        Registrations are inherited by subclasses. Registering on
+        ``PacketHandler`` itself makes the packet type available to every
+        handler. Handlers that are already bound pick up newly registered
+        types the first time such a packet is dispatched.
+        """
+        if "_packet_handler_names" not in cls.__dict__:
+            cls._packet_handler_names = {}
+        cls._packet_handler_names[packet_cls] = method_name
+        PacketHandler._dispatch_generation += 1
+
+    @classmethod
+    def _dispatch_names(cls) -> Dict[type, str]:
+        """Return the packet type to method name table for this class, built once."""
+        cached = cls.__dict__.get("_dispatch_name_cache")
+        if cached is not None and cached[0] == PacketHandler._dispatch_generation:
+            return cached[1]
+        names: Dict[type, str] = {}
+        for klass in reversed(cls.__mro__):
+            names.update(klass.__dict__.get("_packet_handler_names", {}))
+        cls._dispatch_name_cache = (PacketHandler._dispatch_generation, names)
+        return names
+
+    def _bind_dispatch(self) -> Dict[type, Callable]:
+        """Bind the class dispatch table to this instance."""
+        table = {packet_cls: getattr(self, name) for packet_cls, name in self._dispatch_names().items()}
+        self._dispatch_table = table
+        self._dispatch_table_generation = PacketHandler._dispatch_generation
+        return table
+
+    def _resolve_dispatch(self, packet_cls: type) -> Optional[Callable]:
+        """Find the handler for a packet type not yet in the table and cache it."""
+        if self._dispatch_table_generation != PacketHandler._dispatch_generation:
+            method = self._bind_dispatch().get(packet_cls)
+            if method is not None:
+                return method
+        for registered_cls, name in self._dispatch_names().items():
+            if issubclass(packet_cls, registered_cls):
+                method = getattr(self, name)
+                self._dispatch_table[packet_cls] = method
+                return method
+        return None
+
     def handle(self, packet):
         """
-        Generic entry point invoked by a server-bound packet. The packet
-        implementation will call this method, passing itself, so we can
-        dispatch onto the appropriate handler method by type.
+        Generic entry point invoked by the network layer. The packet is
+        dispatched onto the handler method registered for its type with a
+        single dictionary lookup.
         """
-        # Dispatch based on the packet's class
-        if isinstance(packet, ServerBoundPingPacket):
-            return self.handlePing(packet)
-        if isinstance(packet, ServerBoundAuthenticatePacket):
-            return self.handleAuthenticate(packet)
-        if isinstance(packet, ServerBoundChatPacket):
-            return self.handleChat(packet)
-        if isinstance(packet, ServerBoundTouchesPacket):
-            return self.handleTouches(packet)
-        if isinstance(packet, ServerBoundJudgesPacket):
-            return self.handleJudges(packet)
-        if isinstance(packet, ServerBoundCreateRoomPacket):
-            return self.handleCreateRoom(packet)
-        if isinstance(packet, ServerBoundJoinRoomPacket):
-            return self.handleJoinRoom(packet)
-        if isinstance(packet, ServerBoundLeaveRoomPacket):
-            return self.handleLeaveRoom(packet)
-        if isinstance(packet, ServerBoundLockRoomPacket):
-            return self.handleLockRoom(packet)
-        if isinstance(packet, ServerBoundCycleRoomPacket):
-            return self.handleCycleRoom(packet)
-        if isinstance(packet, ServerBoundSelectChartPacket):
-            return self.handleSelectChart(packet)
-        if isinstance(packet, ServerBoundRequestStartPacket):
-            return self.handleRequestStart(packet)
-        if isinstance(packet, ServerBoundReadyPacket):
-            return self.handleReady(packet)
-        if isinstance(packet, ServerBoundCancelReadyPacket):
-            return self.handleCancelReady(packet)
-        if isinstance(packet, ServerBoundPlayedPacket):
-            return self.handlePlayed(packet)
-        if isinstance(packet, ServerBoundAbortPacket):
-            return self.handleAbort(packet)
-        # Unknown packet: no-op by default
-        return None
+        table = self._dispatch_table
+        if table is None:
+            table = self._bind_dispatch()
+        method = table.get(packet.__class__)
+        if method is None:
+            method = self._resolve_dispatch(packet.__class__)
+            if method is None:
+                # Unknown packet: no-op by default
+                return None
+        return method(packet)
 
     # The methods below are intended to be overridden by subclasses.
     def handlePing(self, packet: ServerBoundPingPacket) -> None:
@@ -9,8 +9,7 @@ by subclasses as needed.
 
 from __future__ import annotations
 
-from connection import Connection
-from ..packet.clientbound.ClientBoundPongPacket import ClientBoundPongPacket
+from connection import Connection, PONG_FRAME
 from ..packet.serverbound import (
     ServerBoundPingPacket,
     ServerBoundAuthenticatePacket,
@@ -41,10 +40,12 @@ class SimplePacketHandler(PacketHandler):
         # networking contexts.
         self.connection = connection
 
-    # Override only the ping handler to automatically reply with a pong
+    # Override only the ping handler to automatically reply with a pong.
+    # ``Connection`` normally answers pings itself before decoding; this
+    # handler remains for packets dispatched through other paths.
     def handlePing(self, packet: ServerBoundPingPacket) -> None:
-        # Send back a singleton pong packet
-        self.connection.send(ClientBoundPongPacket.INSTANCE)
+        # Send back the pre-encoded pong frame
+        self.connection.send_encoded(PONG_FRAME)
 
     # The remaining handlers are provided as no-ops and can be overridden in
     # subclasses. They simply return without performing any action.
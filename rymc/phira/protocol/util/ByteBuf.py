@@ -23,6 +23,19 @@ class ByteBuf:
         # Marker for resetting the reader index (used by FrameDecoder)
         self._mark: Optional[int] = None
 
+    @classmethod
+    def wrap(cls, data) -> 'ByteBuf':
+        """Wrap an existing buffer (``bytes`` or ``memoryview``) for reading without copying.
+
+        The returned buffer shares memory with ``data`` and is intended for
+        decoding only; write operations are not supported on wrapped views.
+        """
+        buf = cls.__new__(cls)
+        buf.buffer = data
+        buf.reader_index = 0
+        buf._mark = None
+        return buf
+
     # === Read operations ===
     def isReadable(self, length: int = 1) -> bool:
         """Return True if at least ``length`` bytes are available to read."""
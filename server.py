@@ -1,4 +1,5 @@
 import asyncio
+import config
 from connection import Connection
 from asyncioutil import *
 import logging
@@ -7,6 +8,232 @@ logger = logging.getLogger(__name__)
 
 
 SUPPORTED_VERSIONS = [1]
+# 每次从 socket 读取的最大字节数
+READ_CHUNK_SIZE = 64 * 1024
+# 传输模式: "stream" 使用 StreamReader/StreamWriter，"buffered" 使用 BufferedProtocol
+TRANSPORT_MODE = config.get_value("transport", "stream")
+# buffered 模式下每个连接预分配的接收缓冲区大小
+RECV_BUFFER_SIZE = config.get_value("recv_buffer_size", 64 * 1024)
+VERSION_TIMEOUT = 10
+IDLE_TIMEOUT = 300
+
+
+class TransportWriter:
+    """把 asyncio.Transport 包装成 Connection 需要的 StreamWriter 接口。"""
+
+    def __init__(self, transport: asyncio.Transport, protocol: 'PhiraBufferedProtocol'):
+        self.transport = transport
+        self.protocol = protocol
+
+    def write(self, data):
+        self.transport.write(data)
+
+    def writelines(self, data):
+        self.transport.writelines(data)
+
+    async def drain(self):
+        if self.transport.is_closing():
+            # 与 StreamWriter 一致：让出一次事件循环
+            await asyncio.sleep(0)
+        await self.protocol.wait_writable()
+
+    def is_closing(self):
+        return self.transport.is_closing()
+
+    def close(self):
+        self.transport.close()
+
+    async def wait_closed(self):
+        await self.protocol.closed
+
+    def get_extra_info(self, name, default=None):
+        return self.transport.get_extra_info(name, default)
+
+
+class PhiraBufferedProtocol(asyncio.BufferedProtocol):
+    """基于 BufferedProtocol 的连接协议。
+
+    socket 数据直接接收进每个连接预分配的缓冲区，完整帧以 memoryview
+    的形式交给 ``Connection.on_receive``，解码时 ``ByteBuf.wrap`` 不再复制。
+    已消费的字节在每次回调结束后整体前移，帧超过缓冲区容量时扩容。
+    """
+
+    def __init__(self, server: 'Server'):
+        self.server = server
+        self.loop = asyncio.get_running_loop()
+        self.transport = None
+        self.connection = None
+        self.addr = None
+        self.buffer = bytearray(RECV_BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.read_pos = 0
+        self.write_pos = 0
+        self.last_receive = self.loop.time()
+        self.closed = self.loop.create_future()
+        self._writable = None
+        self._timer = None
+        self._accepted = False
+
+    # ---- 连接生命周期 ----
+    def connection_made(self, transport):
+        self.transport = transport
+        self.addr = transport.get_extra_info('peername')
+        if self.server.active_connections >= self.server.max_connections:
+            logger.warning(f"Connection limit reached, rejecting connection from {self.addr}")
+            transport.close()
+            return
+        self._accepted = True
+        self.server.active_connections += 1
+        logger.info(f"Connected client from {self.addr}, active connections: {self.server.active_connections}")
+        self._timer = self.loop.call_later(VERSION_TIMEOUT, self._on_version_timeout)
+
+    def connection_lost(self, exc):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._writable is not None and not self._writable.done():
+            self._writable.set_result(None)
+        if not self.closed.done():
+            self.closed.set_result(None)
+        if not self._accepted:
+            return
+        self._accepted = False
+        if self.connection is not None:
+            logger.info(f"Client disconnected from {self.addr}")
+            self.connection.close()
+        self.server.active_connections -= 1
+        logger.info(f"Client connection closed from {self.addr}, active connections: {self.server.active_connections}")
+
+    def eof_received(self):
+        # 返回 False 让传输层关闭连接
+        return False
+
+    # ---- 写入流控 ----
+    def pause_writing(self):
+        if self._writable is None or self._writable.done():
+            self._writable = self.loop.create_future()
+
+    def resume_writing(self):
+        if self._writable is not None and not self._writable.done():
+            self._writable.set_result(None)
+
+    async def wait_writable(self):
+        if self._writable is not None and not self._writable.done():
+            await self._writable
+
+    # ---- 超时 ----
+    def _on_version_timeout(self):
+        self._timer = None
+        if self.connection is None:
+            logger.warning(f"Timeout waiting for client version from {self.addr}")
+            self.transport.close()
+
+    def _on_idle_check(self):
+        idle = self.loop.time() - self.last_receive
+        if idle >= IDLE_TIMEOUT:
+            self._timer = None
+            logger.warning(f"Client {self.addr} timeout, closing connection")
+            self.transport.close()
+        else:
+            self._timer = self.loop.call_later(IDLE_TIMEOUT - idle, self._on_idle_check)
+
+    # ---- 读取 ----
+    def get_buffer(self, sizehint):
+        if self.write_pos == len(self.buffer):
+            self._grow(len(self.buffer) * 2)
+        return self.view[self.write_pos:]
+
+    def buffer_updated(self, nbytes):
+        self.write_pos += nbytes
+        self.last_receive = self.loop.time()
+        try:
+            if self.connection is None and not self._handshake():
+                return
+            self._dispatch_frames()
+        except Exception as e:
+            logger.error(f"Error handling client {self.addr}: {e}")
+            self.transport.close()
+
+    def _handshake(self) -> bool:
+        if self.read_pos >= self.write_pos:
+            return False
+        client_version = self.buffer[self.read_pos]
+        self.read_pos += 1
+        logger.info(f"Client version: {client_version} from {self.addr}")
+        if client_version not in SUPPORTED_VERSIONS:
+            logger.warning(f"Unsupported protocol version: {client_version} from {self.addr}")
+            self.transport.close()
+            return False
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self.loop.call_later(IDLE_TIMEOUT, self._on_idle_check)
+        self.connection = Connection(TransportWriter(self.transport, self))
+        self.server.handler(self.connection)
+        return True
+
+    def _dispatch_frames(self):
+        buf = self.buffer
+        view = self.view
+        pos = self.read_pos
+        end = self.write_pos
+        frames = []
+        grow_to = 0
+        while pos < end:
+            length = 0
+            shift = 0
+            cursor = pos
+            complete = False
+            while cursor < end:
+                value = buf[cursor]
+                cursor += 1
+                length |= (value & 0x7F) << shift
+                if (value & 0x80) == 0:
+                    complete = True
+                    break
+                shift += 7
+                if shift >= 35:
+                    raise ValueError("VarInt too big")
+            if not complete:
+                break
+            if length > MAX_FRAME_SIZE:
+                # 【新增】与 FrameDecoder 相同的上限，避免按客户端给出的长度分配超大缓冲区
+                raise ValueError(f"Frame too large: {length}")
+            if end - cursor < length:
+                # 帧不完整：确保缓冲区能容纳整帧
+                needed = cursor - pos + length
+                if needed > len(buf):
+                    grow_to = needed
+                break
+            frames.append(view[cursor:cursor + length])
+            pos = cursor + length
+        self.read_pos = pos
+        if frames:
+            # 这些 memoryview 只在本次回调内有效，处理完才整理缓冲区
+            self.connection.on_receive_batch(frames)
+        if grow_to:
+            self._grow(grow_to)
+        else:
+            self._compact()
+
+    def _compact(self):
+        if self.read_pos == self.write_pos:
+            self.read_pos = self.write_pos = 0
+        elif self.read_pos > 0 and len(self.buffer) - self.write_pos < len(self.buffer) // 4:
+            remaining = self.write_pos - self.read_pos
+            self.buffer[0:remaining] = self.buffer[self.read_pos:self.write_pos]
+            self.read_pos = 0
+            self.write_pos = remaining
+
+    def _grow(self, size: int):
+        # 已导出的 memoryview 会阻止 bytearray 原地扩容，所以分配新缓冲区
+        remaining = self.write_pos - self.read_pos
+        new_buffer = bytearray(max(size, remaining))
+        new_buffer[0:remaining] = self.buffer[self.read_pos:self.write_pos]
+        self.buffer = new_buffer
+        self.view = memoryview(new_buffer)
+        self.read_pos = 0
+        self.write_pos = remaining
+
 
 class Server:
 
@@ -17,6 +244,7 @@ class Server:
         self.active_connections = 0
         self.max_connections = 100  # 设置最大连接数
         self.connection_semaphore = asyncio.Semaphore(self.max_connections)
+        self.transport_mode = TRANSPORT_MODE
 
     async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         addr = writer.get_extra_info('peername')
@@ -36,7 +264,7 @@ class Server:
             try:
                 # 读取客户端版本
                 try:
-                    client_version = (await asyncio.wait_for(reader.readexactly(1), timeout=10))[0]
+                    client_version = (await asyncio.wait_for(reader.readexactly(1), timeout=VERSION_TIMEOUT))[0]
                     logger.info(f"Client version: {client_version} from {addr}")
                 except asyncio.TimeoutError:
                     logger.warning(f"Timeout waiting for client version from {addr}")
@@ -57,29 +285,47 @@ class Server:
 
                 connection = Connection(writer)
 
+                # 【修改】按块读取并一次解析出所有完整帧，避免逐字节 readexactly
+                decoder = FrameDecoder()
+
                 try:
                     self.handler(connection)
                     while True:
                         try:
-                            data = await asyncio.wait_for(receive_message(reader), timeout=300)  # 5分钟超时
-                            connection.on_receive(data)
+                            chunk = await asyncio.wait_for(reader.read(READ_CHUNK_SIZE), timeout=IDLE_TIMEOUT)  # 5分钟超时
                         except asyncio.TimeoutError:
                             logger.warning(f"Client {addr} timeout, closing connection")
                             break
+                        if not chunk:
+                            logger.info(f"Client disconnected from {addr}")
+                            break
+                        frames = decoder.feed(chunk)
+                        if frames:
+                            connection.on_receive_batch(frames)
                 except (asyncio.IncompleteReadError, ConnectionResetError):
                     logger.info(f"Client disconnected from {addr}")
                 except Exception as e:
                     logger.error(f"Error handling client {addr}: {e}")
                 finally:
                     connection.close()
+                    # 【修改】等待关闭流程完成，退出时不留下未完成的 close_and_wait 任务
+                    await connection.wait_closed()
+            except asyncio.CancelledError:
+                # 【新增】服务器退出时取消连接任务。Python 3.11 的 start_server 回调对已取消的任务
+                # 调用 task.exception() 会抛出 CancelledError，所以这里正常结束任务
+                logger.info(f"Server shutting down, closed connection from {addr}")
             finally:
                 self.active_connections -= 1
                 logger.info(f"Client connection closed from {addr}, active connections: {self.active_connections}")
 
     async def start(self):
-        server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        if self.transport_mode == "buffered":
+            loop = asyncio.get_running_loop()
+            server = await loop.create_server(lambda: PhiraBufferedProtocol(self), self.host, self.port)
+        else:
+            server = await asyncio.start_server(self.handle_client, self.host, self.port)
         addrs = ', '.join(str(sock.getsockname()) for sock in server.sockets)
-        logger.info(f"Server listening on {addrs}, max connections: {self.max_connections}")
+        logger.info(f"Server listening on {addrs} ({self.transport_mode}), max connections: {self.max_connections}")
         async with server:
             await server.serve_forever()
             
\ No newline at end of file
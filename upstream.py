@@ -0,0 +1,269 @@
+"""上游（Phira API）调用的容错层：延迟直方图、熔断器和对冲请求。
+
+每个接口（me / chart / record）对应一个 UpstreamEndpoint：
+
+- 延迟直方图：固定区间计数，另保留最近若干次的耗时用于计算 p50/p95/p99；
+- 熔断器：连续失败达到阈值后打开，期间直接抛出 CircuitOpenError 而不再
+  等待超时；经过 ``reset_timeout`` 秒后进入半开状态，放行一个探测请求，
+  成功则关闭，失败则重新打开；
+- 对冲请求（可选）：请求耗时超过该接口的 p95 仍未返回时，再并行发出一个
+  相同的请求，取先成功的结果。只用于幂等的 GET 请求。
+
+统计通过 web 服务器的 ``/api/metrics`` 暴露。
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# 熔断：连续失败多少次后打开，打开多少秒后尝试半开
+BREAKER_FAILURE_THRESHOLD = config.get_value("upstream_breaker_threshold", 5)
+BREAKER_RESET_TIMEOUT = config.get_value("upstream_breaker_reset", 30)
+# 对冲请求：是否启用、至少需要多少个样本、最小对冲延迟（秒）
+HEDGING_ENABLED = config.get_value("upstream_hedging", False)
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.05
+
+# 延迟直方图区间上界（毫秒），最后一个区间为无穷大
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# 计算分位数时保留的最近样本数
+LATENCY_WINDOW = 512
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(IOError):
+    """熔断器处于打开状态，请求被直接拒绝。"""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"Circuit breaker for upstream '{endpoint}' is open, retry in {retry_in:.1f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class LatencyHistogram:
+    """固定区间延迟直方图，附带最近样本窗口用于分位数。"""
+
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS, window: int = LATENCY_WINDOW):
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * (len(buckets_ms) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        ms = seconds * 1000
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+        for index, bound in enumerate(self.buckets_ms):
+            if ms <= bound:
+                self.counts[index] += 1
+                return
+        self.counts[-1] += 1
+
+    def percentile(self, p: float):
+        """返回最近样本的第 p 百分位耗时（秒），没有样本时返回 None。"""
+        samples = sorted(self.recent)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def to_dict(self):
+        def ms(value):
+            return round(value * 1000, 1) if value is not None else None
+
+        labels = [f"<={bound}ms" for bound in self.buckets_ms] + [f">{self.buckets_ms[-1]}ms"]
+        return {
+            "count": self.count,
+            "avgMs": ms(self.total / self.count) if self.count else None,
+            "p50Ms": ms(self.percentile(50)),
+            "p95Ms": ms(self.percentile(95)),
+            "p99Ms": ms(self.percentile(99)),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class CircuitBreaker:
+    """按连续失败次数打开的熔断器。"""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """是否放行一个请求；半开状态下同一时间只放行一个探测请求。"""
+        if self.state == STATE_CLOSED:
+            return True
+        if self.state == STATE_OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = STATE_HALF_OPEN
+            self._probe_in_flight = False
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def retry_in(self) -> float:
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        self.state = STATE_CLOSED
+
+    def record_cancelled(self):
+        # 请求被取消，既不算成功也不算失败，只释放半开状态下的探测名额
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == STATE_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != STATE_OPEN:
+                self.times_opened += 1
+            self.state = STATE_OPEN
+            self.opened_at = time.monotonic()
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "consecutiveFailures": self.consecutive_failures,
+            "timesOpened": self.times_opened,
+            "retryInSeconds": round(self.retry_in(), 1) if self.state == STATE_OPEN else 0,
+        }
+
+
+class UpstreamEndpoint:
+    """一个上游接口的延迟统计、熔断器和计数器。"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.histogram = LatencyHistogram()
+        self.breaker = CircuitBreaker()
+        self.requests = 0
+        self.failures = 0
+        self.rejected = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.breaker.retry_in())
+        self.requests += 1
+
+    def _finish(self, start: float, error):
+        self.histogram.record(time.monotonic() - start)
+        if error is None:
+            self.breaker.record_success()
+        else:
+            self.failures += 1
+            was_open = self.breaker.state == STATE_OPEN
+            self.breaker.record_failure()
+            if not was_open and self.breaker.state == STATE_OPEN:
+                logger.warning(f"Circuit breaker for upstream '{self.name}' opened after "
+                               f"{self.breaker.consecutive_failures} consecutive failures: {error!r}")
+
+    def hedge_delay(self):
+        """对冲延迟：该接口最近的 p95，样本不足时返回 None（不对冲）。"""
+        if len(self.histogram.recent) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY, self.histogram.percentile(95))
+
+    async def call(self, request, hedge: bool = None):
+        """执行一次异步请求。
+
+        :param request: 无参数的协程函数，每次调用发出一次请求
+        :param hedge: 是否允许对冲，默认取 upstream_hedging 配置
+        """
+        self._admit()
+        start = time.monotonic()
+        try:
+            delay = self.hedge_delay() if (HEDGING_ENABLED if hedge is None else hedge) else None
+            if delay is None:
+                result = await request()
+            else:
+                result = await self._hedged(request, delay)
+        except asyncio.CancelledError:
+            self.breaker.record_cancelled()
+            raise
+        except Exception as e:
+            self._finish(start, e)
+            raise
+        self._finish(start, None)
+        return result
+
+    async def _hedged(self, request, delay: float):
+        primary = asyncio.ensure_future(request())
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                # 超过 p95 仍未返回，发出对冲请求
+                self.hedged += 1
+                tasks.add(asyncio.ensure_future(request()))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "hedged": self.hedged,
+            "hedgeWins": self.hedge_wins,
+            "breaker": self.breaker.to_dict(),
+            "latency": self.histogram.to_dict(),
+        }
+
+
+# 接口名 -> UpstreamEndpoint
+endpoints = {}
+
+
+def get_endpoint(name: str) -> UpstreamEndpoint:
+    endpoint = endpoints.get(name)
+    if endpoint is None:
+        endpoint = endpoints[name] = UpstreamEndpoint(name)
+    return endpoint
+
+
+def endpoint_name(path: str) -> str:
+    """把请求路径归并为接口名，例如 ``/chart/123`` -> ``chart``。"""
+    path = path.strip("/")
+    return path.split("/", 1)[0] or "/"
+
+
+def get_metrics():
+    """获取所有上游接口的统计"""
+    return {
+        "hedging": HEDGING_ENABLED,
+        "endpoints": {name: endpoint.to_dict() for name, endpoint in list(endpoints.items())},
+    }
@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 
+import asyncio
+import hashlib
 import json
-import threading
+import logging
 import os
-import socket
-from urllib.parse import urlparse, parse_qs
+import threading
+from urllib.parse import urlparse, parse_qs, unquote
 
-from room import get_all_rooms, get_room_detail
+import config
+from room import get_all_rooms, get_room_detail, get_room_snapshot, add_room_listener, publish_snapshot, call_in_room_loop
+from player_index import find_players
+from room_search import room_search_index
+import upstream
 
 # 导入外部API客户端
 try:
@@ -18,7 +24,30 @@ except ImportError:
 # 获取当前文件的绝对路径
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-WEB_PORT = 8081
+logger = logging.getLogger(__name__)
+
+WEB_PORT = config.get_value("web_port", 8081)
+# 【新增】同时保持的最大 HTTP 连接数，超过后直接返回 503
+WEB_MAX_CONNECTIONS = config.get_value("web_max_connections", 512)
+# keep-alive 连接的空闲超时（秒）
+WEB_KEEPALIVE_TIMEOUT = 15
+# 请求头、请求体大小上限
+MAX_HEADER_SIZE = 16 * 1024
+MAX_BODY_SIZE = 64 * 1024
+# 【新增】房间事件流的心跳间隔（秒），以及单个订阅者允许积压的最大字节数，超过后断开（客户端会重连并拿到新快照）
+FEED_HEARTBEAT = 15
+FEED_MAX_BACKLOG = config.get_value("web_feed_max_backlog", 256 * 1024)
+
+HTTP_REASONS = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
 
 # 全局跨服务器管理器
 inter_server_manager = None
@@ -28,6 +57,14 @@ EXTERNAL_API_URLS = [
     ""
 ]
 
+def get_external_room_lists():
+    """外部服务器的房间列表，每个地址一个 list；刷新前返回的是同一个 list 对象"""
+    if not external_api_available:
+        return []
+    api_client = external_api_client.get_external_api_client()
+    # 【修改】读取后台刷新的缓存（stale-while-revalidate），不阻塞请求
+    return [api_client.get_cached_rooms(api_url) for api_url in EXTERNAL_API_URLS if api_url]
+
 def get_all_rooms_with_inter_server():
     """获取所有互联服务器的房间信息"""
     global inter_server_manager
@@ -41,11 +78,8 @@ def get_all_rooms_with_inter_server():
         rooms = local_rooms_result.get('rooms', [])
     
     # 获取外部服务器的房间
-    if external_api_available:
-        api_client = external_api_client.get_external_api_client()
-        for api_url in EXTERNAL_API_URLS:
-            external_rooms = api_client.get_rooms_from_api(api_url)
-            rooms.extend(external_rooms)
+    for external_rooms in get_external_room_lists():
+        rooms.extend(external_rooms)
     
     return {
         "status": "0",
@@ -66,185 +100,367 @@ def set_inter_server_manager(manager):
     global inter_server_manager
     inter_server_manager = manager
 
-def handle_request(client_socket):
-    try:
-        # 接收请求数据
-        request_data = client_socket.recv(1024).decode('utf-8')
-        if not request_data:
+def search_rooms(search_params):
+    """按条件筛选本地房间
+    【修改】通过 room_search_index 查询，只接触符合条件的房间，并支持排序和游标分页；
+    参数不合法时抛出 ValueError"""
+    return call_in_room_loop(_search_rooms, search_params)
+
+def _search_rooms(search_params):
+    # 【修改】索引随修改立即更新，快照按批发布：先发布尚未写入快照的修改，
+    # 让 total 和本页房间都来自同一组房间
+    views = publish_snapshot().views
+    page, total, next_cursor = room_search_index.search(search_params)
+    filtered_rooms = [views[roomId].summary for roomId in page]
+    return {"status": "0", "rooms": filtered_rooms, "total": total, "nextCursor": next_cursor}
+
+class StaticFile:
+    """缓存在内存中的静态文件，文件修改后自动重新读取"""
+    
+    def __init__(self, path, content_type):
+        self.path = path
+        self.content_type = content_type
+        self.mtime = None
+        self.data = None
+    
+    def get(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+        if mtime != self.mtime:
+            with open(self.path, 'rb') as f:
+                self.data = f.read()
+            self.mtime = mtime
+        return self.data
+
+index_file = StaticFile(os.path.join(CURRENT_DIR, 'index.html'), 'text/html; charset=utf-8')
+
+# 当前打开的 HTTP 连接数
+active_connections = 0
+
+class RoomEventFeed:
+    """房间列表事件流（Server-Sent Events，``GET /api/rooms/events``）。
+
+    新连接先收到一条 ``snapshot`` 事件（与 ``/api/rooms`` 相同的 JSON），之后只收到
+    room.py 发出的增量事件：create / destroy / join / leave / update。
+    同一轮事件循环内的事件只编码一次，拼接后对所有订阅者各写一次。
+    admin 线程中发生的变更通过 ``call_soon_threadsafe`` 转到事件循环中发送。
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.pending = []
+        self.loop = None
+        self.loop_thread = None
+        self._flush_scheduled = False
+        self.events = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+
+    def attach(self, loop):
+        if self.loop is not None:
             return
-        
-        # 解析请求
-        lines = request_data.split('\r\n')
-        request_line = lines[0]
-        method, path, protocol = request_line.split(' ')
-        
-        # 解析路径
-        parsed_url = urlparse(path)
-        path = parsed_url.path
-        
-        # 处理请求
-        if method == 'GET':
-            if path == '/api/rooms':
-                # 处理获取所有房间请求
-                result = get_all_rooms_with_inter_server()
-                response = f'HTTP/1.1 200 OK\r\n'
-                response += f'Content-Type: application/json\r\n'
-                response += f'Access-Control-Allow-Origin: *\r\n'
-                response += f'Content-Length: {len(json.dumps(result))}\r\n'
-                response += '\r\n'
-                response += json.dumps(result)
-                client_socket.sendall(response.encode('utf-8'))
-            elif path.startswith('/api/room/'):
-                # 处理获取房间详情请求
-                room_id = path.split('/')[-1]
-                result = get_room_detail_with_inter_server(room_id)
-                response = f'HTTP/1.1 200 OK\r\n'
-                response += f'Content-Type: application/json\r\n'
-                response += f'Access-Control-Allow-Origin: *\r\n'
-                response += f'Content-Length: {len(json.dumps(result))}\r\n'
-                response += '\r\n'
-                response += json.dumps(result)
-                client_socket.sendall(response.encode('utf-8'))
-            elif path == '/' or path == '/index.html':
-                # 处理首页请求
-                index_path = os.path.join(CURRENT_DIR, 'index.html')
-                if os.path.exists(index_path):
-                    with open(index_path, 'r', encoding='utf-8') as f:
-                        html_content = f.read()
-                    response = f'HTTP/1.1 200 OK\r\n'
-                    response += f'Content-Type: text/html\r\n'
-                    response += f'Content-Length: {len(html_content.encode("utf-8"))}\r\n'
-                    response += '\r\n'
-                    response += html_content
-                    client_socket.sendall(response.encode('utf-8'))
-                else:
-                    response = 'HTTP/1.1 404 Not Found\r\n'
-                    response += 'Content-Type: text/plain\r\n'
-                    response += 'Content-Length: 9\r\n'
-                    response += '\r\n'
-                    response += 'Not Found'
-                    client_socket.sendall(response.encode('utf-8'))
-            else:
-                # 处理其他请求
-                response = 'HTTP/1.1 404 Not Found\r\n'
-                response += 'Content-Type: text/plain\r\n'
-                response += 'Content-Length: 9\r\n'
-                response += '\r\n'
-                response += 'Not Found'
-                client_socket.sendall(response.encode('utf-8'))
-        elif method == 'POST':
-            if path == '/api/rooms/search':
-                # 处理搜索房间请求
-                # 解析请求体
-                content_length = 0
-                for line in lines:
-                    if line.startswith('Content-Length:'):
-                        content_length = int(line.split(':')[1].strip())
-                        break
-                
-                if content_length > 0:
-                    body = request_data.split('\r\n\r\n')[1]
-                    while len(body) < content_length:
-                        body += client_socket.recv(1024).decode('utf-8')
-                    
-                    search_params = json.loads(body)
-                    all_rooms = get_all_rooms()['rooms']
-                    filtered_rooms = all_rooms
-                    
-                    if 'roomId' in search_params and search_params['roomId']:
-                        filtered_rooms = [room for room in filtered_rooms if search_params['roomId'] in room['roomId']]
-                    
-                    if 'state' in search_params and search_params['state']:
-                        filtered_rooms = [room for room in filtered_rooms if room['state'] == search_params['state']]
-                    
-                    if 'locked' in search_params:
-                        filtered_rooms = [room for room in filtered_rooms if room['locked'] == search_params['locked']]
-                    
-                    if 'live' in search_params:
-                        filtered_rooms = [room for room in filtered_rooms if room['live'] == search_params['live']]
-                    
-                    if 'minUsers' in search_params:
-                        filtered_rooms = [room for room in filtered_rooms if room['userCount'] >= search_params['minUsers']]
-                    
-                    if 'maxUsers' in search_params:
-                        filtered_rooms = [room for room in filtered_rooms if room['userCount'] <= search_params['maxUsers']]
-                    
-                    result = {"status": "0", "rooms": filtered_rooms}
-                    response = f'HTTP/1.1 200 OK\r\n'
-                    response += f'Content-Type: application/json\r\n'
-                    response += f'Access-Control-Allow-Origin: *\r\n'
-                    response += f'Content-Length: {len(json.dumps(result))}\r\n'
-                    response += '\r\n'
-                    response += json.dumps(result)
-                    client_socket.sendall(response.encode('utf-8'))
-                else:
-                    response = 'HTTP/1.1 400 Bad Request\r\n'
-                    response += 'Content-Type: text/plain\r\n'
-                    response += 'Content-Length: 11\r\n'
-                    response += '\r\n'
-                    response += 'Bad Request'
-                    client_socket.sendall(response.encode('utf-8'))
-            else:
-                # 处理其他POST请求
-                response = 'HTTP/1.1 404 Not Found\r\n'
-                response += 'Content-Type: text/plain\r\n'
-                response += 'Content-Length: 9\r\n'
-                response += '\r\n'
-                response += 'Not Found'
-                client_socket.sendall(response.encode('utf-8'))
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        add_room_listener(self.on_room_event)
+
+    def on_room_event(self, event, roomId, fields):
+        if not self.subscribers:
+            return
+        payload = {"roomId": roomId}
+        payload.update(fields)
+        message = f'event: {event}\ndata: {json.dumps(payload)}\n\n'.encode('utf-8')
+        if threading.get_ident() == self.loop_thread:
+            self._enqueue(message)
         else:
-            # 处理其他HTTP方法
-            response = 'HTTP/1.1 405 Method Not Allowed\r\n'
-            response += 'Content-Type: text/plain\r\n'
-            response += 'Content-Length: 18\r\n'
-            response += '\r\n'
-            response += 'Method Not Allowed'
-            client_socket.sendall(response.encode('utf-8'))
-    except Exception as e:
-        print(f"Error handling request: {str(e)}")
-        response = 'HTTP/1.1 500 Internal Server Error\r\n'
-        response += 'Content-Type: text/plain\r\n'
-        response += 'Content-Length: 21\r\n'
-        response += '\r\n'
-        response += 'Internal Server Error'
+            self.loop.call_soon_threadsafe(self._enqueue, message)
+
+    def _enqueue(self, message):
+        self.pending.append(message)
+        self.events += 1
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.loop.call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if not self.pending:
+            return
+        data = b''.join(self.pending)
+        self.pending.clear()
+        for writer in list(self.subscribers):
+            if writer.transport.get_write_buffer_size() > FEED_MAX_BACKLOG:
+                # 慢客户端：断开，避免无限积压
+                self.subscribers.discard(writer)
+                self.dropped += 1
+                writer.close()
+                continue
+            writer.write(data)
+            self.bytes_sent += len(data)
+
+    async def serve(self, reader, writer):
+        head = (
+            'HTTP/1.1 200 OK\r\n'
+            'Content-Type: text/event-stream; charset=utf-8\r\n'
+            'Cache-Control: no-cache\r\n'
+            'Access-Control-Allow-Origin: *\r\n'
+            'Connection: keep-alive\r\n'
+            '\r\n'
+        ).encode('latin-1')
+        # 先发出已排队的事件并发布最新快照，使快照与之后的增量事件衔接
+        self._flush()
+        publish_snapshot()
+        if inter_server_manager:
+            snapshot = json.dumps(get_all_rooms_with_inter_server()).encode('utf-8')
+        else:
+            snapshot, _ = room_list_cache.get()
+        data = head + b'retry: 3000\nevent: snapshot\ndata: ' + snapshot + b'\n\n'
+        writer.write(data)
+        self.bytes_sent += len(data)
+        self.subscribers.add(writer)
         try:
-            client_socket.sendall(response.encode('utf-8'))
-        except:
-            pass
-    finally:
-        # 关闭连接
-        client_socket.close()
+            while True:
+                try:
+                    # 客户端不会再发送数据，读到 EOF 说明连接已关闭
+                    if not await asyncio.wait_for(reader.read(1024), FEED_HEARTBEAT):
+                        break
+                except asyncio.TimeoutError:
+                    writer.write(b': ping\n\n')
+                    self.bytes_sent += 8
+                    await writer.drain()
+        finally:
+            self.subscribers.discard(writer)
 
-def start_web_server():
+    def get_stats(self):
+        return {
+            "subscribers": len(self.subscribers),
+            "events": self.events,
+            "bytesSent": self.bytes_sent,
+            "dropped": self.dropped,
+        }
+
+room_feed = RoomEventFeed()
+
+def make_etag(body):
+    """根据响应内容生成强 ETag"""
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+class RoomListCache:
+    """``/api/rooms`` 响应体缓存。
+
+    本地房间直接拼接各 RoomView 缓存的 JSON 片段；房间快照版本和外部房间列表
+    都没变时直接复用上次拼好的 bytes 和 ETag。"""
+
+    def __init__(self):
+        self.version = None
+        self.external = []
+        self.body = None
+        self.etag = None
+        self.hits = 0
+        self.builds = 0
+
+    def get(self):
+        """返回 (响应体 bytes, ETag)"""
+        snapshot = get_room_snapshot()
+        external = get_external_room_lists()
+        if (self.body is not None and self.version == snapshot.version
+                and len(external) == len(self.external)
+                and all(a is b for a, b in zip(external, self.external))):
+            self.hits += 1
+            return self.body, self.etag
+        parts = [view.summary_json() for view in snapshot.views.values()]
+        for external_rooms in external:
+            parts.extend(json.dumps(r).encode('utf-8') for r in external_rooms)
+        body = b'{"status": "0", "rooms": [' + b', '.join(parts) + b']}'
+        # 引用外部列表本身，避免对象被回收后 id 复用
+        self.version = snapshot.version
+        self.external = external
+        self.body = body
+        self.etag = make_etag(body)
+        self.builds += 1
+        return self.body, self.etag
+
+    def get_stats(self):
+        return {"hits": self.hits, "builds": self.builds, "bytes": len(self.body or b'')}
+
+room_list_cache = RoomListCache()
+
+def json_response(result):
+    return 200, 'application/json', json.dumps(result).encode('utf-8'), None
+
+def text_response(status):
+    return status, 'text/plain', HTTP_REASONS[status].encode('utf-8'), None
+
+def cached_json_response(body, etag, headers):
+    """带 ETag 的 JSON 响应；If-None-Match 命中时返回无响应体的 304"""
+    if_none_match = headers.get('if-none-match')
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        if '*' in tags or etag in tags or 'W/' + etag in tags:
+            return 304, None, b'', etag
+    return 200, 'application/json', body, etag
+
+def rooms_response(headers):
+    if inter_server_manager:
+        return json_response(get_all_rooms_with_inter_server())
+    return cached_json_response(*room_list_cache.get(), headers)
+
+def room_detail_response(room_id, headers):
+    if inter_server_manager:
+        return json_response(get_room_detail_with_inter_server(room_id))
+    view = get_room_snapshot().views.get(room_id)
+    if view is None:
+        return json_response({"status": "1"})
+    body = b'{"status": "0", "room": ' + view.detail_json() + b'}'
+    return cached_json_response(body, make_etag(body), headers)
+
+def route(method, path, query, body, headers):
+    """根据请求方法和路径生成响应，返回 (状态码, Content-Type, 响应体 bytes, ETag)"""
+    if method == 'GET':
+        if path == '/api/rooms':
+            # 处理获取所有房间请求（【修改】使用缓存的响应体，支持 If-None-Match）
+            return rooms_response(headers)
+        elif path.startswith('/api/room/'):
+            # 处理获取房间详情请求
+            room_id = unquote(path.split('/')[-1])
+            return room_detail_response(room_id, headers)
+        elif path == '/api/players':
+            # 【新增】按名字前缀查找在线玩家及其所在房间
+            try:
+                return json_response(find_players(query))
+            except ValueError:
+                return text_response(400)
+        elif path == '/api/metrics':
+            # 处理上游（Phira API）统计请求：熔断器状态和延迟分位数
+            return json_response({"status": "0", "upstream": upstream.get_metrics(),
+                                  "roomFeed": room_feed.get_stats(),
+                                  "roomListCache": room_list_cache.get_stats()})
+        elif path == '/' or path == '/index.html':
+            # 处理首页请求（内存缓存，不再每次读盘）
+            data = index_file.get()
+            if data is None:
+                return text_response(404)
+            return 200, index_file.content_type, data, None
+        return text_response(404)
+    elif method == 'POST':
+        if path == '/api/rooms/search':
+            # 处理搜索房间请求
+            if not body:
+                return text_response(400)
+            try:
+                search_params = json.loads(body)
+            except ValueError:
+                return text_response(400)
+            if not isinstance(search_params, dict):
+                return text_response(400)
+            try:
+                return json_response(search_rooms(search_params))
+            except ValueError:
+                return text_response(400)
+        return text_response(404)
+    return text_response(405)
+
+def build_response(status, content_type, body, etag, keep_alive):
+    head = f'HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n'
+    if status != 304:
+        head += f'Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n'
+    if etag is not None:
+        # 要求浏览器每次都带 If-None-Match 重新验证
+        head += f'ETag: {etag}\r\nCache-Control: no-cache\r\n'
+    head += (
+        f'Access-Control-Allow-Origin: *\r\n'
+        f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+        '\r\n'
+    )
+    return head.encode('latin-1') + body
+
+async def read_request(reader):
+    """读取一个请求，返回 (方法, 路径, 查询字符串, 请求头, 是否保持连接, 请求体)；连接关闭时返回 None"""
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), WEB_KEEPALIVE_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise ValueError("Request header too large")
+    lines = head.decode('latin-1').split('\r\n')
+    method, target, version = lines[0].split(' ')
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    
+    connection_header = headers.get('connection', '').lower()
+    if version == 'HTTP/1.1':
+        keep_alive = connection_header != 'close'
+    else:
+        keep_alive = connection_header == 'keep-alive'
+    
+    body = b''
+    content_length = int(headers.get('content-length', 0) or 0)
+    if content_length > MAX_BODY_SIZE:
+        raise OverflowError("Request body too large")
+    if content_length > 0:
+        # 【修改】按 Content-Length 完整读取请求体，不再只读一次 recv(1024)
+        body = await asyncio.wait_for(reader.readexactly(content_length), WEB_KEEPALIVE_TIMEOUT)
+    url = urlparse(target)
+    return method, url.path, url.query, headers, keep_alive, body
+
+async def handle_http_client(reader, writer):
+    global active_connections
+    if active_connections >= WEB_MAX_CONNECTIONS:
+        writer.write(build_response(*text_response(503), keep_alive=False))
+        writer.close()
+        return
+    active_connections += 1
     try:
-        # 创建TCP套接字
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        
-        # 绑定地址和端口
-        print(f"Attempting to bind web server to port {WEB_PORT}...")
-        server_socket.bind(('', WEB_PORT))
-        server_socket.listen(5)
-        
-        print(f"Web server started at http://localhost:{WEB_PORT}")
-        
-        # 处理请求
         while True:
-            client_socket, client_address = server_socket.accept()
-            print(f"Received connection from {client_address}")
-            # 创建线程处理请求
-            client_thread = threading.Thread(target=handle_request, args=(client_socket,))
-            client_thread.daemon = True
-            client_thread.start()
-    except Exception as e:
-        print(f"Error starting web server: {str(e)}")
-        import traceback
-        traceback.print_exc()
-
-def start_web_server_thread():
-    web_thread = threading.Thread(target=start_web_server, daemon=True)
-    web_thread.start()
-    return web_thread
+            try:
+                request = await read_request(reader)
+            except OverflowError:
+                writer.write(build_response(*text_response(413), keep_alive=False))
+                break
+            except (ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                writer.write(build_response(*text_response(400), keep_alive=False))
+                break
+            if request is None:
+                break
+            method, path, query, headers, keep_alive, body = request
+            if method == 'GET' and path == '/api/rooms/events':
+                # 【新增】房间事件流：此后该连接只用于推送
+                await room_feed.serve(reader, writer)
+                break
+            try:
+                status, content_type, response_body, etag = route(method, path, query, body, headers)
+            except Exception as e:
+                logger.error(f"Error handling request {method} {path}: {e}")
+                status, content_type, response_body, etag = text_response(500)
+            writer.write(build_response(status, content_type, response_body, etag, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        active_connections -= 1
+        writer.close()
+
+async def start_web_server(host='', port=None):
+    """在当前事件循环中启动 web 服务器，返回 asyncio.Server"""
+    # 【新增】启动外部房间列表的后台刷新
+    if external_api_available:
+        external_api_client.get_external_api_client().start_refresher(EXTERNAL_API_URLS)
+    room_feed.attach(asyncio.get_running_loop())
+    server = await asyncio.start_server(handle_http_client, host or None, port or WEB_PORT,
+                                        limit=MAX_HEADER_SIZE)
+    logger.info(f"Web server started at http://localhost:{port or WEB_PORT}")
+    return server
+
+async def serve_forever():
+    server = await start_web_server()
+    async with server:
+        await server.serve_forever()
 
 if __name__ == '__main__':
-    start_web_server()
+    asyncio.run(serve_forever())